@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import multiprocessing
 import os
 import sys
 from collections.abc import Mapping
@@ -33,8 +34,20 @@ def build_server_config(env: Mapping[str, str]) -> ServerConfig:
     }
 
 
+def build_cache_env(env: Mapping[str, str]) -> dict[str, str]:
+    if env.get("OMML_CACHE_PATH"):
+        return {}
+    if env.get("DESKTOP_OMML_CACHE", "1") == "0":
+        return {}
+    export_db_path = env.get("EXPORT_DB_PATH")
+    if not export_db_path:
+        return {}
+    return {"OMML_CACHE_PATH": str(Path(export_db_path).parent / "omml_cache.db")}
+
+
 def run() -> None:
     ensure_local_import_paths()
+    os.environ.update(build_cache_env(os.environ))
     from apps.api.main import app
 
     server_config = build_server_config(os.environ)
@@ -47,4 +60,6 @@ def run() -> None:
 
 
 if __name__ == "__main__":
+    # Required for process-pool workers in frozen (PyInstaller) builds.
+    multiprocessing.freeze_support()
     run()
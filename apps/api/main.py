@@ -1,39 +1,72 @@
 from __future__ import annotations
 
-import io
+import json
 import os
+import tempfile
+from collections.abc import Iterator
 from importlib import import_module
-from typing import Any, Callable
+from typing import IO, Any, Callable
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
 
 from .export_stats import get_export_stats, increment_export_count
-from .schemas import GenerateRequest, PreviewRequest
+from .schemas import ChaptersRequest, GenerateRequest, PresetsRequest, PreviewRequest
 
 _build_preview_payload: Callable[..., Any] | None = None
+_iter_preview_records: Callable[..., Any] | None = None
+_build_outline: Callable[..., Any] | None = None
 _build_docx: Callable[..., Any] | None = None
+_build_chapters_docx: Callable[..., Any] | None = None
+_write_variants_zip: Callable[..., Any] | None = None
 _build_format_config: Callable[..., Any] | None = None
+_build_export_options: Callable[..., Any] | None = None
+_get_template_store: Callable[..., Any] | None = None
+_get_image_cache: Callable[..., Any] | None = None
+_deadlines: Any = None
 
 
 def _ensure_formatter_loaded() -> None:
-    global _build_preview_payload, _build_docx, _build_format_config
+    global _build_preview_payload, _iter_preview_records, _build_outline, _build_docx, _build_chapters_docx
+    global _write_variants_zip, _build_format_config, _build_export_options, _get_template_store, _get_image_cache
+    global _deadlines
 
     if (
         _build_preview_payload is not None
+        and _iter_preview_records is not None
+        and _build_outline is not None
         and _build_docx is not None
+        and _build_chapters_docx is not None
+        and _write_variants_zip is not None
         and _build_format_config is not None
+        and _build_export_options is not None
+        and _get_template_store is not None
+        and _get_image_cache is not None
+        and _deadlines is not None
     ):
         return
 
     app_logic = import_module("formatter.app_logic")
+    outline = import_module("formatter.outline")
     docx_builder = import_module("formatter.docx_builder")
+    chapters = import_module("formatter.chapters")
+    variants = import_module("formatter.variants")
     ui_config = import_module("formatter.ui_config")
+    template_store = import_module("formatter.template_store")
+    image_cache = import_module("formatter.image_cache")
+    _deadlines = import_module("formatter.deadlines")
 
     _build_preview_payload = getattr(app_logic, "build_preview_payload")
+    _iter_preview_records = getattr(app_logic, "iter_preview_records")
+    _build_outline = getattr(outline, "build_outline")
     _build_docx = getattr(docx_builder, "build_docx")
+    _build_chapters_docx = getattr(chapters, "build_chapters_docx")
+    _write_variants_zip = getattr(variants, "write_variants_zip")
     _build_format_config = getattr(ui_config, "build_format_config")
+    _build_export_options = getattr(ui_config, "build_export_options")
+    _get_template_store = getattr(template_store, "get_template_store")
+    _get_image_cache = getattr(image_cache, "get_image_cache")
 
 
 def build_preview_payload(*args: Any, **kwargs: Any) -> Any:
@@ -43,6 +76,20 @@ def build_preview_payload(*args: Any, **kwargs: Any) -> Any:
     return _build_preview_payload(*args, **kwargs)
 
 
+def iter_preview_records(*args: Any, **kwargs: Any) -> Any:
+    _ensure_formatter_loaded()
+    if _iter_preview_records is None:
+        raise RuntimeError("formatter.app_logic.iter_preview_records is unavailable")
+    return _iter_preview_records(*args, **kwargs)
+
+
+def build_outline(*args: Any, **kwargs: Any) -> Any:
+    _ensure_formatter_loaded()
+    if _build_outline is None:
+        raise RuntimeError("formatter.outline.build_outline is unavailable")
+    return _build_outline(*args, **kwargs)
+
+
 def build_docx(*args: Any, **kwargs: Any) -> Any:
     _ensure_formatter_loaded()
     if _build_docx is None:
@@ -50,12 +97,69 @@ def build_docx(*args: Any, **kwargs: Any) -> Any:
     return _build_docx(*args, **kwargs)
 
 
+def build_chapters_docx(*args: Any, **kwargs: Any) -> Any:
+    _ensure_formatter_loaded()
+    if _build_chapters_docx is None:
+        raise RuntimeError("formatter.chapters.build_chapters_docx is unavailable")
+    return _build_chapters_docx(*args, **kwargs)
+
+
+def write_variants_zip(*args: Any, **kwargs: Any) -> Any:
+    _ensure_formatter_loaded()
+    if _write_variants_zip is None:
+        raise RuntimeError("formatter.variants.write_variants_zip is unavailable")
+    return _write_variants_zip(*args, **kwargs)
+
+
 def build_format_config(*args: Any, **kwargs: Any) -> Any:
     _ensure_formatter_loaded()
     if _build_format_config is None:
         raise RuntimeError("formatter.ui_config.build_format_config is unavailable")
     return _build_format_config(*args, **kwargs)
 
+
+def build_export_options(*args: Any, **kwargs: Any) -> Any:
+    _ensure_formatter_loaded()
+    if _build_export_options is None:
+        raise RuntimeError("formatter.ui_config.build_export_options is unavailable")
+    return _build_export_options(*args, **kwargs)
+
+
+def get_template_store(*args: Any, **kwargs: Any) -> Any:
+    _ensure_formatter_loaded()
+    if _get_template_store is None:
+        raise RuntimeError("formatter.template_store.get_template_store is unavailable")
+    return _get_template_store(*args, **kwargs)
+
+
+def get_image_cache(*args: Any, **kwargs: Any) -> Any:
+    _ensure_formatter_loaded()
+    if _get_image_cache is None:
+        raise RuntimeError("formatter.image_cache.get_image_cache is unavailable")
+    return _get_image_cache(*args, **kwargs)
+
+
+def stage_watchdog_kwargs() -> dict[str, Any]:
+    _ensure_formatter_loaded()
+    budgets = _deadlines.StageBudgets.from_env(os.environ)
+    if budgets.is_empty():
+        return {}
+    return {"watchdog": _deadlines.StageWatchdog(budgets)}
+
+
+# Exports are built in memory up to this size, then spill to a temporary file.
+EXPORT_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+EXPORT_CHUNK_SIZE = 256 * 1024
+
+
+def _iter_file(stream: IO[bytes], chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    try:
+        while chunk := stream.read(chunk_size):
+            yield chunk
+    finally:
+        stream.close()
+
+
 app = FastAPI()
 
 default_allowed_origins = [
@@ -92,39 +196,189 @@ async def preview(payload: PreviewRequest) -> dict[str, object]:
         payload.markdown,
         bibliography_style=payload.bibliography.style,
         bibliography_sources=payload.bibliography.sources_text,
+        **stage_watchdog_kwargs(),
     )
 
 
-@app.post("/api/generate")
-async def generate(payload: GenerateRequest) -> Response:
-    preview_payload = build_preview_payload(
+@app.post("/api/preview/stream")
+async def preview_stream(payload: PreviewRequest) -> StreamingResponse:
+    records = iter_preview_records(
         payload.markdown,
         bibliography_style=payload.bibliography.style,
         bibliography_sources=payload.bibliography.sources_text,
+        **stage_watchdog_kwargs(),
+    )
+    return StreamingResponse(
+        (json.dumps(record, ensure_ascii=False) + "\n" for record in records),
+        media_type="application/x-ndjson",
     )
 
+
+@app.post("/api/preview/outline")
+async def preview_outline(payload: PreviewRequest) -> dict[str, object]:
+    return build_outline(payload.markdown)
+
+
+def _export_settings(payload: GenerateRequest | ChaptersRequest) -> tuple[Any, Any]:
     try:
         if isinstance(payload.config, dict):
             config_dict = dict(payload.config)
         else:
             config_dict = payload.config.model_dump()
         format_config = build_format_config(**config_dict)
+        export_options = build_export_options(**payload.options.model_dump())
     except Exception as exc:  # defensive: surface config issues as 422
         raise HTTPException(status_code=422, detail=str(exc)) from exc
+    _check_template(payload.options.template_id)
+    return format_config, export_options
+
+
+def _template_store() -> Any:
+    store = get_template_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="reference templates are disabled; set TEMPLATE_STORE_DIR")
+    return store
+
 
-    output_buffer = io.BytesIO()
-    build_docx(preview_payload["ast"], output_buffer, config=format_config)
-    data = output_buffer.getvalue()
+def _check_template(template_id: str | None) -> None:
+    if template_id is not None and _template_store().path(template_id) is None:
+        raise HTTPException(status_code=422, detail=f"unknown template: {template_id}")
+
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _spooled_response(
+    build: Callable[[IO[bytes]], None], *, media_type: str = DOCX_MEDIA_TYPE, filename: str = "ai-report.docx"
+) -> StreamingResponse:
+    output_file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+    try:
+        build(output_file)
+        size = output_file.seek(0, os.SEEK_END)
+        output_file.seek(0)
+    except BaseException:
+        output_file.close()
+        raise
 
     increment_export_count()
 
-    return Response(
-        content=data,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": "attachment; filename=ai-report.docx"},
+    return StreamingResponse(
+        _iter_file(output_file),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(size),
+        },
+    )
+
+
+@app.post("/api/generate")
+async def generate(payload: GenerateRequest) -> StreamingResponse:
+    watchdog_kwargs = stage_watchdog_kwargs()
+    preview_payload = build_preview_payload(
+        payload.markdown,
+        bibliography_style=payload.bibliography.style,
+        bibliography_sources=payload.bibliography.sources_text,
+        **watchdog_kwargs,
+    )
+    format_config, export_options = _export_settings(payload)
+
+    return _spooled_response(
+        lambda output: build_docx(
+            preview_payload["ast"],
+            output,
+            config=format_config,
+            options=export_options,
+            **watchdog_kwargs,
+        )
+    )
+
+
+@app.post("/api/generate/chapters")
+async def generate_chapters(payload: ChaptersRequest) -> StreamingResponse:
+    watchdog_kwargs = stage_watchdog_kwargs()
+    format_config, export_options = _export_settings(payload)
+
+    return _spooled_response(
+        lambda output: build_chapters_docx(
+            payload.chapters,
+            output,
+            format_config,
+            bibliography_style=payload.bibliography.style,
+            bibliography_sources=payload.bibliography.sources_text,
+            options=export_options,
+            **watchdog_kwargs,
+        )
     )
 
 
+@app.post("/api/generate/presets")
+async def generate_presets(payload: PresetsRequest) -> StreamingResponse:
+    try:
+        presets = [(preset.name, build_format_config(**preset.config.model_dump())) for preset in payload.presets]
+        export_options = build_export_options(**payload.options.model_dump())
+    except Exception as exc:  # defensive: surface config issues as 422
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    _check_template(payload.options.template_id)
+    watchdog_kwargs = stage_watchdog_kwargs()
+    preview_payload = build_preview_payload(
+        payload.markdown,
+        bibliography_style=payload.bibliography.style,
+        bibliography_sources=payload.bibliography.sources_text,
+        **watchdog_kwargs,
+    )
+
+    return _spooled_response(
+        lambda output: write_variants_zip(
+            preview_payload["ast"], presets, output, options=export_options, **watchdog_kwargs
+        ),
+        media_type="application/zip",
+        filename="ai-report-presets.zip",
+    )
+
+
+@app.post("/api/templates", status_code=201)
+async def upload_template(request: Request) -> dict[str, Any]:
+    # The request body is the .docx file itself. It is read with a cap so
+    # an oversized upload is rejected before it is held in memory.
+    store = _template_store()
+    too_large = HTTPException(status_code=413, detail=f"template is larger than {store.max_bytes} bytes")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > store.max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > store.max_bytes:
+            raise too_large
+    data = bytes(body)
+    try:
+        template_id = store.add(data)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    return {"template_id": template_id, "size": len(data)}
+
+
+@app.get("/api/templates")
+async def list_templates() -> dict[str, Any]:
+    return {"templates": _template_store().list()}
+
+
+@app.delete("/api/templates/{template_id}", status_code=204)
+async def delete_template(template_id: str) -> Response:
+    if not _template_store().remove(template_id):
+        raise HTTPException(status_code=404, detail=f"unknown template: {template_id}")
+    return Response(status_code=204)
+
+
 @app.get("/api/exports/stats")
 async def export_stats() -> dict[str, int]:
     return get_export_stats()
+
+
+@app.get("/api/cache/images")
+async def image_cache_stats() -> dict[str, Any]:
+    cache = get_image_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
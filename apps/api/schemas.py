@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Any, Dict, Literal
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 
 class BibliographyConfig(BaseModel):
@@ -43,6 +43,20 @@ class GenerateConfig(BaseModel):
     page_num_position: Literal["center", "right"] = "center"
     figure_max_width_cm: float = 14.0
     figure_align: Literal["left", "center", "right"] = "center"
+    figure_dpi: float | None = None
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class ExportSettings(BaseModel):
+    resolve_equation_numbers: bool = False
+    backend: Literal["python-docx", "streaming"] = "python-docx"
+    inherit_styles: bool = False
+    compression: Literal["default", "fast", "balanced", "small"] | None = None
+    deterministic: bool = False
+    template_id: str | None = Field(default=None, pattern=r"^[0-9a-f]{64}$")
+    link_figures_min_bytes: int | None = Field(default=None, ge=0)
+    draft: bool = False
 
     model_config = ConfigDict(extra="forbid")
 
@@ -51,6 +65,7 @@ class GenerateRequest(BaseModel):
     markdown: str
     config: Dict[str, Any] | GenerateConfig = Field(default_factory=lambda: GenerateConfig())
     bibliography: BibliographyConfig = Field(default_factory=lambda: BibliographyConfig())
+    options: ExportSettings = Field(default_factory=lambda: ExportSettings())
 
     model_config = ConfigDict(extra="forbid")
 
@@ -58,3 +73,40 @@ class GenerateRequest(BaseModel):
         # Allow config as plain dict; coerce into GenerateConfig for downstream typing
         if isinstance(self.config, dict):
             self.config = GenerateConfig(**self.config)
+
+
+class ChaptersRequest(BaseModel):
+    chapters: list[str] = Field(min_length=1)
+    config: Dict[str, Any] | GenerateConfig = Field(default_factory=lambda: GenerateConfig())
+    bibliography: BibliographyConfig = Field(default_factory=lambda: BibliographyConfig())
+    options: ExportSettings = Field(default_factory=lambda: ExportSettings())
+
+    model_config = ConfigDict(extra="forbid")
+
+    def model_post_init(self, __context: Any) -> None:
+        if isinstance(self.config, dict):
+            self.config = GenerateConfig(**self.config)
+
+
+class StylePreset(BaseModel):
+    # Used as the file name inside the returned ZIP.
+    name: str = Field(min_length=1, max_length=100, pattern=r"^[^/\\:*?\"<>|]+$")
+    config: GenerateConfig = Field(default_factory=lambda: GenerateConfig())
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class PresetsRequest(BaseModel):
+    markdown: str
+    presets: list[StylePreset] = Field(min_length=1)
+    bibliography: BibliographyConfig = Field(default_factory=lambda: BibliographyConfig())
+    options: ExportSettings = Field(default_factory=lambda: ExportSettings())
+
+    model_config = ConfigDict(extra="forbid")
+
+    @model_validator(mode="after")
+    def _unique_names(self) -> "PresetsRequest":
+        names = [preset.name for preset in self.presets]
+        if len(set(names)) != len(names):
+            raise ValueError("preset names must be unique")
+        return self
@@ -1,10 +1,21 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
+from html import escape
 from typing import Any
 
-from .markdown_parser import render_preview_html
-from .pipeline import format_markdown
-from .preview import build_export_quality_report, lint_structure, summarize_ast
+from .citations import normalize_citations
+from .deadlines import StageWatchdog
+from .markdown_parser import (
+    collect_definitions,
+    parse_footnote_blocks,
+    parse_markdown_section_blocks,
+    parse_plain_paragraphs,
+    render_preview_html,
+    split_markdown_sections,
+)
+from .pipeline import append_bibliography, format_markdown
+from .preview import analyze_ast
 
 
 def build_preview_payload(
@@ -12,21 +23,103 @@ def build_preview_payload(
     *,
     bibliography_style: str = "ieee",
     bibliography_sources: str = "",
+    watchdog: StageWatchdog | None = None,
 ) -> dict[str, Any]:
     result = format_markdown(
         text,
         bibliography_style=bibliography_style,
         bibliography_sources=bibliography_sources,
+        watchdog=watchdog,
     )
-    summary = summarize_ast(result["ast"])
+    analysis = analyze_ast(result["ast"], result["refs"])
     preview_html = render_preview_html(result["normalized_markdown"])
-    lint_warnings = lint_structure(result["ast"], result["refs"])
-    quality_report = build_export_quality_report(result["ast"], result["refs"], lint_warnings)
     return {
-        "summary": summary,
+        "summary": analysis.summary,
         "refs": result["refs"],
         "ast": result["ast"],
         "preview_html": preview_html,
-        "lint_warnings": lint_warnings,
-        "quality_report": quality_report,
+        "lint_warnings": analysis.lint_warnings,
+        "quality_report": analysis.quality_report(result["refs"]),
+    }
+
+
+def _plain_blocks(text: str) -> list[tuple[list[dict[str, Any]], str]]:
+    nodes = parse_plain_paragraphs(text)
+    return [([node], f"<p>{escape(node['text'])}</p>\n") for node in nodes]
+
+
+def iter_preview_records(
+    text: str,
+    *,
+    bibliography_style: str = "ieee",
+    bibliography_sources: str = "",
+    watchdog: StageWatchdog | None = None,
+) -> Iterator[dict[str, Any]]:
+    # The preview as a stream of records: a `block` record with the AST nodes
+    # and HTML of each top-level block as soon as its section is parsed, then
+    # one `summary` record with the rest of `build_preview_payload`. The
+    # bibliography comes as a last block without HTML.
+    watchdog = watchdog or StageWatchdog()
+    normalized, refs, key_number_map = watchdog.run(
+        "normalize",
+        normalize_citations,
+        text,
+        fallback=lambda: (text, [], {}),
+    )
+    ast: list[dict[str, Any]] = []
+    index = 0
+    # The parse budget covers the whole document: once a section overruns
+    # it, that section and all later ones are streamed as plain paragraphs.
+    overrun = False
+    sections = split_markdown_sections(normalized)
+    # Sections are parsed with the definitions of the whole document, and
+    # their footnotes come as one block after the last section.
+    definitions = collect_definitions(normalized) if len(sections) > 1 else ""
+    references: list[str] = []
+    for section in sections:
+        parsed = None
+        if not overrun:
+            parsed = watchdog.run(
+                "parse",
+                parse_markdown_section_blocks,
+                section,
+                definitions,
+                references,
+                fallback=lambda: None,
+            )
+            overrun = parsed is None
+        if parsed is None:
+            blocks = _plain_blocks(section)
+        else:
+            blocks, made = parsed
+            references.extend(made)
+        for nodes, html in blocks:
+            ast.extend(nodes)
+            yield {"type": "block", "index": index, "ast": nodes, "html": html}
+            index += 1
+    if references and not overrun:
+        footnotes = watchdog.run("parse", parse_footnote_blocks, references, definitions, fallback=list)
+        for nodes, html in footnotes:
+            ast.extend(nodes)
+            yield {"type": "block", "index": index, "ast": nodes, "html": html}
+            index += 1
+
+    bibliography = append_bibliography(
+        ast,
+        refs,
+        key_number_map,
+        bibliography_style=bibliography_style,
+        bibliography_sources=bibliography_sources,
+        watchdog=watchdog,
+    )
+    if bibliography:
+        yield {"type": "block", "index": index, "ast": bibliography, "html": ""}
+
+    analysis = analyze_ast(ast, refs)
+    yield {
+        "type": "summary",
+        "summary": analysis.summary,
+        "refs": refs,
+        "lint_warnings": analysis.lint_warnings,
+        "quality_report": analysis.quality_report(refs),
     }
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import argparse
+import os
+from collections.abc import Callable, Iterable, Sequence
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from pathlib import Path
+from typing import Any
+
+from formatter.citations import (
+    build_bibliography_nodes,
+    has_bibliography_heading,
+    normalize_citation_chapters,
+    parse_bibliography_sources,
+)
+from formatter.config import ExportOptions, FormatConfig
+from formatter.deadlines import StageWatchdog
+from formatter.docx_builder import build_docx
+from formatter.markdown_parser import (
+    collect_definitions,
+    needs_whole_document,
+    parse_footnote_blocks,
+    parse_markdown_section,
+    parse_plain_paragraphs,
+)
+from formatter.math_batch import collect_math_latex, convert_math_batch, count_equations
+from formatter.ooxml_writer import render_fragments, write_docx_streaming
+from formatter.workers import process_pool
+
+Node = dict[str, Any]
+
+# Chapters are joined with a blank line, so a document split into chapter
+# files exports exactly like the concatenated markdown.
+CHAPTER_SEPARATOR = "\n\n"
+
+
+def _default_workers() -> int:
+    configured = os.getenv("FORMATTER_CHAPTER_WORKERS")
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            pass
+    return os.cpu_count() or 1
+
+
+def _map(executor: Executor | None, fn: Callable[..., Any], *iterables: Iterable[Any]) -> list[Any]:
+    if executor is not None:
+        try:
+            return list(executor.map(fn, *iterables))
+        except (OSError, BrokenProcessPool):
+            pass
+    return list(map(fn, *iterables))
+
+
+def _parse_chapter(text: str, definitions: str) -> tuple[list[Node], list[str]]:
+    try:
+        return parse_markdown_section(text, definitions)
+    except Exception:
+        return parse_plain_paragraphs(text), []
+
+
+def _render_chapter(
+    ast: list[Node],
+    config: FormatConfig,
+    options: ExportOptions,
+    math_omml: dict[str, str | None],
+    equation_start: int,
+) -> list[tuple[str, int] | None]:
+    # Runs in a worker process.
+    return render_fragments(ast, config, options, math_omml, equation_start=equation_start)
+
+
+def _render_chapters(
+    executor: Executor,
+    chapters: list[list[Node]],
+    config: FormatConfig,
+    options: ExportOptions,
+    math_omml: dict[str, str | None],
+) -> list[tuple[str, int] | None]:
+    starts = []
+    equation_index = 1
+    for ast in chapters:
+        starts.append(equation_index)
+        equation_index += count_equations(ast)
+    formulas = [{latex: math_omml.get(latex) for latex in collect_math_latex(ast)} for ast in chapters]
+    results = _map(executor, _render_chapter, chapters, repeat(config), repeat(options), formulas, starts)
+    return [entry for rendered in results for entry in rendered]
+
+
+def format_chapters(
+    chapters: Sequence[str],
+    *,
+    bibliography_style: str = "ieee",
+    bibliography_sources: str = "",
+    watchdog: StageWatchdog | None = None,
+    executor: Executor | None = None,
+) -> dict[str, Any]:
+    # Chapter-wise counterpart of pipeline.format_markdown: citations are
+    # numbered across all chapters and one bibliography closes the document.
+    watchdog = watchdog or StageWatchdog()
+    chapters = list(chapters)
+    normalized, refs, key_number_map = watchdog.run(
+        "normalize",
+        normalize_citation_chapters,
+        chapters,
+        fallback=lambda: (chapters, [], {}),
+    )
+    if any(needs_whole_document(chapter) for chapter in normalized):
+        # HTML blocks and fences may run on into other chapters: parse the
+        # document as a whole.
+        asts = [_parse_chapter(CHAPTER_SEPARATOR.join(normalized), "")[0]]
+    else:
+        # Definitions apply across chapters, so each chapter is parsed with
+        # all of them; the footnotes close the last chapter.
+        definitions = collect_definitions(CHAPTER_SEPARATOR.join(normalized))
+        parsed = _map(executor, _parse_chapter, normalized, repeat(definitions))
+        asts = [ast for ast, _ in parsed]
+        references = [label for _, made in parsed for label in made]
+        for nodes, _ in parse_footnote_blocks(references, definitions):
+            asts[-1].extend(nodes)
+    sources = watchdog.run(
+        "bibliography",
+        parse_bibliography_sources,
+        bibliography_sources,
+        fallback=dict,
+    )
+
+    bibliography: list[Node] = []
+    if refs and not any(has_bibliography_heading(ast) for ast in asts):
+        bibliography = build_bibliography_nodes(
+            refs,
+            style=bibliography_style,
+            sources=sources,
+            key_number_map=key_number_map,
+        )
+
+    return {
+        "chapters": asts,
+        "bibliography": bibliography,
+        "refs": refs,
+        "normalized_markdown": CHAPTER_SEPARATOR.join(normalized),
+    }
+
+
+def build_chapters_docx(
+    chapters: Sequence[str],
+    output_path,
+    config: FormatConfig | None = None,
+    *,
+    bibliography_style: str = "ieee",
+    bibliography_sources: str = "",
+    options: ExportOptions | None = None,
+    watchdog: StageWatchdog | None = None,
+    max_workers: int | None = None,
+) -> list[str]:
+    # Parses and renders chapters in a process pool, then streams the merged
+    # body into one package. Figure and equation numbering run on across
+    # chapters. With the python-docx backend, only parsing is parallel: the
+    # merged AST is built by `build_docx`. Returns the document's references.
+    config = config or FormatConfig()
+    options = options or ExportOptions()
+    watchdog = watchdog or StageWatchdog()
+    chapters = list(chapters)
+    workers = min(max_workers if max_workers is not None else _default_workers(), len(chapters))
+    executor = None
+    if workers > 1:
+        try:
+            executor = process_pool(workers)
+        except OSError:
+            executor = None
+    try:
+        result = format_chapters(
+            chapters,
+            bibliography_style=bibliography_style,
+            bibliography_sources=bibliography_sources,
+            watchdog=watchdog,
+            executor=executor,
+        )
+        ast = [node for chapter in result["chapters"] for node in chapter] + result["bibliography"]
+        math_omml = {} if options.draft else convert_math_batch(collect_math_latex(ast), watchdog=watchdog)
+        rendered = None
+        if executor is not None and options.backend == "streaming":
+            rendered = _render_chapters(executor, result["chapters"], config, options, math_omml)
+            rendered.extend([None] * len(result["bibliography"]))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if options.backend == "streaming":
+        write_docx_streaming(
+            ast, output_path, config, math_omml=math_omml, watchdog=watchdog, options=options, rendered=rendered
+        )
+    else:
+        build_docx(ast, output_path, config, math_omml=math_omml, watchdog=watchdog, options=options)
+    return result["refs"]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Format markdown chapters into a single DOCX.")
+    parser.add_argument("chapters", nargs="+", type=Path, help="chapter markdown files, in document order")
+    parser.add_argument("--output", "-o", type=Path, required=True)
+    parser.add_argument("--bibliography-style", choices=("ieee", "gbt", "apa"), default="ieee")
+    parser.add_argument("--sources", type=Path, help="bibliography sources: BibTeX entries or '[id] text' lines")
+    parser.add_argument("--workers", type=int, help="worker processes (default: FORMATTER_CHAPTER_WORKERS or CPUs)")
+    parser.add_argument("--backend", choices=("streaming", "python-docx"), default="streaming")
+    parser.add_argument("--resolve-equation-numbers", action="store_true")
+    args = parser.parse_args(argv)
+
+    chapters = [path.read_text(encoding="utf-8") for path in args.chapters]
+    sources = args.sources.read_text(encoding="utf-8") if args.sources else ""
+    refs = build_chapters_docx(
+        chapters,
+        args.output,
+        bibliography_style=args.bibliography_style,
+        bibliography_sources=sources,
+        options=ExportOptions(backend=args.backend, resolve_equation_numbers=args.resolve_equation_numbers),
+        max_workers=args.workers,
+    )
+    print(f"{args.output}: {len(chapters)} chapters, {len(refs)} references")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
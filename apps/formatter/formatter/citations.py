@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import re
+from collections.abc import Sequence
 from typing import Any
 
 _CITATION_RE = re.compile(r"\[(\d+)\]")
@@ -90,8 +91,11 @@ def parse_bibliography_sources(text: str) -> dict[str, str]:
     return sources
 
 
-def normalize_citations(text: str) -> tuple[str, list[str], dict[int, str]]:
-    numbers = sorted({int(match.group(1)) for match in _CITATION_RE.finditer(text)})
+def normalize_citation_chapters(chapters: Sequence[str]) -> tuple[list[str], list[str], dict[int, str]]:
+    # Numbers citations across chapters exactly as normalize_citations does
+    # for the chapters joined in order: [@key] citations continue after the
+    # highest numeric citation of the whole document.
+    numbers = sorted({int(match.group(1)) for text in chapters for match in _CITATION_RE.finditer(text)})
     next_number = (max(numbers) + 1) if numbers else 1
     key_to_number: dict[str, int] = {}
 
@@ -103,10 +107,17 @@ def normalize_citations(text: str) -> tuple[str, list[str], dict[int, str]]:
             next_number += 1
         return f"[{key_to_number[source_key]}]"
 
-    normalized_text = _KEY_CITATION_RE.sub(replace_key_citation, text)
-    all_numbers = sorted({int(match.group(1)) for match in _CITATION_RE.finditer(normalized_text)})
+    normalized_chapters = [_KEY_CITATION_RE.sub(replace_key_citation, text) for text in chapters]
+    all_numbers = sorted(
+        {int(match.group(1)) for text in normalized_chapters for match in _CITATION_RE.finditer(text)}
+    )
     refs = [f"[{number}]" for number in all_numbers]
     number_key_map = {number: key for key, number in key_to_number.items()}
+    return normalized_chapters, refs, number_key_map
+
+
+def normalize_citations(text: str) -> tuple[str, list[str], dict[int, str]]:
+    (normalized_text,), refs, number_key_map = normalize_citation_chapters([text])
     return normalized_text, refs, number_key_map
 
 
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
 
 
 @dataclass
@@ -31,6 +33,9 @@ class HeadingStyle:
 class FigureStyle:
     max_width_cm: float = 14.0
     align: str = "center"
+    # When set, images wider than max_width_cm at this resolution are
+    # resampled before embedding.
+    dpi: float | None = None
 
 
 def _default_heading_styles(base: BodyStyle) -> dict[int, HeadingStyle]:
@@ -70,6 +75,29 @@ def _default_heading_styles(base: BodyStyle) -> dict[int, HeadingStyle]:
     }
 
 
+@dataclass
+class ExportOptions:
+    resolve_equation_numbers: bool = False
+    backend: str = "python-docx"
+    inherit_styles: bool = False
+    # Zip compression profile (see docx_package.COMPRESSION_PROFILES); None
+    # uses FORMATTER_ZIP_COMPRESSION or python-docx's default deflate.
+    compression: str | None = None
+    # Byte-identical output for identical input: fixed core properties and
+    # zip entry metadata (SOURCE_DATE_EPOCH or 1980-01-01).
+    deterministic: bool = False
+    # Id of an uploaded reference .docx (see template_store) used instead of
+    # python-docx's default template.
+    template_id: str | None = None
+    # Remote figures of at least this many bytes are written as external
+    # picture links instead of being embedded; None embeds all.
+    link_figures_min_bytes: int | None = None
+    # Quick layout check: formulas as LaTeX text, figures as sized
+    # placeholder boxes (nothing is downloaded or decoded) and no per-cell
+    # table borders.
+    draft: bool = False
+
+
 @dataclass
 class FormatConfig:
     body_style: BodyStyle = field(default_factory=BodyStyle)
@@ -85,3 +113,8 @@ class FormatConfig:
             return
         for level, style in defaults.items():
             self.heading_styles.setdefault(level, style)
+
+
+def config_fingerprint(config: FormatConfig) -> str:
+    payload = json.dumps(asdict(config), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import wait
+from dataclasses import dataclass, fields
+from typing import Any, Callable, TypeVar
+
+from formatter.workers import process_pool, terminate_workers
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+STAGES = ("normalize", "parse", "bibliography", "math", "figures", "save")
+# Stages that only compute run in a worker process, which is terminated on
+# overrun. Figures wait on the network and stay in threads; math has its own
+# pool in math_batch.
+PROCESS_STAGES = ("normalize", "parse", "bibliography")
+
+
+@dataclass
+class StageBudgets:
+    normalize: float | None = None
+    parse: float | None = None
+    bibliography: float | None = None
+    math: float | None = None
+    figures: float | None = None
+    save: float | None = None
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str]) -> "StageBudgets":
+        # FORMATTER_STAGE_BUDGETS="parse=2,math=10,figures=20" (seconds per export)
+        budgets: dict[str, float] = {}
+        for item in env.get("FORMATTER_STAGE_BUDGETS", "").split(","):
+            name, _, value = item.partition("=")
+            name = name.strip()
+            if name not in STAGES:
+                continue
+            try:
+                budgets[name] = max(0.0, float(value))
+            except ValueError:
+                continue
+        return cls(**budgets)
+
+    def is_empty(self) -> bool:
+        return all(getattr(self, item.name) is None for item in fields(self))
+
+
+class _Worker(threading.Thread):
+    def __init__(self, fn: Callable[..., Any], args: tuple[Any, ...]) -> None:
+        super().__init__(daemon=True)
+        self._fn = fn
+        self._args = args
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+    def run(self) -> None:
+        try:
+            self.result = self._fn(*self._args)
+        except BaseException as exc:  # re-raised in the calling thread
+            self.error = exc
+
+
+class StageWatchdog:
+    def __init__(self, budgets: StageBudgets | None = None) -> None:
+        self.budgets = budgets or StageBudgets()
+        self.spent: dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self.events: list[dict[str, Any]] = []
+
+    @property
+    def enabled(self) -> bool:
+        return not self.budgets.is_empty()
+
+    def remaining(self, stage: str) -> float | None:
+        budget = getattr(self.budgets, stage)
+        if budget is None:
+            return None
+        return max(0.0, budget - self.spent[stage])
+
+    def charge(self, stage: str, elapsed: float) -> None:
+        self.spent[stage] += elapsed
+
+    def report_overrun(self, stage: str, detail: str = "") -> None:
+        event = {
+            "event": "stage_deadline_exceeded",
+            "stage": stage,
+            "budget_seconds": getattr(self.budgets, stage),
+            "spent_seconds": round(self.spent[stage], 4),
+            "detail": detail[:200],
+        }
+        self.events.append(event)
+        logger.warning("stage deadline exceeded: %s", stage, extra={"formatter_deadline": event})
+
+    def run(
+        self,
+        stage: str,
+        fn: Callable[..., T],
+        *args: Any,
+        fallback: Callable[[], T],
+        detail: str = "",
+    ) -> T:
+        remaining = self.remaining(stage)
+        if remaining is None:
+            return fn(*args)
+        if remaining <= 0:
+            self.report_overrun(stage, detail)
+            return fallback()
+
+        if stage in PROCESS_STAGES:
+            return self._run_in_process(stage, fn, args, remaining, fallback, detail)
+
+        # A thread cannot be killed; on overrun it is abandoned as a daemon
+        # thread and returns when its I/O times out.
+        worker = _Worker(fn, args)
+        started = time.perf_counter()
+        worker.start()
+        worker.join(remaining)
+        elapsed = time.perf_counter() - started
+        if worker.is_alive():
+            self.charge(stage, remaining)
+            self.report_overrun(stage, detail)
+            return fallback()
+
+        self.charge(stage, elapsed)
+        if worker.error is not None:
+            raise worker.error
+        return worker.result
+
+    def _run_in_process(
+        self,
+        stage: str,
+        fn: Callable[..., T],
+        args: tuple[Any, ...],
+        remaining: float,
+        fallback: Callable[[], T],
+        detail: str,
+    ) -> T:
+        # `fn` and its arguments are pickled, so `fn` must be importable by
+        # name. The worker is started before the clock is.
+        pool = process_pool(1)
+        done: set[Any] = set()
+        try:
+            pool.submit(int).result()
+            started = time.perf_counter()
+            future = pool.submit(fn, *args)
+            done, _ = wait([future], timeout=remaining)
+        finally:
+            if not done:
+                terminate_workers(pool)
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        if not done:
+            self.charge(stage, remaining)
+            self.report_overrun(stage, detail)
+            return fallback()
+        self.charge(stage, time.perf_counter() - started)
+        return future.result()
+
+    def measure(self, stage: str, fn: Callable[..., T], *args: Any, detail: str = "") -> T:
+        # For stages that cannot be degraded (e.g. writing the file): run to
+        # completion, but still account for the time and warn on overrun.
+        started = time.perf_counter()
+        result = fn(*args)
+        self.charge(stage, time.perf_counter() - started)
+        remaining = self.remaining(stage)
+        if remaining is not None and remaining <= 0:
+            self.report_overrun(stage, detail)
+        return result
@@ -1,24 +1,58 @@
 from __future__ import annotations
 
 import base64
+import copy
 import io
 import os
+import sqlite3
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
 from typing import Any
 from urllib.parse import unquote, urlparse
 from urllib.request import urlopen
 
 from docx import Document
-from docx.enum.text import WD_COLOR_INDEX, WD_PARAGRAPH_ALIGNMENT
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_PARAGRAPH_ALIGNMENT, WD_TAB_ALIGNMENT
+from docx.image.image import Image as DocxImage
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
 from docx.oxml import OxmlElement, parse_xml
-from docx.oxml.ns import qn
-from docx.shared import Cm, Pt, RGBColor
-
-from formatter.config import FormatConfig
+from docx.oxml.ns import nsdecls, qn
+from docx.oxml.shape import CT_Inline
+from docx.shared import Cm, Emu, Pt, RGBColor, Twips
+from docx.text.paragraph import Paragraph
+from lxml import etree
+
+from formatter.config import ExportOptions, FormatConfig, config_fingerprint
+from formatter.deadlines import StageWatchdog
+from formatter.docx_package import ZipCompression, deterministic_timestamp, resolve_compression, write_package
+from formatter.docx_template import clone_styled_template
+from formatter.figures import FigureHeader, is_remote_source, prefetch_figures
+from formatter.image_cache import get_image_cache
+from formatter.image_resample import fit_to_print_width
+from formatter.fragment_cache import block_key, get_fragment_cache
 from formatter.latex import latex_to_omml
+from formatter.math_batch import collect_math_latex, convert_math_batch
+from formatter.template_store import read_template
 
 Node = dict[str, Any]
 
 
+@dataclass
+class _RenderContext:
+    config: FormatConfig
+    center_tab: int
+    right_tab: int
+    options: ExportOptions = field(default_factory=ExportOptions)
+    figure_index: int = 1
+    equation_index: int = 1
+    math_omml: Mapping[str, str | None] | None = None
+    figures: Mapping[str, bytes | FigureHeader | None] | None = None
+    watchdog: StageWatchdog = field(default_factory=StageWatchdog)
+    fragments: _PropertyFragments | None = None
+
+
 def _set_style_fonts(style, ascii_font: str, east_asia_font: str | None = None) -> None:
     style.font.name = ascii_font
     rfonts = style.element.rPr.rFonts
@@ -39,11 +73,207 @@ def _chars_to_pt(chars: int, font_size_pt: int) -> Pt:
 LIST_INDENT_PT = 18
 THREE_LINE_BORDER_THICK_SZ = 12
 THREE_LINE_BORDER_THIN_SZ = 6
+DRAFT_FIGURE_ASPECT = 3 / 4
+# Largest exact line height Word accepts (1584 pt).
+MAX_LINE_TWIPS = 31680
+
+_ALIGNMENTS = {"left": "left", "center": "center", "right": "right", "justify": "both"}
+CODE_RUN_PROPERTIES = '<w:rPr><w:rFonts w:ascii="Consolas" w:hAnsi="Consolas"/><w:sz w:val="20"/></w:rPr>'
+
+
+def _run_style_key(run: Node) -> tuple[bool, ...]:
+    return (
+        bool(run.get("bold")),
+        bool(run.get("italic")),
+        bool(run.get("strike")),
+        bool(run.get("highlight")),
+        bool(run.get("superscript")),
+        bool(run.get("subscript")),
+        bool(run.get("code")),
+        bool(run.get("link")),
+    )
 
 
-def _apply_list_indents(paragraph, level: int) -> None:
-    paragraph.paragraph_format.left_indent = Pt(LIST_INDENT_PT * level)
-    paragraph.paragraph_format.first_line_indent = Pt(-LIST_INDENT_PT / 2)
+@lru_cache(maxsize=None)
+def _run_properties_xml(
+    bold: bool,
+    italic: bool,
+    strike: bool,
+    highlight: bool,
+    superscript: bool,
+    subscript: bool,
+    code: bool,
+    link: bool,
+    explicit_off: bool = True,
+) -> str:
+    markup = ["<w:rPr>"]
+    if code:
+        markup.append('<w:rFonts w:ascii="Consolas" w:hAnsi="Consolas"/>')
+    if bold or explicit_off:
+        markup.append("<w:b/>" if bold else '<w:b w:val="0"/>')
+    if italic or explicit_off:
+        markup.append("<w:i/>" if italic else '<w:i w:val="0"/>')
+    if strike:
+        markup.append("<w:strike/>")
+    if link:
+        markup.append('<w:color w:val="0563C1"/>')
+    if highlight:
+        markup.append('<w:highlight w:val="yellow"/>')
+    elif code:
+        markup.append('<w:highlight w:val="lightGray"/>')
+    if link:
+        markup.append('<w:u w:val="single"/>')
+    if subscript:
+        markup.append('<w:vertAlign w:val="subscript"/>')
+    elif superscript:
+        markup.append('<w:vertAlign w:val="superscript"/>')
+    if len(markup) == 1:
+        return ""
+    markup.append("</w:rPr>")
+    return "".join(markup)
+
+
+def _indent_xml(*, left=None, right=None, first_line=None) -> str:
+    attrs = []
+    if left is not None:
+        attrs.append(f'w:left="{left.twips}"')
+    if right is not None:
+        attrs.append(f'w:right="{right.twips}"')
+    if first_line is not None:
+        if first_line < 0:
+            attrs.append(f'w:hanging="{-first_line.twips}"')
+        else:
+            attrs.append(f'w:firstLine="{first_line.twips}"')
+    return f"<w:ind {' '.join(attrs)}/>"
+
+
+def _with_namespace(markup: str) -> str:
+    tag_end = markup.index(">")
+    if markup[tag_end - 1] == "/":
+        tag_end -= 1
+    return f"{markup[:tag_end]} {nsdecls('w')}{markup[tag_end:]}"
+
+
+# Paragraph kinds that reference a custom style instead of carrying direct
+# formatting when exporting with `ExportOptions.inherit_styles`. Body
+# paragraphs use Normal, which already holds the body indents and alignment.
+INHERITED_STYLES = {
+    "cell": "Report Table Cell",
+    "figure": "Report Figure",
+    "caption": "Report Caption",
+    "quote": "Report Quote",
+    "math": "Report Equation",
+    "code": "Report Code",
+}
+# Runs in these paragraphs keep explicit "off" values: heading styles are bold
+# and quote runs without an italic setting are italicised.
+_EXPLICIT_RUN_KINDS = {"heading", "quote"}
+
+
+class _PropertyFragments:
+    # Paragraph and run properties are fixed per export, so each distinct
+    # w:pPr / w:rPr is built once and copied onto new paragraphs and runs.
+    # Both backends use the same markup.
+    def __init__(self, doc, config: FormatConfig, center_tab: int, right_tab: int, inherit: bool = False) -> None:
+        self._doc = doc
+        self._config = config
+        self.inherit = inherit
+        self._tabs = (
+            f'<w:tabs><w:tab w:val="center" w:pos="{center_tab}"/>'
+            f'<w:tab w:val="right" w:pos="{right_tab}"/></w:tabs>'
+        )
+        self._style_ids: dict[str, str | None] = {}
+        self._paragraph_xml: dict[tuple[Any, ...], str] = {}
+        self._elements: dict[str, Any] = {}
+
+    def style_id(self, name: str) -> str | None:
+        if name not in self._style_ids:
+            self._style_ids[name] = self._doc.part.get_style_id(name, WD_STYLE_TYPE.PARAGRAPH)
+        return self._style_ids[name]
+
+    def _pstyle(self, name: str) -> str:
+        style_id = self.style_id(name)
+        return f'<w:pStyle w:val="{style_id}"/>' if style_id else ""
+
+    def _build_paragraph_xml(self, kind: str, level: int, ordered: bool) -> str:
+        config = self._config
+        size_pt = config.body_style.size_pt
+        math = '<w:jc w:val="left"/>' + self._tabs
+        if self.inherit and kind == "body":
+            markup = ""
+        elif self.inherit and kind in INHERITED_STYLES:
+            markup = self._pstyle(INHERITED_STYLES[kind])
+        elif self.inherit and kind == "quote_math":
+            markup = self._pstyle(INHERITED_STYLES["math"]) + _indent_xml(left=Pt(21))
+        elif kind == "heading":
+            if not 0 <= level <= 9:
+                raise ValueError("level must be in range 0-9, got %d" % level)
+            markup = self._pstyle("Title" if level == 0 else f"Heading {level}")
+        elif kind == "body":
+            markup = _indent_xml(
+                left=_chars_to_pt(config.body_style.indent_before_chars, size_pt),
+                right=_chars_to_pt(config.body_style.indent_after_chars, size_pt),
+                first_line=_chars_to_pt(config.body_style.first_line_indent_chars, size_pt),
+            )
+            if config.body_style.justify:
+                markup += '<w:jc w:val="both"/>'
+        elif kind in {"list", "list_math"}:
+            markup = self._pstyle(_list_style_name(ordered, level)) + _indent_xml(
+                left=Pt(LIST_INDENT_PT * level), first_line=Pt(-LIST_INDENT_PT / 2)
+            )
+            if kind == "list_math":
+                markup += math
+        elif kind == "quote":
+            markup = _indent_xml(left=Pt(21), first_line=Pt(0))
+        elif kind == "quote_math":
+            markup = _indent_xml(left=Pt(21)) + math
+        elif kind == "math":
+            markup = math
+        elif kind == "code":
+            markup = (
+                '<w:spacing w:line="240" w:lineRule="auto" w:before="0" w:after="0"/>'
+                + f'<w:ind w:firstLine="0" w:left="{Cm(0.5).twips}" w:right="{Cm(0.5).twips}"/>'
+                + '<w:jc w:val="left"/><w:shd w:val="clear" w:color="auto" w:fill="F2F2F2"/>'
+            )
+        elif kind in {"figure", "caption"}:
+            markup = f'<w:jc w:val="{_ALIGNMENTS.get(config.figure_style.align, "center")}"/>'
+        elif kind == "cell":
+            markup = _indent_xml(left=Pt(0), right=Pt(0), first_line=Pt(0)) + '<w:jc w:val="center"/>'
+        else:
+            raise ValueError(f"unknown paragraph kind: {kind}")
+        return f"<w:pPr>{markup}</w:pPr>" if markup else ""
+
+    def paragraph_xml(self, kind: str, level: int = 1, ordered: bool = False) -> str:
+        key = (kind, level, ordered)
+        markup = self._paragraph_xml.get(key)
+        if markup is None:
+            markup = self._paragraph_xml[key] = self._build_paragraph_xml(kind, level, ordered)
+        return markup
+
+    def _copy(self, markup: str):
+        element = self._elements.get(markup)
+        if element is None:
+            element = self._elements[markup] = parse_xml(_with_namespace(markup))
+        return copy.deepcopy(element)
+
+    def paragraph_properties(self, kind: str, level: int = 1, ordered: bool = False):
+        markup = self.paragraph_xml(kind, level, ordered)
+        return self._copy(markup) if markup else None
+
+    def run_xml(self, run: Node, kind: str = "body") -> str:
+        explicit_off = not self.inherit or kind in _EXPLICIT_RUN_KINDS
+        return _run_properties_xml(*_run_style_key(run), explicit_off)
+
+    def run_properties(self, run: Node, kind: str = "body"):
+        markup = self.run_xml(run, kind)
+        return self._copy(markup) if markup else None
+
+    def code_run_xml(self) -> str:
+        return "" if self.inherit else CODE_RUN_PROPERTIES
+
+    def code_run_properties(self):
+        markup = self.code_run_xml()
+        return self._copy(markup) if markup else None
 
 
 def _apply_style_paragraph(style, size_pt, line_spacing, before_lines, after_lines, align=None) -> None:
@@ -56,18 +286,6 @@ def _apply_style_paragraph(style, size_pt, line_spacing, before_lines, after_lin
         pf.alignment = align
 
 
-def _apply_paragraph_shading(paragraph, fill: str) -> None:
-    p_pr = paragraph._p.get_or_add_pPr()
-    existing = p_pr.find(qn("w:shd"))
-    if existing is not None:
-        p_pr.remove(existing)
-    shading = OxmlElement("w:shd")
-    shading.set(qn("w:val"), "clear")
-    shading.set(qn("w:color"), "auto")
-    shading.set(qn("w:fill"), fill)
-    p_pr.append(shading)
-
-
 def _add_page_number(section, position: str) -> None:
     footer = section.footer
     paragraph = footer.paragraphs[0] if footer.paragraphs else footer.add_paragraph()
@@ -80,33 +298,30 @@ def _add_page_number(section, position: str) -> None:
     run._r.append(fld)
 
 
-def _add_math_run(paragraph, latex: str) -> None:
+def _resolve_omml(latex: str, ctx: _RenderContext) -> str | None:
+    if ctx.options.draft:
+        return None
+    if ctx.math_omml is not None and latex in ctx.math_omml:
+        return ctx.math_omml[latex]
+    try:
+        return latex_to_omml(latex)
+    except Exception:
+        return None
+
+
+def _add_math_run(paragraph, latex: str, ctx: _RenderContext) -> None:
     run = paragraph.add_run()
+    omml = _resolve_omml(latex, ctx)
+    if omml is None:
+        run.text = latex
+        return
     try:
-        omml = latex_to_omml(latex)
         omml = _ensure_omml_namespace(omml)
         run._r.append(parse_xml(omml))
     except Exception:
         run.text = latex
 
 
-def _apply_equation_tabs(paragraph, center_pos: int, right_pos: int) -> None:
-    p_pr = paragraph._p.get_or_add_pPr()
-    existing = p_pr.find(qn("w:tabs"))
-    if existing is not None:
-        p_pr.remove(existing)
-    tabs = OxmlElement("w:tabs")
-    center_tab = OxmlElement("w:tab")
-    center_tab.set(qn("w:val"), "center")
-    center_tab.set(qn("w:pos"), str(center_pos))
-    tabs.append(center_tab)
-    right_tab = OxmlElement("w:tab")
-    right_tab.set(qn("w:val"), "right")
-    right_tab.set(qn("w:pos"), str(right_pos))
-    tabs.append(right_tab)
-    p_pr.append(tabs)
-
-
 def _append_field_char(paragraph, field_type: str, dirty: bool = False) -> None:
     run = OxmlElement("w:r")
     fld = OxmlElement("w:fldChar")
@@ -133,34 +348,18 @@ def _append_text_run(paragraph, text: str) -> None:
     paragraph._p.append(run)
 
 
-def _add_equation_number_field(paragraph) -> None:
+def _add_equation_number_field(paragraph, ctx: _RenderContext) -> None:
+    # Resolved numbers are written as the field result so Word need not
+    # recompute every SEQ field on open; the field itself stays updatable.
+    resolved = ctx.options.resolve_equation_numbers
     paragraph.add_run("(")
-    _append_field_char(paragraph, "begin", dirty=True)
+    _append_field_char(paragraph, "begin", dirty=not resolved)
     _append_instr_text(paragraph, r"SEQ Equation \* ARABIC")
     _append_field_char(paragraph, "separate")
-    _append_text_run(paragraph, "1")
+    _append_text_run(paragraph, str(ctx.equation_index) if resolved else "1")
     _append_field_char(paragraph, "end")
     paragraph.add_run(")")
-
-
-def _apply_run_styles(docx_run, run: Node) -> None:
-    docx_run.bold = bool(run.get("bold"))
-    docx_run.italic = bool(run.get("italic"))
-    if run.get("strike"):
-        docx_run.font.strike = True
-    if run.get("highlight"):
-        docx_run.font.highlight_color = WD_COLOR_INDEX.YELLOW
-    if run.get("superscript"):
-        docx_run.font.superscript = True
-    if run.get("subscript"):
-        docx_run.font.subscript = True
-    if run.get("code"):
-        docx_run.font.name = "Consolas"
-        if not run.get("highlight"):
-            docx_run.font.highlight_color = WD_COLOR_INDEX.GRAY_25
-    if run.get("link"):
-        docx_run.font.color.rgb = RGBColor(0x05, 0x63, 0xC1)
-        docx_run.font.underline = True
+    ctx.equation_index += 1
 
 
 def _ensure_omml_namespace(omml: str) -> str:
@@ -179,20 +378,32 @@ def _ensure_omml_namespace(omml: str) -> str:
     )
 
 
-def _add_runs(paragraph, runs: list[Node], fallback_text: str = "") -> None:
+def _add_runs(
+    paragraph, runs: list[Node], ctx: _RenderContext, fallback_text: str = "", kind: str = "body"
+) -> None:
     if not runs:
         if fallback_text:
             paragraph.add_run(fallback_text)
         return
     for run in runs:
         if run.get("type") == "math":
-            _add_math_run(paragraph, run.get("latex", ""))
+            _add_math_run(paragraph, run.get("latex", ""), ctx)
             continue
         text = run.get("text", "")
         if not text:
             continue
         docx_run = paragraph.add_run(text)
-        _apply_run_styles(docx_run, run)
+        r_pr = ctx.fragments.run_properties(run, kind)
+        if r_pr is not None:
+            docx_run._r.insert(0, r_pr)
+
+
+def _add_paragraph(doc, ctx: _RenderContext, kind: str, level: int = 1, ordered: bool = False):
+    paragraph = doc.add_paragraph("")
+    p_pr = ctx.fragments.paragraph_properties(kind, level, ordered)
+    if p_pr is not None:
+        paragraph._p.insert(0, p_pr)
+    return paragraph
 
 
 def _trim_leading_text_runs(runs: list[Node]) -> list[Node]:
@@ -219,45 +430,53 @@ def _trim_leading_text_runs(runs: list[Node]) -> list[Node]:
     return trimmed_runs
 
 
-def _add_code_block(doc, node: Node) -> None:
-    paragraph = doc.add_paragraph("")
-    paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
-    paragraph.paragraph_format.first_line_indent = Pt(0)
-    paragraph.paragraph_format.left_indent = Cm(0.5)
-    paragraph.paragraph_format.right_indent = Cm(0.5)
-    paragraph.paragraph_format.line_spacing = 1.0
-    paragraph.paragraph_format.space_before = Pt(0)
-    paragraph.paragraph_format.space_after = Pt(0)
-    _apply_paragraph_shading(paragraph, "F2F2F2")
-
-    code_font = "Consolas"
+def _add_code_block(doc, node: Node, ctx: _RenderContext) -> None:
+    paragraph = _add_paragraph(doc, ctx, "code")
     lines = (node.get("text") or "").splitlines()
     for idx, line in enumerate(lines):
         if idx > 0:
             paragraph.add_run().add_break()
         run = paragraph.add_run(line)
-        run.font.name = code_font
-        run.font.size = Pt(10)
+        r_pr = ctx.fragments.code_run_properties()
+        if r_pr is not None:
+            run._r.insert(0, r_pr)
 
 
-def _figure_alignment(align: str):
-    if align == "left":
-        return WD_PARAGRAPH_ALIGNMENT.LEFT
-    if align == "right":
-        return WD_PARAGRAPH_ALIGNMENT.RIGHT
-    return WD_PARAGRAPH_ALIGNMENT.CENTER
-
-
-def _load_figure_source(src: str):
+def load_figure_source(src: str, prefetched: Mapping[str, bytes | FigureHeader | None] | None = None):
     if not src:
         return None
 
+    if prefetched is not None and src in prefetched:
+        data = prefetched[src]
+        # Only the header of a figure meant to be linked was prefetched; it
+        # is never downloaded again here.
+        if isinstance(data, FigureHeader):
+            return None
+        return io.BytesIO(data) if data is not None else None
+
     if src.startswith("data:image"):
         try:
             _, payload = src.split(",", 1)
-            return io.BytesIO(base64.b64decode(payload))
-        except Exception:
+        except ValueError:
             return None
+        cache = get_image_cache()
+        data = None
+        if cache is not None:
+            try:
+                data = cache.get_payload(payload)
+            except (sqlite3.Error, OSError):
+                data = None
+        if data is None:
+            try:
+                data = base64.b64decode(payload)
+            except Exception:
+                return None
+            if cache is not None:
+                try:
+                    cache.put_payload(payload, data)
+                except (sqlite3.Error, OSError):
+                    pass
+        return io.BytesIO(data)
 
     parsed = urlparse(src)
     if parsed.scheme in {"http", "https"}:
@@ -279,25 +498,125 @@ def _load_figure_source(src: str):
     return None
 
 
-def _add_figure(doc, node: Node, config: FormatConfig, figure_index: int) -> int:
-    src = str(node.get("src", "")).strip()
-    source = _load_figure_source(src)
-    alignment = _figure_alignment(config.figure_style.align)
+def _figure_width_cm(config: FormatConfig) -> float:
+    try:
+        return max(1.0, float(config.figure_style.max_width_cm))
+    except Exception:
+        return 14.0
+
+
+def _load_figure(src: str, ctx: _RenderContext):
+    source = load_figure_source(src, ctx.figures)
+    dpi = ctx.config.figure_style.dpi
+    if source is None or not dpi or dpi <= 0:
+        return source
+    return fit_to_print_width(source, _figure_width_cm(ctx.config), dpi)
+
+
+def _image_size(path: str) -> tuple[int, int]:
+    # Pillow only reads the image header; python-docx reads the whole file.
+    try:
+        from PIL import Image
+
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        image = DocxImage.from_file(path)
+        return image.px_width, image.px_height
+
+
+def _linked_figure(src: str, ctx: _RenderContext) -> tuple[str, int, int] | None:
+    # (target, pixel width, pixel height) for figures written as external
+    # links: remote figures of at least `link_figures_min_bytes`. Local
+    # figures are always embedded, as a link would expose the server's
+    # file system paths.
+    threshold = ctx.options.link_figures_min_bytes
+    if threshold is None or not is_remote_source(src):
+        return None
+    data = ctx.figures.get(src)
+    if isinstance(data, FigureHeader):
+        # The rest of the figure was never downloaded, so it is linked even
+        # when its header did not parse, at the draft aspect ratio.
+        if data.size is None:
+            return src, 1000, round(1000 * DRAFT_FIGURE_ASPECT)
+        return src, *data.size
+    if data is None or len(data) < threshold:
+        return None
+    try:
+        image = DocxImage.from_blob(data)
+    except Exception:
+        return None
+    return src, image.px_width, image.px_height
+
 
-    if source is None:
-        fallback = doc.add_paragraph(f"[图片加载失败] {src}" if src else "[图片加载失败]")
-        fallback.alignment = alignment
-        return figure_index
+def _linked_picture_inline(part, shape_id: int, target: str, px_width: int, px_height: int, width_cm: float):
+    r_id = part.relate_to(target, RT.IMAGE, is_external=True)
+    cx = Cm(width_cm)
+    cy = Emu(round(cx * px_height / px_width))
+    filename = os.path.basename(urlparse(target).path) or "image"
+    inline = CT_Inline.new_pic_inline(shape_id, r_id, filename, cx, cy)
+    blip = inline.xpath(".//a:blip")[0]
+    del blip.attrib[qn("r:embed")]
+    blip.set(qn("r:link"), r_id)
+    return inline
 
-    picture_paragraph = doc.add_paragraph("")
-    picture_paragraph.alignment = alignment
 
+def _draft_figure_size(src: str) -> tuple[int, int] | None:
+    # Pixel size from the image header, for figures that need no download.
     try:
-        width_cm = max(1.0, float(config.figure_style.max_width_cm))
+        if src.startswith("data:image"):
+            image = DocxImage.from_blob(base64.b64decode(src.split(",", 1)[1]))
+            return image.px_width, image.px_height
+        parsed = urlparse(src)
+        if parsed.scheme in {"http", "https"}:
+            return None
+        return _image_size(unquote(parsed.path) if parsed.scheme == "file" else src)
     except Exception:
-        width_cm = 14.0
+        return None
+
+
+def _draft_figure_xml(src: str, ctx: _RenderContext, block_width: int) -> str:
+    # A bordered box as large as the embedded picture would be. Remote
+    # figures are not downloaded in draft mode and get a 4:3 box.
+    width = Cm(_figure_width_cm(ctx.config))
+    size = _draft_figure_size(src)
+    height = Emu(round(width * size[1] / size[0]) if size else round(width * DRAFT_FIGURE_ASPECT))
+    spare = max(0, Emu(block_width).twips - width.twips)
+    left = {"left": 0, "right": spare}.get(ctx.config.figure_style.align, spare // 2)
+    line = min(MAX_LINE_TWIPS, max(240, height.twips))
+    borders = "".join(
+        f'<w:{edge} w:val="single" w:sz="4" w:space="0" w:color="808080"/>'
+        for edge in ("top", "left", "bottom", "right")
+    )
+    return (
+        f"<w:p><w:pPr><w:pBdr>{borders}</w:pBdr>"
+        f'<w:spacing w:before="0" w:after="0" w:line="{line}" w:lineRule="exact"/>'
+        f'<w:ind w:left="{left}" w:right="{spare - left}" w:firstLine="0"/><w:jc w:val="center"/></w:pPr>'
+        "<w:r><w:t>[图片]</w:t></w:r></w:p>"
+    )
+
 
-    picture_paragraph.add_run().add_picture(source, width=Cm(width_cm))
+def _add_figure(doc, node: Node, ctx: _RenderContext) -> None:
+    config = ctx.config
+    figure_index = ctx.figure_index
+    src = str(node.get("src", "")).strip()
+    linked = None if ctx.options.draft else _linked_figure(src, ctx)
+
+    if ctx.options.draft:
+        placeholder = parse_xml(_with_namespace(_draft_figure_xml(src, ctx, doc._block_width)))
+        doc.element.body.sectPr.addprevious(placeholder)
+    elif linked is not None:
+        part = doc.part
+        inline = _linked_picture_inline(part, part.next_id, *linked, _figure_width_cm(config))
+        _add_paragraph(doc, ctx, "figure").add_run()._r.add_drawing(inline)
+    else:
+        source = ctx.watchdog.run("figures", _load_figure, src, ctx, fallback=lambda: None, detail=src)
+        if source is None:
+            fallback = _add_paragraph(doc, ctx, "figure")
+            fallback.add_run(f"[图片加载失败] {src}" if src else "[图片加载失败]")
+            return
+        picture_paragraph = _add_paragraph(doc, ctx, "figure")
+        picture_paragraph.add_run().add_picture(source, width=Cm(_figure_width_cm(config)))
 
     caption_text = str(node.get("caption") or node.get("alt") or "").strip()
     if caption_text:
@@ -305,9 +624,8 @@ def _add_figure(doc, node: Node, config: FormatConfig, figure_index: int) -> int
     else:
         caption = f"图 {figure_index}"
 
-    caption_paragraph = doc.add_paragraph(caption)
-    caption_paragraph.alignment = alignment
-    return figure_index + 1
+    _add_paragraph(doc, ctx, "caption").add_run(caption)
+    ctx.figure_index = figure_index + 1
 
 
 def _list_style_name(ordered: bool, level: int) -> str:
@@ -318,79 +636,59 @@ def _list_style_name(ordered: bool, level: int) -> str:
     return f"{base} {level_suffix}"
 
 
-def _add_math_block(paragraph, latex: str, center_tab: int, right_tab: int) -> None:
-    paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
-    _apply_equation_tabs(paragraph, center_tab, right_tab)
+def _add_math_block(paragraph, latex: str, ctx: _RenderContext) -> None:
     paragraph.add_run("\t")
-    _add_math_run(paragraph, latex)
+    _add_math_run(paragraph, latex, ctx)
     paragraph.add_run("\t")
-    _add_equation_number_field(paragraph)
+    _add_equation_number_field(paragraph, ctx)
 
 
-def _add_list(
-    doc,
-    node: Node,
-    config: FormatConfig,
-    center_tab: int,
-    right_tab: int,
-    figure_state: dict[str, int],
-) -> None:
+def _add_list(doc, node: Node, ctx: _RenderContext) -> None:
+    level = node.get("level", 1)
+    ordered = node.get("ordered", False)
     for item in node.get("items", []):
         for child in item:
             if child.get("type") == "paragraph":
-                style_name = _list_style_name(node.get("ordered", False), node.get("level", 1))
-                paragraph = doc.add_paragraph("", style=style_name)
+                paragraph = _add_paragraph(doc, ctx, "list", level, ordered)
                 runs = child.get("runs", [])
                 fallback_text = child.get("text", "")
                 if child.get("task"):
                     paragraph.add_run("☑ " if child.get("checked") else "☐ ")
                     runs = _trim_leading_text_runs(runs)
                     fallback_text = fallback_text.lstrip()
-                _add_runs(paragraph, runs, fallback_text)
-                _apply_list_indents(paragraph, node.get("level", 1))
+                _add_runs(paragraph, runs, ctx, fallback_text, "list")
             elif child.get("type") == "list":
-                _add_list(doc, child, config, center_tab, right_tab, figure_state)
+                _add_list(doc, child, ctx)
             elif child.get("type") == "math_block":
-                paragraph = doc.add_paragraph("", style=_list_style_name(node.get("ordered", False), node.get("level", 1)))
-                _add_math_block(paragraph, child.get("latex", ""), center_tab, right_tab)
-                _apply_list_indents(paragraph, node.get("level", 1))
+                paragraph = _add_paragraph(doc, ctx, "list_math", level, ordered)
+                _add_math_block(paragraph, child.get("latex", ""), ctx)
             elif child.get("type") == "table":
-                _add_table(doc, child)
+                _add_table(doc, child, ctx)
             elif child.get("type") == "code_block":
-                _add_code_block(doc, child)
+                _add_code_block(doc, child, ctx)
             elif child.get("type") == "figure":
-                figure_state["index"] = _add_figure(doc, child, config, figure_state["index"])
+                _add_figure(doc, child, ctx)
 
 
-def _add_blockquote(
-    doc,
-    node: Node,
-    config: FormatConfig,
-    center_tab: int,
-    right_tab: int,
-    figure_state: dict[str, int],
-) -> None:
+def _add_blockquote(doc, node: Node, ctx: _RenderContext) -> None:
     for child in node.get("children", []):
         if child.get("type") == "paragraph":
-            paragraph = doc.add_paragraph("")
-            _add_runs(paragraph, child.get("runs", []), child.get("text", ""))
-            paragraph.paragraph_format.left_indent = Pt(21)
-            paragraph.paragraph_format.first_line_indent = Pt(0)
+            paragraph = _add_paragraph(doc, ctx, "quote")
+            _add_runs(paragraph, child.get("runs", []), ctx, child.get("text", ""), "quote")
             for run in paragraph.runs:
                 if run.italic is None:
                     run.italic = True
         elif child.get("type") == "list":
-            _add_list(doc, child, config, center_tab, right_tab, figure_state)
+            _add_list(doc, child, ctx)
         elif child.get("type") == "table":
-            _add_table(doc, child)
+            _add_table(doc, child, ctx)
         elif child.get("type") == "math_block":
-            paragraph = doc.add_paragraph("")
-            _add_math_block(paragraph, child.get("latex", ""), center_tab, right_tab)
-            paragraph.paragraph_format.left_indent = Pt(21)
+            paragraph = _add_paragraph(doc, ctx, "quote_math")
+            _add_math_block(paragraph, child.get("latex", ""), ctx)
         elif child.get("type") == "code_block":
-            _add_code_block(doc, child)
+            _add_code_block(doc, child, ctx)
         elif child.get("type") == "figure":
-            figure_state["index"] = _add_figure(doc, child, config, figure_state["index"])
+            _add_figure(doc, child, ctx)
 
 
 def _cell_alignment(align: str):
@@ -442,12 +740,26 @@ def _apply_header_bottom_border(row) -> None:
         tc_borders.append(bottom)
 
 
-def _add_table(doc, node: Node) -> None:
+def _cell_prototypes(col_width: int, ctx: _RenderContext):
+    # One shared skeleton per table: the filled cell carries the centred,
+    # unindented paragraph (and the empty run `cell.text = ""` used to leave).
+    tc_pr = f'<w:tcPr><w:tcW w:type="dxa" w:w="{Emu(col_width).twips}"/></w:tcPr>'
+    filled = parse_xml(
+        f"<w:tc {nsdecls('w')}>{tc_pr}<w:p>{ctx.fragments.paragraph_xml('cell')}<w:r/></w:p></w:tc>"
+    )
+    empty = parse_xml(f"<w:tc {nsdecls('w')}>{tc_pr}<w:p/></w:tc>")
+    return filled, empty
+
+
+def _add_table(doc, node: Node, ctx: _RenderContext) -> None:
     header = node.get("header", [])
     rows = node.get("rows", [])
     if not header:
         return
-    table = doc.add_table(rows=1 + len(rows), cols=len(header))
+    cols = len(header)
+    # Rows are appended to the bare table in one pass instead of going
+    # through table.cell(), which rescans every cell on each call.
+    table = doc.add_table(rows=0, cols=cols)
     # Avoid built-in styles that reintroduce vertical borders
     try:
         table.style = None
@@ -455,38 +767,119 @@ def _add_table(doc, node: Node) -> None:
         table.style = "Table Grid"
     _apply_three_line_table(table)
 
-    all_rows = [header] + rows
-    for r_idx, row in enumerate(all_rows):
-        for c_idx, cell in enumerate(row):
-            cell_obj = table.cell(r_idx, c_idx)
-            cell_obj.text = ""
-            paragraph = cell_obj.paragraphs[0]
+    filled_tc, empty_tc = _cell_prototypes(doc._block_width // cols, ctx)
+    tbl = table._tbl
+    for row in [header] + rows:
+        tr = OxmlElement("w:tr")
+        for c_idx in range(cols):
+            if c_idx >= len(row):
+                tr.append(copy.deepcopy(empty_tc))
+                continue
+            cell = row[c_idx]
+            tc = copy.deepcopy(filled_tc)
+            tr.append(tc)
             runs = _trim_leading_text_runs(cell.get("runs", []))
             fallback_text = (cell.get("text") or "").lstrip()
-            paragraph.paragraph_format.left_indent = Pt(0)
-            paragraph.paragraph_format.right_indent = Pt(0)
-            paragraph.paragraph_format.first_line_indent = Pt(0)
-            paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-            _add_runs(paragraph, runs, fallback_text)
-            paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-        if r_idx == 0:
-            _apply_header_bottom_border(table.rows[r_idx])
-
-
-def build_docx(ast: list[Node], output_path, config: FormatConfig | None = None) -> None:
-    config = config or FormatConfig()
-    doc = Document()
-
-    section = doc.sections[0]
-    section.top_margin = Cm(2.54)
-    section.bottom_margin = Cm(2.54)
-    section.left_margin = Cm(3.18)
-    section.right_margin = Cm(3.18)
+            _add_runs(Paragraph(tc[-1], table), runs, ctx, fallback_text, "cell")
+        tbl.append(tr)
+    if not ctx.options.draft:
+        _apply_header_bottom_border(table.rows[0])
+
+
+def _add_inherited_styles(doc, config: FormatConfig) -> None:
+    # Paragraph styles resolving to the same formatting the direct-formatting
+    # export writes on every paragraph of the corresponding kind.
+    styles = doc.styles
+    normal = styles["Normal"]
+
+    def _paragraph_style(kind: str, base=normal):
+        style = styles.add_style(INHERITED_STYLES[kind], WD_STYLE_TYPE.PARAGRAPH)
+        style.base_style = base
+        return style
+
+    cell = _paragraph_style("cell").paragraph_format
+    cell.left_indent = Pt(0)
+    cell.right_indent = Pt(0)
+    cell.first_line_indent = Pt(0)
+    cell.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+
+    figure = _paragraph_style("figure")
+    figure.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.from_xml(
+        _ALIGNMENTS.get(config.figure_style.align, "center")
+    )
+    _paragraph_style("caption", figure)
+
+    quote = _paragraph_style("quote").paragraph_format
+    quote.left_indent = Pt(21)
+    quote.first_line_indent = Pt(0)
+
+    center_tab, right_tab = _equation_tab_stops(doc)
+    equation = _paragraph_style("math").paragraph_format
+    equation.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
+    equation.tab_stops.add_tab_stop(Twips(center_tab), WD_TAB_ALIGNMENT.CENTER)
+    equation.tab_stops.add_tab_stop(Twips(right_tab), WD_TAB_ALIGNMENT.RIGHT)
+
+    code = _paragraph_style("code")
+    # w:shd precedes the spacing/indent/alignment elements added below.
+    code.element.get_or_add_pPr().append(
+        parse_xml(f'<w:shd {nsdecls("w")} w:val="clear" w:color="auto" w:fill="F2F2F2"/>')
+    )
+    code_format = code.paragraph_format
+    code_format.line_spacing = 1.0
+    code_format.space_before = Pt(0)
+    code_format.space_after = Pt(0)
+    code_format.first_line_indent = Pt(0)
+    code_format.left_indent = Cm(0.5)
+    code_format.right_indent = Cm(0.5)
+    code_format.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
+    code.font.name = "Consolas"
+    code.font.size = Pt(10)
+
+
+@lru_cache(maxsize=1)
+def _default_styles():
+    return Document().styles.element
+
+
+def _open_reference(reference: bytes):
+    # Keeps the reference document's page setup, headers/footers, theme and
+    # styles, drops its content, and adds the styles the export relies on
+    # (headings, lists, Title, ...) from python-docx's default template when
+    # the reference does not define them.
+    doc = Document(io.BytesIO(reference))
+    body = doc.element.body
+    for child in list(body):
+        if child.tag != qn("w:sectPr"):
+            body.remove(child)
+
+    styles = doc.styles.element
+    names = {style.name_val for style in styles.style_lst}
+    ids = {style.styleId for style in styles.style_lst}
+    for style in _default_styles().style_lst:
+        if style.name_val not in names and style.styleId not in ids:
+            styles.append(copy.deepcopy(style))
+    return doc
+
+
+def _new_styled_document(config: FormatConfig, reference: bytes | None = None):
+    if reference is None:
+        doc = Document()
+        section = doc.sections[0]
+        section.top_margin = Cm(2.54)
+        section.bottom_margin = Cm(2.54)
+        section.left_margin = Cm(3.18)
+        section.right_margin = Cm(3.18)
+    else:
+        doc = _open_reference(reference)
+        section = doc.sections[0]
 
+    styled = True
     try:
-        _add_page_number(section, config.page_num_position)
+        # A reference document's own footer is kept as is.
+        if reference is None or section.footer.is_linked_to_previous:
+            _add_page_number(section, config.page_num_position)
     except Exception:
-        pass
+        styled = False
 
     try:
         normal = doc.styles["Normal"]
@@ -525,51 +918,178 @@ def build_docx(ast: list[Node], output_path, config: FormatConfig | None = None)
                 hstyle.para_after_lines,
             )
     except Exception:
-        pass
+        styled = False
+
+    return doc, styled
+
 
+def _equation_tab_stops(doc) -> tuple[int, int]:
+    section = doc.sections[0]
     page_width = section.page_width
     left_margin = section.left_margin
     right_margin = section.right_margin
     if page_width and left_margin and right_margin:
         usable_width = page_width - left_margin - right_margin
         right_tab = int(getattr(usable_width, "twips", 9350))
-        center_tab = int(right_tab / 2)
-    else:
-        right_tab = 9350
-        center_tab = 4675
+        return int(right_tab / 2), right_tab
+    return 4675, 9350
+
+
+def _pin_core_properties(doc) -> None:
+    properties = doc.core_properties
+    timestamp = deterministic_timestamp().replace(tzinfo=None)
+    properties.created = timestamp
+    properties.modified = timestamp
+    properties.last_modified_by = ""
+    properties.revision = 1
+
+
+def _package_timestamp(options: ExportOptions):
+    return deterministic_timestamp() if options.deterministic else None
+
+
+def _prepare_document(
+    config: FormatConfig,
+    options: ExportOptions,
+    math_omml: Mapping[str, str | None],
+    figures: Mapping[str, bytes | FigureHeader | None],
+    watchdog: StageWatchdog,
+):
+    def _template():
+        # The reference document is only read and parsed on a cache miss.
+        reference = read_template(options.template_id) if options.template_id else None
+        doc, styled = _new_styled_document(config, reference)
+        if styled and options.inherit_styles:
+            try:
+                _add_inherited_styles(doc, config)
+            except Exception:
+                styled = False
+        return doc, styled
+
+    key = config_fingerprint(config)
+    if options.inherit_styles:
+        # The custom paragraph styles live in the template, so these exports
+        # get their own cache entry.
+        key += ":inherit-styles"
+    if options.template_id:
+        key += f":template:{options.template_id}"
+    doc = clone_styled_template(key, _template)
+    if options.deterministic:
+        _pin_core_properties(doc)
+    # A partially styled template lacks the custom styles; fall back to
+    # direct formatting rather than dropping it.
+    inherit = options.inherit_styles and all(name in doc.styles for name in INHERITED_STYLES.values())
+    center_tab, right_tab = _equation_tab_stops(doc)
+    ctx = _RenderContext(
+        config=config,
+        center_tab=center_tab,
+        right_tab=right_tab,
+        options=options,
+        math_omml=math_omml,
+        figures=figures,
+        watchdog=watchdog,
+        fragments=_PropertyFragments(doc, config, center_tab, right_tab, inherit),
+    )
+    return doc, ctx
+
+
+def _add_block(doc, node: Node, ctx: _RenderContext) -> None:
+    if node.get("type") == "heading":
+        paragraph = _add_paragraph(doc, ctx, "heading", node.get("level", 1))
+        _add_runs(paragraph, node.get("runs", []), ctx, node.get("text", ""), "heading")
+    elif node.get("type") == "paragraph":
+        paragraph = _add_paragraph(doc, ctx, "body")
+        _add_runs(paragraph, node.get("runs", []), ctx, node.get("text", ""))
+    elif node.get("type") == "list":
+        _add_list(doc, node, ctx)
+    elif node.get("type") == "table":
+        _add_table(doc, node, ctx)
+    elif node.get("type") == "math_block":
+        paragraph = _add_paragraph(doc, ctx, "math")
+        _add_math_block(paragraph, node.get("latex", ""), ctx)
+    elif node.get("type") == "code_block":
+        _add_code_block(doc, node, ctx)
+    elif node.get("type") == "blockquote":
+        _add_blockquote(doc, node, ctx)
+    elif node.get("type") == "figure":
+        _add_figure(doc, node, ctx)
+
+
+def _fragment_context(doc, ctx: _RenderContext, backend: str) -> tuple[Any, ...]:
+    # Table grids, draft figures and equation tab stops depend on the page
+    # geometry, which a reference template can change.
+    options = ctx.options
+    return (
+        backend,
+        config_fingerprint(ctx.config),
+        ctx.fragments.inherit,
+        options.resolve_equation_numbers,
+        options.draft,
+        options.template_id,
+        doc._block_width,
+        ctx.center_tab,
+        ctx.right_tab,
+    )
 
-    figure_state = {"index": 1}
+
+def _block_key(node: Node, ctx: _RenderContext, context: tuple[Any, ...]) -> str | None:
+    # Resolved equation numbers depend on where the block starts counting.
+    start = ctx.equation_index if ctx.options.resolve_equation_numbers else None
+    return block_key(node, (*context, start), ctx.math_omml)
+
+
+def build_docx(
+    ast: list[Node],
+    output_path,
+    config: FormatConfig | None = None,
+    *,
+    math_omml: Mapping[str, str | None] | None = None,
+    figures: Mapping[str, bytes | FigureHeader | None] | None = None,
+    watchdog: StageWatchdog | None = None,
+    options: ExportOptions | None = None,
+) -> None:
+    config = config or FormatConfig()
+    options = options or ExportOptions()
+    watchdog = watchdog or StageWatchdog()
+    if options.draft:
+        # Formulas are written as LaTeX and figures as placeholders.
+        math_omml, figures = {}, {}
+    if math_omml is None:
+        math_omml = convert_math_batch(collect_math_latex(ast), watchdog=watchdog)
+    if figures is None:
+        figures = prefetch_figures(ast, watchdog=watchdog, link_min_bytes=options.link_figures_min_bytes)
+    if options.backend == "streaming":
+        # Imported here: the streaming writer reuses this module's helpers.
+        from formatter.ooxml_writer import write_docx_streaming
+
+        write_docx_streaming(
+            ast, output_path, config, math_omml=math_omml, figures=figures, watchdog=watchdog, options=options
+        )
+        return
+    doc, ctx = _prepare_document(config, options, math_omml, figures, watchdog)
+    cache = get_fragment_cache()
+    context = _fragment_context(doc, ctx, "python-docx")
+    body = doc.element.body
+    section = body.sectPr
 
     for node in ast:
-        if node.get("type") == "heading":
-            paragraph = doc.add_heading("", level=node.get("level", 1))
-            _add_runs(paragraph, node.get("runs", []), node.get("text", ""))
-        elif node.get("type") == "paragraph":
-            paragraph = doc.add_paragraph("")
-            _add_runs(paragraph, node.get("runs", []), node.get("text", ""))
-            if config.body_style.justify:
-                paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.JUSTIFY
-            paragraph.paragraph_format.left_indent = _chars_to_pt(
-                config.body_style.indent_before_chars, config.body_style.size_pt
-            )
-            paragraph.paragraph_format.right_indent = _chars_to_pt(
-                config.body_style.indent_after_chars, config.body_style.size_pt
-            )
-            paragraph.paragraph_format.first_line_indent = _chars_to_pt(
-                config.body_style.first_line_indent_chars, config.body_style.size_pt
-            )
-        elif node.get("type") == "list":
-            _add_list(doc, node, config, center_tab, right_tab, figure_state)
-        elif node.get("type") == "table":
-            _add_table(doc, node)
-        elif node.get("type") == "math_block":
-            paragraph = doc.add_paragraph("")
-            _add_math_block(paragraph, node.get("latex", ""), center_tab, right_tab)
-        elif node.get("type") == "code_block":
-            _add_code_block(doc, node)
-        elif node.get("type") == "blockquote":
-            _add_blockquote(doc, node, config, center_tab, right_tab, figure_state)
-        elif node.get("type") == "figure":
-            figure_state["index"] = _add_figure(doc, node, config, figure_state["index"])
-
-    doc.save(output_path)
+        key = _block_key(node, ctx, context) if cache is not None else None
+        cached = cache.get(key) if key is not None else None
+        if cached is not None:
+            markup, equations = cached
+            for element in list(parse_xml(f"<w:body {nsdecls('w')}>{markup}</w:body>")):
+                section.addprevious(element)
+            ctx.equation_index += equations
+            continue
+        start, equation_index = len(body) - 1, ctx.equation_index
+        _add_block(doc, node, ctx)
+        if key is not None:
+            markup = "".join(etree.tostring(element, encoding="unicode") for element in body[start:-1])
+            cache.put(key, markup, ctx.equation_index - equation_index)
+
+    compression = resolve_compression(options.compression)
+    if compression == ZipCompression() and not options.deterministic:
+        watchdog.measure("save", doc.save, output_path)
+    else:
+        save = partial(write_package, compression=compression, timestamp=_package_timestamp(options))
+        watchdog.measure("save", save, doc.part.package, output_path)
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import os
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import IO
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.pkgwriter import _ContentTypesItem
+
+PartWriter = Callable[[IO[bytes]], None]
+
+# Zip timestamps cannot predate 1980.
+ZIP_EPOCH = datetime(1980, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass(frozen=True)
+class ZipCompression:
+    # zlib levels for XML parts (including .rels) and for everything else,
+    # i.e. media that is usually compressed already. 0 stores the entry
+    # and None uses zlib's default level, as python-docx does.
+    xml_level: int | None = None
+    media_level: int | None = None
+
+
+COMPRESSION_PROFILES: dict[str, ZipCompression] = {
+    "default": ZipCompression(),
+    # Interactive previews: cheap XML deflate, media stored.
+    "fast": ZipCompression(xml_level=1, media_level=0),
+    "balanced": ZipCompression(xml_level=6, media_level=0),
+    "small": ZipCompression(xml_level=9, media_level=0),
+}
+
+
+def resolve_compression(name: str | None = None) -> ZipCompression:
+    # An explicit profile name wins over FORMATTER_ZIP_COMPRESSION; an
+    # unknown name in the environment falls back to the default profile.
+    if name:
+        if name not in COMPRESSION_PROFILES:
+            raise ValueError(f"unknown zip compression profile: {name}")
+        return COMPRESSION_PROFILES[name]
+    configured = (os.getenv("FORMATTER_ZIP_COMPRESSION") or "").strip().lower()
+    return COMPRESSION_PROFILES.get(configured, COMPRESSION_PROFILES["default"])
+
+
+def deterministic_timestamp() -> datetime:
+    # SOURCE_DATE_EPOCH, as used for reproducible builds, or the zip epoch.
+    configured = os.getenv("SOURCE_DATE_EPOCH")
+    if not configured:
+        return ZIP_EPOCH
+    try:
+        return max(datetime.fromtimestamp(int(configured), timezone.utc), ZIP_EPOCH)
+    except (ValueError, OverflowError, OSError):
+        return ZIP_EPOCH
+
+
+def _select_compression(archive: ZipFile, membername: str, compression: ZipCompression) -> None:
+    # ZipFile.open/writestr take the archive's settings for new entries.
+    level = compression.xml_level if membername.endswith((".xml", ".rels")) else compression.media_level
+    archive.compression = ZIP_STORED if level == 0 else ZIP_DEFLATED
+    archive.compresslevel = None if level == 0 else level
+
+
+def zip_entry(archive: ZipFile, membername: str, timestamp: datetime | None) -> str | ZipInfo:
+    if timestamp is None:
+        return membername
+    # Pin everything ZipFile would otherwise take from the clock or the
+    # platform, so the bytes only depend on the content.
+    info = ZipInfo(membername, date_time=timestamp.astimezone(timezone.utc).timetuple()[:6])
+    info.create_system = 3
+    info.external_attr = 0o600 << 16
+    info.compress_type = archive.compression
+    # Same attribute ZipFile.open() sets for entries given by name.
+    info._compresslevel = archive.compresslevel
+    return info
+
+
+def write_package(
+    package,
+    output,
+    *,
+    streamed: Mapping[object, PartWriter] | None = None,
+    compression: ZipCompression | None = None,
+    timestamp: datetime | None = None,
+) -> None:
+    # Same layout as python-docx's PackageWriter, except that parts listed in
+    # `streamed` are written straight into their zip entry by a callback.
+    # Streamed parts go first: they may add parts (e.g. images) to the package.
+    # With `timestamp`, every entry carries that time and fixed attributes.
+    streamed = streamed or {}
+    compression = compression or ZipCompression()
+    with ZipFile(output, "w", compression=ZIP_DEFLATED) as archive:
+
+        def _write(membername: str, data: bytes) -> None:
+            _select_compression(archive, membername, compression)
+            archive.writestr(zip_entry(archive, membername, timestamp), data)
+
+        for part, writer in streamed.items():
+            _select_compression(archive, part.partname.membername, compression)
+            with archive.open(zip_entry(archive, part.partname.membername, timestamp), "w") as stream:
+                writer(stream)
+
+        parts = list(package.iter_parts())
+        for part in parts:
+            part.before_marshal()
+        _write(CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(parts).blob)
+        _write(PACKAGE_URI.rels_uri.membername, package.rels.xml)
+        for part in parts:
+            if part not in streamed:
+                _write(part.partname.membername, part.blob)
+            if len(part.rels):
+                _write(part.partname.rels_uri.membername, part.rels.xml)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import copy
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable
+
+from docx.opc.part import XmlPart
+from docx.parts.styles import StylesPart
+
+TEMPLATE_CACHE_SIZE = 8
+
+
+class _FrozenStylesPart(StylesPart):
+    # styles.xml is by far the largest part of the template (~350 KB) and is
+    # never modified after template setup, so clones share the element and
+    # its serialized form instead of copying and re-serializing it per export.
+    # Exports only look styles up; anything that adds or changes a style
+    # belongs in the template factory.
+    def __init__(self, partname, content_type, element, package, blob: bytes) -> None:
+        super().__init__(partname, content_type, element, package)
+        self._frozen_blob = blob
+
+    @property
+    def blob(self) -> bytes:
+        return self._frozen_blob
+
+
+class _StyledTemplate:
+    def __init__(self, document) -> None:
+        self.package = document.part.package
+        self.parts = list(self.package.iter_parts())
+        self.styles_blob: dict[str, bytes] = {
+            str(part.partname): part.blob for part in self.parts if isinstance(part, StylesPart)
+        }
+
+    def clone(self):
+        package = type(self.package)()
+        clones = {}
+        for part in self.parts:
+            partname = str(part.partname)
+            if partname in self.styles_blob:
+                clone = _FrozenStylesPart(
+                    part.partname, part.content_type, part.element, package, self.styles_blob[partname]
+                )
+            elif isinstance(part, XmlPart):
+                clone = type(part)(part.partname, part.content_type, copy.deepcopy(part.element), package)
+            else:
+                clone = type(part).load(part.partname, part.content_type, part.blob, package)
+            clones[partname] = clone
+
+        def _target(rel):
+            return rel.target_ref if rel.is_external else clones[str(rel.target_part.partname)]
+
+        for rel in self.package.rels.values():
+            package.load_rel(rel.reltype, _target(rel), rel.rId, rel.is_external)
+        for part in self.parts:
+            clone = clones[str(part.partname)]
+            for rel in part.rels.values():
+                clone.load_rel(rel.reltype, _target(rel), rel.rId, rel.is_external)
+        for clone in clones.values():
+            clone.after_unmarshal()
+        package.after_unmarshal()
+        return package.main_document_part.document
+
+
+_TEMPLATES: OrderedDict[str, _StyledTemplate] = OrderedDict()
+_TEMPLATES_LOCK = Lock()
+
+
+def clone_styled_template(key: str, factory: Callable[[], tuple[object, bool]]):
+    # `factory` returns (document, cacheable); partially styled documents are
+    # used once but never cached.
+    with _TEMPLATES_LOCK:
+        template = _TEMPLATES.get(key)
+        if template is not None:
+            _TEMPLATES.move_to_end(key)
+    if template is None:
+        document, cacheable = factory()
+        if not cacheable:
+            return document
+        template = _StyledTemplate(document)
+        with _TEMPLATES_LOCK:
+            _TEMPLATES[key] = template
+            _TEMPLATES.move_to_end(key)
+            while len(_TEMPLATES) > TEMPLATE_CACHE_SIZE:
+                _TEMPLATES.popitem(last=False)
+    return template.clone()
+
+
+def clear_template_cache() -> None:
+    with _TEMPLATES_LOCK:
+        _TEMPLATES.clear()
@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import base64
+import http.client
+import socket
+import sqlite3
+import sys
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any
+from urllib.parse import SplitResult, unquote, urljoin, urlsplit, urlunsplit
+from urllib.request import getproxies, proxy_bypass
+
+from docx.image.image import Image as DocxImage
+
+from formatter.deadlines import StageWatchdog
+from formatter.image_cache import CachedImage, ImageCache, get_image_cache
+
+Node = dict[str, Any]
+
+FIGURE_FETCH_TIMEOUT = 8
+# Total time a document may spend downloading figures when no `figures`
+# stage budget is configured.
+FIGURE_PREFETCH_DEADLINE = 30.0
+MAX_FETCH_WORKERS = 8
+MAX_REDIRECTS = 5
+# A figure that is linked rather than embedded is read in steps of
+# FIGURE_HEADER_BYTES until its header gives the pixel size, or until
+# FIGURE_HEADER_MAX_BYTES (large EXIF, XMP or ICC blocks come first in JPEGs).
+FIGURE_HEADER_BYTES = 64 * 1024
+FIGURE_HEADER_MAX_BYTES = 1024 * 1024
+
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+_USER_AGENT = "Python-urllib/%d.%d" % sys.version_info[:2]
+
+
+@dataclass(frozen=True)
+class FigureHeader:
+    # The start of a remote figure whose Content-Length reached the link
+    # threshold; the rest was not downloaded. `size` is the pixel size, None
+    # when it was not found within FIGURE_HEADER_MAX_BYTES.
+    data: bytes
+    size: tuple[int, int] | None
+
+
+def _pixel_size(data: bytes) -> tuple[int, int] | None:
+    try:
+        image = DocxImage.from_blob(data)
+    except Exception:
+        return None
+    return image.px_width, image.px_height
+
+
+def _read_header(response: http.client.HTTPResponse) -> FigureHeader:
+    data = b""
+    while len(data) < FIGURE_HEADER_MAX_BYTES:
+        chunk = response.read(FIGURE_HEADER_BYTES)
+        if not chunk:
+            break
+        data += chunk
+        size = _pixel_size(data)
+        if size is not None:
+            return FigureHeader(data, size)
+    return FigureHeader(data, None)
+
+
+def is_remote_source(src: str) -> bool:
+    return urlsplit(src).scheme in {"http", "https"}
+
+
+def _collect_from_nodes(nodes: Iterable[Node], found: dict[str, None]) -> None:
+    for node in nodes:
+        ntype = node.get("type")
+        if ntype == "figure":
+            src = str(node.get("src", "")).strip()
+            if src:
+                found.setdefault(src, None)
+        elif ntype == "list":
+            for item in node.get("items", []):
+                _collect_from_nodes(item, found)
+        elif ntype == "blockquote":
+            _collect_from_nodes(node.get("children", []), found)
+
+
+def collect_figure_sources(ast: list[Node]) -> list[str]:
+    found: dict[str, None] = {}
+    _collect_from_nodes(ast, found)
+    return list(found)
+
+
+def _proxy_authorization(proxy: SplitResult) -> dict[str, str]:
+    if proxy.username is None:
+        return {}
+    credentials = f"{unquote(proxy.username)}:{unquote(proxy.password or '')}".encode("utf-8")
+    return {"Proxy-Authorization": "Basic " + base64.b64encode(credentials).decode("ascii")}
+
+
+class _ConnectionPool:
+    # Idle keep-alive connections per (scheme, host:port). A connection is
+    # only ever used by one thread at a time. Proxies come from the
+    # environment as for urlopen (HTTP_PROXY, HTTPS_PROXY, NO_PROXY): https
+    # is tunnelled with CONNECT, http is forwarded.
+    def __init__(self, timeout: float) -> None:
+        self._timeout = timeout
+        self._proxies = getproxies()
+        self._idle: dict[tuple[str, str], list[http.client.HTTPConnection]] = {}
+        self._open: set[http.client.HTTPConnection] = set()
+        self._closed = False
+        self._lock = Lock()
+
+    def proxy(self, key: tuple[str, str]) -> SplitResult | None:
+        scheme, netloc = key
+        proxy = self._proxies.get(scheme)
+        if not proxy or proxy_bypass(netloc):
+            return None
+        return urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+
+    def acquire(self, key: tuple[str, str]) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self._closed:
+                raise OSError("connection pool is closed")
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, netloc = key
+        factory = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        proxy = self.proxy(key)
+        if proxy is None:
+            connection = factory(netloc, timeout=self._timeout)
+        else:
+            connection = factory(proxy.hostname or "", proxy.port or 80, timeout=self._timeout)
+            if scheme == "https":
+                connection.set_tunnel(netloc, headers=_proxy_authorization(proxy))
+        with self._lock:
+            self._open.add(connection)
+        return connection, False
+
+    def release(self, key: tuple[str, str], connection: http.client.HTTPConnection, reusable: bool) -> None:
+        with self._lock:
+            if reusable and not self._closed:
+                self._idle.setdefault(key, []).append(connection)
+                return
+            self._open.discard(connection)
+        connection.close()
+
+    def close(self) -> None:
+        # Also interrupts downloads still in flight once the deadline passed.
+        with self._lock:
+            self._closed = True
+            connections = list(self._open)
+            self._open.clear()
+            self._idle.clear()
+        for connection in connections:
+            sock = connection.sock
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            connection.close()
+
+
+def _content_length(headers: http.client.HTTPMessage) -> int | None:
+    try:
+        return int(headers.get("Content-Length", ""))
+    except ValueError:
+        return None
+
+
+def _request(
+    pool: _ConnectionPool, url: str, headers: dict[str, str] | None = None, link_min_bytes: int | None = None
+) -> tuple[int, http.client.HTTPMessage, bytes | FigureHeader]:
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    proxy = pool.proxy(key)
+    if proxy is not None and parts.scheme == "http":
+        # Forwarded through the proxy: the request names the full URL.
+        path = urlunsplit((parts.scheme, parts.netloc, parts.path or "/", parts.query, ""))
+        headers = {**_proxy_authorization(proxy), **(headers or {})}
+    while True:
+        connection, reused = pool.acquire(key)
+        reusable = False
+        try:
+            connection.request("GET", path, headers={"User-Agent": _USER_AGENT, **(headers or {})})
+            response = connection.getresponse()
+            length = _content_length(response.headers)
+            if (
+                link_min_bytes is not None
+                and 200 <= response.status < 300
+                and length is not None
+                and length >= link_min_bytes
+            ):
+                # The rest of the body is left unread, so the connection
+                # is not reused.
+                return response.status, response.headers, _read_header(response)
+            body = response.read()
+            reusable = not response.will_close
+            return response.status, response.headers, body
+        except (OSError, http.client.HTTPException):
+            # The server may have dropped an idle keep-alive connection.
+            if not reused:
+                raise
+        finally:
+            pool.release(key, connection, reusable)
+
+
+def _conditional_headers(cached: CachedImage | None) -> dict[str, str]:
+    headers = {}
+    if cached is not None and cached.etag:
+        headers["If-None-Match"] = cached.etag
+    if cached is not None and cached.last_modified:
+        headers["If-Modified-Since"] = cached.last_modified
+    return headers
+
+
+def _fetch(
+    pool: _ConnectionPool, src: str, cache: ImageCache | None = None, link_min_bytes: int | None = None
+) -> bytes | FigureHeader | None:
+    cached = None
+    if cache is not None:
+        try:
+            cached = cache.lookup(src)
+        except (sqlite3.Error, OSError):
+            cached = None
+    if cached is not None and cached.fresh:
+        return cached.data
+    url = src
+    headers = _conditional_headers(cached)
+    for _ in range(MAX_REDIRECTS + 1):
+        if not is_remote_source(url) or not urlsplit(url).hostname:
+            return None
+        try:
+            status, response_headers, body = _request(pool, url, headers, link_min_bytes)
+        except (OSError, http.client.HTTPException, ValueError):
+            return None
+        if status == 304 and cached is not None:
+            try:
+                cache.revalidated(src)
+            except (sqlite3.Error, OSError):
+                pass
+            return cached.data
+        location = response_headers.get("Location")
+        if status in _REDIRECT_STATUSES and location:
+            url = urljoin(url, location)
+            headers = {}
+            continue
+        if not 200 <= status < 300:
+            return None
+        if cache is not None and isinstance(body, bytes):
+            try:
+                cache.put(src, body, response_headers.get("ETag"), response_headers.get("Last-Modified"))
+            except (sqlite3.Error, OSError):
+                pass
+        return body
+    return None
+
+
+def fetch_remote_figures(
+    urls: Iterable[str],
+    *,
+    deadline: float = FIGURE_PREFETCH_DEADLINE,
+    max_workers: int = MAX_FETCH_WORKERS,
+    timeout: float = FIGURE_FETCH_TIMEOUT,
+    cache: ImageCache | None = None,
+    link_min_bytes: int | None = None,
+) -> dict[str, bytes | FigureHeader | None]:
+    # Downloads run concurrently and share connections per host; anything
+    # not finished within `deadline` seconds maps to None. Fresh entries in
+    # `cache` are served without touching the network, stale ones are
+    # revalidated with their ETag / Last-Modified. Responses whose
+    # Content-Length is at least `link_min_bytes` map to their FigureHeader.
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+    pool = _ConnectionPool(timeout)
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls))))
+    try:
+        futures = {url: executor.submit(_fetch, pool, url, cache, link_min_bytes) for url in urls}
+        done, _ = wait(futures.values(), timeout=max(0.0, deadline))
+    finally:
+        pool.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return {url: future.result() if future in done else None for url, future in futures.items()}
+
+
+def prefetch_figures(
+    ast: list[Node], *, watchdog: StageWatchdog | None = None, link_min_bytes: int | None = None
+) -> dict[str, bytes | FigureHeader | None]:
+    watchdog = watchdog or StageWatchdog()
+    urls = [src for src in collect_figure_sources(ast) if is_remote_source(src)]
+    if not urls:
+        return {}
+    remaining = watchdog.remaining("figures")
+    deadline = FIGURE_PREFETCH_DEADLINE if remaining is None else remaining
+    started = time.perf_counter()
+    fetched = fetch_remote_figures(urls, deadline=deadline, cache=get_image_cache(), link_min_bytes=link_min_bytes)
+    elapsed = time.perf_counter() - started
+    watchdog.charge("figures", elapsed)
+    if elapsed >= deadline:
+        missing = sum(1 for data in fetched.values() if data is None)
+        watchdog.report_overrun("figures", f"{missing} remote figures not downloaded in time")
+    return fetched
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from collections.abc import Mapping
+from threading import Lock
+from typing import Any
+
+from formatter.math_batch import collect_math_latex
+
+Node = dict[str, Any]
+
+DEFAULT_MAX_MB = 64
+
+
+class FragmentCache:
+    # Serialized body XML of top-level AST blocks, so re-exporting a document
+    # after a small edit only renders the blocks that changed. Each entry also
+    # records how many equations the block numbered.
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[str, int]] = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+    def get(self, key: str) -> tuple[str, int] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, markup: str, equations: int) -> None:
+        size = len(markup)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = (markup, equations)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_CACHES: dict[int, FragmentCache] = {}
+_CACHES_LOCK = Lock()
+
+
+def get_fragment_cache() -> FragmentCache | None:
+    configured = os.getenv("FORMATTER_FRAGMENT_CACHE_MB")
+    try:
+        max_bytes = int(float(configured) * 1024 * 1024) if configured else DEFAULT_MAX_MB * 1024 * 1024
+    except ValueError:
+        max_bytes = DEFAULT_MAX_MB * 1024 * 1024
+    if max_bytes <= 0:
+        return None
+    with _CACHES_LOCK:
+        cache = _CACHES.get(max_bytes)
+        if cache is None:
+            cache = _CACHES[max_bytes] = FragmentCache(max_bytes)
+        return cache
+
+
+def clear_fragment_cache() -> None:
+    with _CACHES_LOCK:
+        for cache in _CACHES.values():
+            cache.clear()
+
+
+def contains_figure(node: Node) -> bool:
+    ntype = node.get("type")
+    if ntype == "figure":
+        return True
+    if ntype == "list":
+        return any(contains_figure(child) for item in node.get("items", []) for child in item)
+    if ntype == "blockquote":
+        return any(contains_figure(child) for child in node.get("children", []))
+    return False
+
+
+def block_key(node: Node, context: tuple[Any, ...], math_omml: Mapping[str, str | None] | None) -> str | None:
+    # Figures add image parts and relationships to the package and advance
+    # the figure counter, so blocks containing them are always rendered.
+    # The key covers the formulas' OMML so degraded (plain-text) math is
+    # never reused once conversion succeeds.
+    if contains_figure(node):
+        return None
+    omml = [(latex, (math_omml or {}).get(latex)) for latex in collect_math_latex([node])]
+    payload = json.dumps([node, context, omml], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
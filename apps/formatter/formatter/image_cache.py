@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+_CACHES: dict[tuple[str, int, float], "ImageCache"] = {}
+_CACHES_LOCK = Lock()
+
+
+@dataclass
+class CachedImage:
+    data: bytes
+    etag: str | None
+    last_modified: str | None
+    fresh: bool
+
+
+class ImageCache:
+    # Image bytes are stored once per SHA-256 digest under `blobs/`; the
+    # index maps sources (a URL, the digest of a data: URI payload, or the
+    # key of a derived image) to blobs and keeps the HTTP validators needed
+    # to revalidate stale URLs.
+    def __init__(
+        self,
+        directory: str | os.PathLike[str],
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._lock = Lock()
+        self._blobs = self.directory / "blobs"
+        self._blobs.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.directory / "index.db", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS images (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS images_lru ON images (last_used)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sources (
+                key TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        self._clock = int(self._conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM images").fetchone()[0])
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def _stored_bytes(self) -> int:
+        # Read from the index rather than tracked in memory: other processes
+        # share the directory.
+        return int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0])
+
+    def _blob_path(self, digest: str) -> Path:
+        return self._blobs / digest[:2] / digest
+
+    @staticmethod
+    def _payload_key(payload: str) -> str:
+        return "data:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _read(self, key: str) -> tuple[bytes, str | None, str | None, float] | None:
+        row = self._conn.execute(
+            "SELECT digest, etag, last_modified, fetched_at FROM sources WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        digest = str(row[0])
+        try:
+            data = self._blob_path(digest).read_bytes()
+        except OSError:
+            # The blob was removed behind our back; forget the source.
+            self._conn.execute("DELETE FROM sources WHERE key = ?", (key,))
+            self._conn.commit()
+            return None
+        self._conn.execute("UPDATE images SET last_used = ? WHERE digest = ?", (self._tick(), digest))
+        self._conn.commit()
+        return data, row[1], row[2], float(row[3])
+
+    def _write(self, key: str, data: bytes, etag: str | None = None, last_modified: str | None = None) -> None:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            os.replace(tmp_name, path)
+        try:
+            cursor = self._conn.execute("UPDATE images SET last_used = ? WHERE digest = ?", (self._tick(), digest))
+            if cursor.rowcount == 0:
+                self._conn.execute(
+                    "INSERT INTO images (digest, size, last_used) VALUES (?, ?, ?)", (digest, len(data), self._tick())
+                )
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO sources (key, digest, etag, last_modified, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, digest, etag, last_modified, time.time()),
+            )
+            # The write transaction is open here, so the total cannot change
+            # under us while evicting.
+            self._evict()
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn.rollback()
+            raise
+
+    def _evict(self) -> None:
+        size = self._stored_bytes()
+        while size > self.max_bytes:
+            row = self._conn.execute("SELECT digest, size FROM images ORDER BY last_used ASC LIMIT 1").fetchone()
+            if row is None:
+                break
+            digest, blob_size = str(row[0]), int(row[1])
+            self._conn.execute("DELETE FROM images WHERE digest = ?", (digest,))
+            self._conn.execute("DELETE FROM sources WHERE digest = ?", (digest,))
+            try:
+                self._blob_path(digest).unlink()
+            except OSError:
+                pass
+            size -= blob_size
+            self.evictions += 1
+
+    def lookup(self, url: str) -> CachedImage | None:
+        # Stale entries are returned with their validators so the caller can
+        # revalidate them; they count as misses.
+        with self._lock:
+            entry = self._read("url:" + url)
+            if entry is None:
+                self.misses += 1
+                return None
+            data, etag, last_modified, fetched_at = entry
+            fresh = time.time() - fetched_at < self.ttl_seconds
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return CachedImage(data, etag, last_modified, fresh)
+
+    def revalidated(self, url: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE sources SET fetched_at = ? WHERE key = ?", (time.time(), "url:" + url))
+            self._conn.commit()
+            self.revalidations += 1
+
+    def put(self, url: str, data: bytes, etag: str | None = None, last_modified: str | None = None) -> None:
+        with self._lock:
+            self._write("url:" + url, data, etag, last_modified)
+
+    def get_payload(self, payload: str) -> bytes | None:
+        with self._lock:
+            entry = self._read(self._payload_key(payload))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put_payload(self, payload: str, data: bytes) -> None:
+        with self._lock:
+            self._write(self._payload_key(payload), data)
+
+    def get_derived(self, name: str) -> bytes | None:
+        # Images computed from other images (e.g. resampled figures), keyed by
+        # the source digest and the parameters used.
+        with self._lock:
+            entry = self._read("derived:" + name)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put_derived(self, name: str, data: bytes) -> None:
+        with self._lock:
+            self._write("derived:" + name, data)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "entries": int(entries),
+                "bytes": self._stored_bytes(),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def get_image_cache() -> ImageCache | None:
+    configured = os.getenv("IMAGE_CACHE_DIR")
+    if not configured:
+        return None
+    try:
+        max_bytes = int(os.getenv("IMAGE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    except ValueError:
+        max_bytes = DEFAULT_MAX_BYTES
+    try:
+        ttl_seconds = float(os.getenv("IMAGE_CACHE_TTL", DEFAULT_TTL_SECONDS))
+    except ValueError:
+        ttl_seconds = DEFAULT_TTL_SECONDS
+
+    cache_key = (configured, max_bytes, ttl_seconds)
+    with _CACHES_LOCK:
+        cache = _CACHES.get(cache_key)
+        if cache is None:
+            try:
+                cache = ImageCache(configured, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+            except (OSError, sqlite3.Error):
+                return None
+            _CACHES[cache_key] = cache
+        return cache
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import sqlite3
+from typing import IO
+
+from formatter.image_cache import get_image_cache
+
+JPEG_QUALITY = 85
+# Formats Word embeds that Pillow can re-encode without losing animation.
+_RESAMPLED_FORMATS = {"JPEG", "PNG", "BMP", "TIFF"}
+# Pillow only resizes these modes with nearest-neighbour sampling, so they
+# are converted to a mode LANCZOS applies to first.
+_SMOOTH_MODES = {"1": "L", "LA": "RGBA"}
+
+
+def target_width_px(width_cm: float, dpi: float) -> int:
+    return max(1, round(width_cm / 2.54 * dpi))
+
+
+def _read_source(source: str | os.PathLike[str] | IO[bytes]) -> bytes:
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as handle:
+            return handle.read()
+    source.seek(0)
+    return source.read()
+
+
+def downscale_image(data: bytes, width_px: int, dpi: float) -> bytes | None:
+    # Returns None when the image is kept as is: Pillow is not installed, the
+    # image is not wider than `width_px`, or re-encoding would not shrink it.
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+
+    try:
+        with Image.open(io.BytesIO(data)) as opened:
+            image_format = opened.format
+            if image_format not in _RESAMPLED_FORMATS:
+                return None
+            if image_format == "JPEG":
+                # Let the decoder scale by 1/2, 1/4 or 1/8 while keeping both
+                # sides at least `width_px`, whatever the EXIF rotation.
+                opened.draft(opened.mode, (width_px, width_px))
+            # Bake in the EXIF rotation so the width we fit is the displayed one.
+            image = ImageOps.exif_transpose(opened)
+            if image.width <= width_px:
+                return None
+            height = max(1, round(image.height * width_px / image.width))
+            palette = image.mode == "P"
+            if palette:
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            elif image.mode in _SMOOTH_MODES:
+                image = image.convert(_SMOOTH_MODES[image.mode])
+            resized = image.resize((width_px, height), Image.Resampling.LANCZOS)
+            out = io.BytesIO()
+            if image_format == "JPEG":
+                if resized.mode not in {"RGB", "L", "CMYK"}:
+                    resized = resized.convert("RGB")
+                resized.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True, dpi=(dpi, dpi))
+            else:
+                # BMP and TIFF are re-encoded as PNG, which Word handles and
+                # compresses far better. Palette images (screenshots, mostly)
+                # get a palette again, now including the smoothed edges.
+                if palette:
+                    resized = resized.quantize(256, method=Image.Quantize.FASTOCTREE)
+                resized.save(out, "PNG", optimize=True, dpi=(dpi, dpi))
+    except Exception:
+        return None
+
+    result = out.getvalue()
+    return result if len(result) < len(data) else None
+
+
+def fit_to_print_width(source: str | os.PathLike[str] | IO[bytes], width_cm: float, dpi: float):
+    # Resamples a figure to the pixel width it is printed at. Results are
+    # cached by source digest and target size when an image cache is
+    # configured; images that are kept unchanged are cached too, so they are
+    # not decoded again on the next export.
+    try:
+        data = _read_source(source)
+    except OSError:
+        return source
+
+    width_px = target_width_px(width_cm, dpi)
+    cache = get_image_cache()
+    cache_key = f"{hashlib.sha256(data).hexdigest()}:{width_px}:{dpi:g}:{JPEG_QUALITY}"
+    if cache is not None:
+        try:
+            cached = cache.get_derived(cache_key)
+        except (sqlite3.Error, OSError):
+            cached = None
+        if cached is not None:
+            return io.BytesIO(cached)
+
+    resampled = downscale_image(data, width_px, dpi)
+    if cache is not None:
+        try:
+            cache.put_derived(cache_key, resampled if resampled is not None else data)
+        except (sqlite3.Error, OSError):
+            pass
+    return io.BytesIO(resampled) if resampled is not None else io.BytesIO(data)
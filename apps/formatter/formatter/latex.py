@@ -1,17 +1,71 @@
 from __future__ import annotations
 
 import re
+import sqlite3
 from xml.sax.saxutils import escape
 
 from latex2mathml.converter import convert as latex_to_mathml
 from mathml2omml import convert as mathml_to_omml
 
+from formatter.omml_cache import get_omml_cache
+
 MATHML_NS = "http://www.w3.org/1998/Math/MathML"
 OMML_NS = "http://schemas.openxmlformats.org/officeDocument/2006/math"
 ALIGNED_PATTERN = re.compile(
     r"\\begin\{(?P<env>aligned|align\*?)\}(?P<body>.*?)\\end\{(?P=env)\}",
     re.DOTALL,
 )
+GREEK_LETTERS = {
+    "alpha": "α",
+    "beta": "β",
+    "gamma": "γ",
+    "delta": "δ",
+    "epsilon": "ϵ",
+    "varepsilon": "ε",
+    "zeta": "ζ",
+    "eta": "η",
+    "theta": "θ",
+    "vartheta": "ϑ",
+    "iota": "ι",
+    "kappa": "κ",
+    "lambda": "λ",
+    "mu": "μ",
+    "nu": "ν",
+    "xi": "ξ",
+    "pi": "π",
+    "varpi": "ϖ",
+    "rho": "ρ",
+    "varrho": "ϱ",
+    "sigma": "σ",
+    "varsigma": "ς",
+    "tau": "τ",
+    "upsilon": "υ",
+    "phi": "ϕ",
+    "varphi": "φ",
+    "chi": "χ",
+    "psi": "ψ",
+    "omega": "ω",
+    "Gamma": "Γ",
+    "Delta": "Δ",
+    "Theta": "Θ",
+    "Lambda": "Λ",
+    "Xi": "Ξ",
+    "Pi": "Π",
+    "Sigma": "Σ",
+    "Upsilon": "Υ",
+    "Phi": "Φ",
+    "Psi": "Ψ",
+    "Omega": "Ω",
+}
+# Trivial expressions handled without latex2mathml: a letter, number or Greek
+# letter, optionally with one subscript and/or superscript of the same kind.
+_ATOM = r"[A-Za-z]|\d+(?:\.\d+)?|\\[A-Za-z]+"
+_SCRIPT = r"[A-Za-z0-9]|\\[A-Za-z]+|\{\s*(?:" + _ATOM + r")\s*\}"
+SIMPLE_MATH_PATTERN = re.compile(
+    rf"\s*(?P<base>{_ATOM})\s*"
+    rf"(?:(?:_\s*(?P<sub>{_SCRIPT})\s*(?:\^\s*(?P<sup>{_SCRIPT})\s*)?)"
+    rf"|(?:\^\s*(?P<sup_first>{_SCRIPT})\s*(?:_\s*(?P<sub_last>{_SCRIPT})\s*)?))?"
+)
 
 
 def _extract_mathml_body(mathml: str) -> str:
@@ -69,7 +123,52 @@ def _convert_aligned_to_mathml(latex: str) -> str | None:
     )
 
 
-def latex_to_omml(latex: str) -> str:
+def _simple_omml_run(atom: str) -> str | None:
+    if atom.startswith("\\"):
+        symbol = GREEK_LETTERS.get(atom[1:])
+        if symbol is None:
+            return None
+        style = "i"
+    elif atom[0].isdigit():
+        symbol = atom
+        style = "p"
+    else:
+        symbol = atom
+        style = "i"
+    return f'<m:r><m:rPr><m:sty m:val="{style}"/></m:rPr><m:t>{symbol}</m:t></m:r>'
+
+
+def _simple_omml_script(script: str) -> str | None:
+    if script.startswith("{"):
+        inner = _simple_omml_run(script[1:-1].strip())
+        return None if inner is None else f"<m:box><m:e>{inner}</m:e></m:box>"
+    return _simple_omml_run(script)
+
+
+def fast_path_omml(latex: str) -> str | None:
+    match = SIMPLE_MATH_PATTERN.fullmatch(latex)
+    if not match:
+        return None
+    base = _simple_omml_run(match.group("base"))
+    sub_src = match.group("sub") or match.group("sub_last")
+    sup_src = match.group("sup") or match.group("sup_first")
+    sub = _simple_omml_script(sub_src) if sub_src else ""
+    sup = _simple_omml_script(sup_src) if sup_src else ""
+    if base is None or sub is None or sup is None:
+        return None
+
+    if sub and sup:
+        body = f"<m:sSubSup><m:e>{base}</m:e><m:sub>{sub}</m:sub><m:sup>{sup}</m:sup></m:sSubSup>"
+    elif sub:
+        body = f"<m:sSub><m:e>{base}</m:e><m:sub>{sub}</m:sub></m:sSub>"
+    elif sup:
+        body = f"<m:sSup><m:e>{base}</m:e><m:sup>{sup}</m:sup></m:sSup>"
+    else:
+        body = base
+    return f'<m:oMath xmlns:m="{OMML_NS}"><m:box><m:e>{body}</m:e></m:box></m:oMath>'
+
+
+def _convert_latex_to_omml(latex: str) -> str:
     aligned_mathml = _convert_aligned_to_mathml(latex)
     if aligned_mathml is not None:
         return _ensure_omml_namespace(mathml_to_omml(aligned_mathml))
@@ -77,6 +176,30 @@ def latex_to_omml(latex: str) -> str:
     return _ensure_omml_namespace(mathml_to_omml(mathml))
 
 
+def latex_to_omml(latex: str, *, use_cache: bool = True) -> str:
+    fast = fast_path_omml(latex)
+    if fast is not None:
+        return fast
+
+    cache = get_omml_cache() if use_cache else None
+    if cache is not None:
+        try:
+            cached = cache.get(latex)
+        except sqlite3.Error:
+            cached = None
+        if cached is not None:
+            return cached
+
+    omml = _convert_latex_to_omml(latex)
+
+    if cache is not None:
+        try:
+            cache.put(latex, omml)
+        except sqlite3.Error:
+            pass
+    return omml
+
+
 def _ensure_omml_namespace(omml: str) -> str:
     if "xmlns:m=" in omml:
         return omml
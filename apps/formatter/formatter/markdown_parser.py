@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import re
+from collections.abc import Iterator, Sequence
 from typing import Any
 
 from markdown_it import MarkdownIt
@@ -10,6 +12,26 @@ from mdit_py_plugins.tasklists import tasklists_plugin
 AstNode = dict[str, Any]
 RunNode = dict[str, Any]
 
+_ATX_HEADING_RE = re.compile(r"^#{1,6}(?:[ \t]|$)")
+_FENCE_RE = re.compile(r"^(`{3,}|~{3,})")
+_MATH_START_RE = re.compile(r"^ {0,3}\$\$")
+_MATH_END_RE = re.compile(r"\$\$(?:\s*\([^)$\r\n]+\))?$")
+# HTML blocks (but not autolinks), which may run on into the next section,
+# and fences and definitions that are indented or inside lists and quotes,
+# which a line scan cannot follow. Inline footnotes are numbered together
+# with the others.
+_UNSPLITTABLE_RE = re.compile(
+    r"^(?: {0,3}<(?:[A-Za-z][A-Za-z0-9-]*(?:[\s/>]|$)|/[A-Za-z]|[!?])"
+    r"|[ \t>*+\-.)\d]+(?:`{3}|~{3})"
+    r"|(?=[ \t]*[>*+\-\d])[ \t>*+\-.)\d]+\[[^\]\n]+\]:)"
+    r"|\^\[",
+    re.M,
+)
+_DEFINITION_RE = re.compile(r" {0,3}\[[^\]\n]+\]:")
+# Lines after which a link reference definition may start: it cannot
+# interrupt a paragraph.
+_BLOCK_END_RE = re.compile(r"\s*$|#{1,6}(?:[ \t]|$)| {0,3}(?:=+|-+)[ \t]*$")
+
 STYLE_KEYS = (
     "bold",
     "italic",
@@ -90,7 +112,7 @@ def _emit_text_with_markers(text: str, base_style: dict[str, bool], runs: list[R
         idx += 1
 
 
-def _build_inline_runs(token) -> tuple[str, list[RunNode]]:
+def build_inline_runs(token) -> tuple[str, list[RunNode]]:
     runs: list[RunNode] = []
     style = _default_style()
     link_stack: list[str] = []
@@ -302,7 +324,7 @@ def _parse_table(tokens, i: int) -> tuple[AstNode, int]:
                             align.append("left")
                     i += 1
                     inline = tokens[i]
-                    text, runs = _build_inline_runs(inline)
+                    text, runs = build_inline_runs(inline)
                     cells.append({"text": text, "runs": runs})
                     i += 1
                 else:
@@ -399,7 +421,7 @@ def _parse_blocks(
         if token.type == "heading_open":
             level = max(1, min(4, int(token.tag[1]) - 1))
             text_token = tokens[i + 1]
-            text, runs = _build_inline_runs(text_token)
+            text, runs = build_inline_runs(text_token)
             ast.append(
                 {
                     "type": "heading",
@@ -477,28 +499,41 @@ def _parse_blocks(
     return ast, i
 
 
-def _normalize_math_blocks(text: str) -> str:
+def normalize_math_block_lines(text: str) -> tuple[list[str], list[int]]:
+    # Puts blank lines around `$$` blocks. Returns the normalized lines and,
+    # for each, the index of the source line it comes from; inserted blank
+    # lines point at the following source line.
     lines = text.splitlines()
     normalized: list[str] = []
+    origins: list[int] = []
     in_block = False
     for idx, line in enumerate(lines):
         if line.strip() == "$$":
             if not in_block:
                 if normalized and normalized[-1].strip():
                     normalized.append("")
+                    origins.append(idx)
                 normalized.append(line)
+                origins.append(idx)
                 in_block = True
             else:
                 normalized.append(line)
+                origins.append(idx)
                 in_block = False
                 if idx + 1 < len(lines) and lines[idx + 1].strip():
                     normalized.append("")
+                    origins.append(idx + 1)
             continue
         normalized.append(line)
-    return "\n".join(normalized)
+        origins.append(idx)
+    return normalized, origins
+
+
+def _normalize_math_blocks(text: str) -> str:
+    return "\n".join(normalize_math_block_lines(text)[0])
 
 
-def _build_markdown_it() -> MarkdownIt:
+def build_markdown_it() -> MarkdownIt:
     md = MarkdownIt("commonmark")
     md.enable("table").enable("strikethrough")
     md.use(dollarmath_plugin, double_inline=True)
@@ -509,13 +544,191 @@ def _build_markdown_it() -> MarkdownIt:
 
 def render_preview_html(text: str) -> str:
     text = _normalize_math_blocks(text)
-    md = _build_markdown_it()
+    md = build_markdown_it()
     return md.render(text)
 
 
+def parse_plain_paragraphs(text: str) -> list[AstNode]:
+    ast: list[AstNode] = []
+    for block in text.split("\n\n"):
+        block_text = " ".join(line.strip() for line in block.splitlines() if line.strip())
+        if block_text:
+            ast.append({"type": "paragraph", "text": block_text, "runs": [_plain_run(block_text)]})
+    return ast
+
+
 def parse_markdown(text: str) -> list[AstNode]:
     text = _normalize_math_blocks(text)
-    md = _build_markdown_it()
+    md = build_markdown_it()
     tokens = md.parse(text)
     ast, _ = _parse_blocks(tokens, 0)
     return ast
+
+
+def needs_whole_document(text: str) -> bool:
+    # Whether parts of the text may not parse as they do within the whole
+    # document: it has HTML blocks, fences or definitions a line scan cannot
+    # follow, or inline footnotes.
+    return _UNSPLITTABLE_RE.search(text) is not None
+
+
+def _open_lines(lines: list[str]) -> Iterator[int]:
+    # Indices of the lines outside fenced code and `$$` blocks, in lines from
+    # `normalize_math_block_lines`. A `$$` block runs to the next line ending
+    # in `$$`; `normalized_math` pairs `$$` lines as `_normalize_math_blocks`
+    # does.
+    fence = ""
+    in_math = normalized_math = False
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped == "$$":
+            normalized_math = not normalized_math
+        if fence:
+            match = _FENCE_RE.match(line)
+            if match and match.group(1).startswith(fence) and not line[match.end() :].strip():
+                fence = ""
+        elif match := _FENCE_RE.match(line):
+            fence = match.group(1)
+        elif in_math:
+            in_math = not _MATH_END_RE.search(stripped)
+        elif _MATH_START_RE.match(line):
+            in_math = len(stripped) <= 3 or not _MATH_END_RE.search(stripped[2:])
+        elif not normalized_math:
+            yield index
+
+
+def split_markdown_sections(text: str) -> list[str]:
+    # Splits the source before each top-level ATX heading, so that the
+    # sections parse to the same blocks as the whole. Where a heading may be
+    # inside fenced code or a `$$` block, it is not split; documents that
+    # `needs_whole_document` are kept in one section. Definitions reach
+    # across sections: see `collect_definitions`.
+    if needs_whole_document(text):
+        return [text]
+    lines, origins = normalize_math_block_lines(text)
+    starts = [0]
+    for index in _open_lines(lines):
+        if index and _ATX_HEADING_RE.match(lines[index]):
+            starts.append(origins[index])
+    source = text.splitlines(keepends=True)
+    return ["".join(source[start:end]) for start, end in zip(starts, [*starts[1:], len(source)])]
+
+
+def collect_definitions(text: str) -> str:
+    # The link reference and footnote definitions of a document (with the
+    # lines that follow them, up to the next block), for parsing its parts
+    # apart: each part is parsed with all of them, as within the document.
+    lines, _ = normalize_math_block_lines(text)
+    open_lines = set(_open_lines(lines))
+    regions: list[list[str]] = []
+    region: list[str] = []
+    previous = ""
+    for index, line in enumerate(lines):
+        if index not in open_lines:
+            region = []
+            previous = ""
+            continue
+        if region and (not line.strip() or region[-1].strip() or line.startswith(("    ", "\t"))):
+            region.append(line)
+        elif _DEFINITION_RE.match(line) and (line.lstrip().startswith("[^") or _BLOCK_END_RE.match(previous)):
+            region = [line]
+            regions.append(region)
+        else:
+            region = []
+        previous = line
+    return "\n\n".join("\n".join(region).strip("\n") for region in regions)
+
+
+def _section_tokens(md: MarkdownIt, text: str, definitions: str, references: Sequence[str]):
+    # Tokens of one part of a document whose definitions were collected, as
+    # in the whole document after `references` (the footnote references of
+    # the parts before it). The footnote block is left to
+    # `parse_footnote_blocks`; returns the footnote references of the part.
+    text = _normalize_math_blocks(text)
+    if not definitions:
+        env: dict[str, Any] = {}
+        return md.parse(text, env), env, []
+    seed: dict[str, Any] = {}
+    md.parse(definitions, seed)
+    footnotes: dict[str, Any] = {"refs": dict.fromkeys(seed.get("footnotes", {}).get("refs", {}), -1), "list": {}}
+    counts: dict[int, int] = {}
+
+    def number_footnotes(state) -> None:
+        # After the block rules, which reset the footnotes defined in the part.
+        for label in references:
+            key = f":{label}"
+            if footnotes["refs"].get(key, -1) < 0:
+                footnotes["refs"][key] = len(footnotes["list"])
+                footnotes["list"][footnotes["refs"][key]] = {"label": label, "count": 0}
+            footnotes["list"][footnotes["refs"][key]]["count"] += 1
+        counts.update((index, entry["count"]) for index, entry in footnotes["list"].items())
+
+    md.core.ruler.after("block", "footnote_numbers", number_footnotes)
+    env = {"references": seed.get("references", {}), "footnotes": footnotes}
+    tokens = md.parse(text, env)
+    made = [
+        entry["label"]
+        for index, entry in sorted(footnotes["list"].items())
+        if "label" in entry
+        for _ in range(entry["count"] - counts.get(index, 0))
+    ]
+    end = next((index for index, token in enumerate(tokens) if token.type == "footnote_block_open"), len(tokens))
+    return tokens[:end], env, made
+
+
+def _top_level_blocks(md: MarkdownIt, tokens, env: dict[str, Any]) -> list[tuple[list[AstNode], str]]:
+    # Token levels are not kept up to date by the footnote plugin.
+    starts: list[int] = []
+    depth = 0
+    for index, token in enumerate(tokens):
+        if depth == 0:
+            starts.append(index)
+        depth += token.nesting
+    blocks: list[tuple[list[AstNode], str]] = []
+    for start, end in zip(starts, [*starts[1:], len(tokens)]):
+        block = tokens[start:end]
+        nodes, _ = _parse_blocks(block, 0)
+        blocks.append((nodes, md.renderer.render(block, md.options, env)))
+    return blocks
+
+
+def parse_markdown_blocks(text: str) -> list[tuple[list[AstNode], str]]:
+    # The AST nodes and preview HTML of each top-level block.
+    text = _normalize_math_blocks(text)
+    md = build_markdown_it()
+    env: dict[str, Any] = {}
+    tokens = md.parse(text, env)
+    return _top_level_blocks(md, tokens, env)
+
+
+def parse_markdown_section(text: str, definitions: str) -> tuple[list[AstNode], list[str]]:
+    # `parse_markdown` for one part of a document, with the document's
+    # `collect_definitions`: the AST without footnotes, and the footnote
+    # references made in the part.
+    tokens, _, references = _section_tokens(build_markdown_it(), text, definitions, ())
+    ast, _ = _parse_blocks(tokens, 0)
+    return ast, references
+
+
+def parse_markdown_section_blocks(
+    text: str, definitions: str, references: Sequence[str] = ()
+) -> tuple[list[tuple[list[AstNode], str]], list[str]]:
+    # `parse_markdown_blocks` for one part of a document, with the document's
+    # `collect_definitions` and the footnote references of the parts before
+    # it: the blocks without footnotes, and the part's footnote references.
+    md = build_markdown_it()
+    tokens, env, made = _section_tokens(md, text, definitions, references)
+    return _top_level_blocks(md, tokens, env), made
+
+
+def parse_footnote_blocks(references: Sequence[str], definitions: str) -> list[tuple[list[AstNode], str]]:
+    # The footnote block closing a document parsed in parts, from the
+    # footnote references of all parts in order. In the HTML, references
+    # within footnotes are counted twice for the backlinks.
+    if not references:
+        return []
+    md = build_markdown_it()
+    env: dict[str, Any] = {}
+    tokens = md.parse(" ".join(f"[^{label}]" for label in references) + "\n\n" + definitions, env)
+    start = next((index for index, token in enumerate(tokens) if token.type == "footnote_block_open"), len(tokens))
+    return _top_level_blocks(md, tokens[start:], env)
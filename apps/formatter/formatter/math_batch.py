@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from concurrent.futures import Future, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Iterable
+
+from formatter.deadlines import StageWatchdog
+from formatter.latex import fast_path_omml, latex_to_omml
+from formatter.omml_cache import get_omml_cache
+from formatter.workers import process_pool, terminate_workers
+
+Node = dict[str, Any]
+
+# Below this many uncached formulas, process start-up costs more than it saves.
+PARALLEL_MATH_MIN_ITEMS = 256
+
+
+def _collect_from_runs(runs: Iterable[Any], found: dict[str, None]) -> None:
+    for run in runs:
+        if isinstance(run, dict) and run.get("type") == "math":
+            found.setdefault(run.get("latex", ""), None)
+
+
+def _collect_from_nodes(nodes: Iterable[Node], found: dict[str, None]) -> None:
+    for node in nodes:
+        ntype = node.get("type")
+        if ntype in {"heading", "paragraph"}:
+            _collect_from_runs(node.get("runs", []), found)
+        elif ntype == "math_block":
+            found.setdefault(node.get("latex", ""), None)
+        elif ntype == "list":
+            for item in node.get("items", []):
+                _collect_from_nodes(item, found)
+        elif ntype == "blockquote":
+            _collect_from_nodes(node.get("children", []), found)
+        elif ntype == "table":
+            for row in [node.get("header", []), *node.get("rows", [])]:
+                for cell in row:
+                    _collect_from_runs(cell.get("runs", []), found)
+
+
+def collect_math_latex(ast: list[Node]) -> list[str]:
+    found: dict[str, None] = {}
+    _collect_from_nodes(ast, found)
+    return list(found)
+
+
+def count_equations(nodes: Iterable[Node]) -> int:
+    # Numbered display formulas, in the order the builders number them.
+    count = 0
+    for node in nodes:
+        ntype = node.get("type")
+        if ntype == "math_block":
+            count += 1
+        elif ntype == "list":
+            count += sum(count_equations(item) for item in node.get("items", []))
+        elif ntype == "blockquote":
+            count += count_equations(node.get("children", []))
+    return count
+
+
+def _convert_uncached(latex: str) -> str | None:
+    try:
+        return latex_to_omml(latex, use_cache=False)
+    except Exception:
+        return None
+
+
+def _convert_chunk(chunk: list[str]) -> list[str | None]:
+    return [_convert_uncached(latex) for latex in chunk]
+
+
+def _convert_parallel(
+    pending: list[str], workers: int, watchdog: StageWatchdog
+) -> list[str | None] | None:
+    chunksize = max(1, len(pending) // (workers * 4))
+    chunks = [pending[idx : idx + chunksize] for idx in range(0, len(pending), chunksize)]
+    timeout = watchdog.remaining("math")
+    started = time.perf_counter()
+    pool = process_pool(workers)
+    not_done: set[Future[list[str | None]]] = set()
+    try:
+        futures = [pool.submit(_convert_chunk, chunk) for chunk in chunks]
+        done, not_done = wait(futures, timeout=timeout)
+        converted: list[str | None] = []
+        for future, chunk in zip(futures, chunks):
+            if future not in done:
+                converted.extend([None] * len(chunk))
+                continue
+            if isinstance(future.exception(), BrokenProcessPool):
+                return None
+            converted.extend(future.result())
+    finally:
+        if not_done:
+            # Chunks still running past the budget would keep their workers
+            # busy after the export has moved on.
+            terminate_workers(pool)
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    if timeout is not None:
+        watchdog.charge("math", time.perf_counter() - started)
+        if not_done:
+            skipped = sum(len(chunk) for future, chunk in zip(futures, chunks) if future in not_done)
+            watchdog.report_overrun("math", f"{skipped} formulas left as plain text")
+    return converted
+
+
+def _default_workers() -> int:
+    configured = os.getenv("FORMATTER_MATH_WORKERS")
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            pass
+    return os.cpu_count() or 1
+
+
+def convert_math_batch(
+    latex_items: Iterable[str],
+    *,
+    max_workers: int | None = None,
+    min_parallel_items: int = PARALLEL_MATH_MIN_ITEMS,
+    watchdog: StageWatchdog | None = None,
+) -> dict[str, str | None]:
+    watchdog = watchdog or StageWatchdog()
+    results: dict[str, str | None] = {}
+    pending: list[str] = []
+    cache = get_omml_cache()
+
+    for latex in dict.fromkeys(latex_items):
+        known = fast_path_omml(latex)
+        if known is None and cache is not None:
+            try:
+                known = cache.get(latex)
+            except sqlite3.Error:
+                known = None
+        if known is not None:
+            results[latex] = known
+        else:
+            pending.append(latex)
+
+    workers = max_workers if max_workers is not None else _default_workers()
+    converted: list[str | None] | None = None
+    if workers > 1 and len(pending) >= min_parallel_items:
+        try:
+            converted = _convert_parallel(pending, workers, watchdog)
+        except (OSError, BrokenProcessPool):
+            converted = None
+    if converted is None:
+        converted = [
+            watchdog.run("math", _convert_uncached, latex, fallback=lambda: None, detail=latex)
+            for latex in pending
+        ]
+
+    for latex, omml in zip(pending, converted):
+        results[latex] = omml
+        if cache is not None and omml is not None:
+            try:
+                cache.put(latex, omml)
+            except sqlite3.Error:
+                pass
+
+    return results
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+from importlib import metadata
+from pathlib import Path
+from threading import Lock
+
+DEFAULT_MAX_ENTRIES = 50_000
+_CONVERTER_PACKAGES = ("latex2mathml", "mathml2omml")
+
+_CACHES: dict[tuple[str, int], "OmmlCache"] = {}
+_CACHES_LOCK = Lock()
+
+
+def converter_versions() -> str:
+    versions = []
+    for package in _CONVERTER_PACKAGES:
+        try:
+            versions.append(f"{package}={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{package}=unknown")
+    return ";".join(versions)
+
+
+class OmmlCache:
+    def __init__(self, path: str | os.PathLike[str], max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.path = Path(path)
+        self.max_entries = max(1, int(max_entries))
+        self._versions = converter_versions()
+        self._lock = Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS omml_cache (
+                key TEXT PRIMARY KEY,
+                omml TEXT NOT NULL,
+                last_used INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS omml_cache_lru ON omml_cache (last_used)")
+        self._conn.commit()
+
+    def _key(self, latex: str) -> str:
+        # Converter versions are part of the key so upgrades never serve stale markup.
+        return hashlib.sha256(f"{self._versions}\0{latex}".encode("utf-8")).hexdigest()
+
+    def _tick(self) -> int:
+        # Read from the table rather than kept in memory: other processes
+        # share the database.
+        return int(self._conn.execute("SELECT COALESCE(MAX(last_used), 0) + 1 FROM omml_cache").fetchone()[0])
+
+    def _stored_entries(self) -> int:
+        return int(self._conn.execute("SELECT COUNT(*) FROM omml_cache").fetchone()[0])
+
+    def get(self, latex: str) -> str | None:
+        key = self._key(latex)
+        with self._lock:
+            row = self._conn.execute("SELECT omml FROM omml_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE omml_cache SET last_used = ? WHERE key = ?", (self._tick(), key))
+            self._conn.commit()
+            return str(row[0])
+
+    def put(self, latex: str, omml: str) -> None:
+        key = self._key(latex)
+        with self._lock:
+            try:
+                # The INSERT opens the write transaction, so the clock and
+                # the count below cannot change under us.
+                self._conn.execute(
+                    """
+                    INSERT INTO omml_cache (key, omml, last_used) VALUES (?, ?, 0)
+                    ON CONFLICT (key) DO UPDATE SET omml = excluded.omml
+                    """,
+                    (key, omml),
+                )
+                self._conn.execute("UPDATE omml_cache SET last_used = ? WHERE key = ?", (self._tick(), key))
+                overflow = self._stored_entries() - self.max_entries
+                if overflow > 0:
+                    self._conn.execute(
+                        """
+                        DELETE FROM omml_cache WHERE key IN (
+                            SELECT key FROM omml_cache ORDER BY last_used ASC LIMIT ?
+                        )
+                        """,
+                        (overflow,),
+                    )
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._stored_entries()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def get_omml_cache() -> OmmlCache | None:
+    configured = os.getenv("OMML_CACHE_PATH")
+    if not configured:
+        return None
+    try:
+        max_entries = int(os.getenv("OMML_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    except ValueError:
+        max_entries = DEFAULT_MAX_ENTRIES
+
+    cache_key = (configured, max_entries)
+    with _CACHES_LOCK:
+        cache = _CACHES.get(cache_key)
+        if cache is None:
+            try:
+                cache = OmmlCache(configured, max_entries=max_entries)
+            except (OSError, sqlite3.Error):
+                return None
+            _CACHES[cache_key] = cache
+        return cache
@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import re
+from collections.abc import Mapping, Sequence
+from functools import partial
+from typing import IO
+
+from docx.oxml.ns import qn
+from docx.oxml.shape import CT_Inline
+from docx.shared import Cm, Emu
+from lxml import etree
+
+from formatter.config import ExportOptions, FormatConfig
+from formatter.deadlines import StageWatchdog
+from formatter.docx_builder import (
+    THREE_LINE_BORDER_THICK_SZ,
+    THREE_LINE_BORDER_THIN_SZ,
+    Node,
+    _RenderContext,
+    _block_key,
+    _draft_figure_xml,
+    _ensure_omml_namespace,
+    _figure_width_cm,
+    _fragment_context,
+    _linked_figure,
+    _linked_picture_inline,
+    _load_figure,
+    _package_timestamp,
+    _prepare_document,
+    _resolve_omml,
+    _trim_leading_text_runs,
+)
+from formatter.docx_package import resolve_compression, write_package
+from formatter.figures import FigureHeader, prefetch_figures
+from formatter.fragment_cache import FragmentCache, contains_figure, get_fragment_cache
+from formatter.math_batch import collect_math_latex, convert_math_batch, count_equations
+
+# Writes word/document.xml straight from the AST. The markup mirrors what
+# docx_builder produces through python-docx, element for element, so both
+# backends open identically in Word (see tests/formatter/test_ooxml_writer.py).
+
+FLUSH_THRESHOLD = 1 << 16
+_BODY_MARKER = "formatter-body"
+
+_RUN_CONTENT = re.compile(r"(\t|\r|\n)")
+_ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+def _escape(text: str) -> str:
+    if _ILLEGAL_XML_CHARS.search(text):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _run_content(text: str) -> str:
+    # Same split as python-docx's run text setter: tabs and line breaks
+    # become w:tab / w:br, everything else goes into w:t.
+    markup = []
+    for piece in _RUN_CONTENT.split(text):
+        if not piece:
+            continue
+        if piece == "\t":
+            markup.append("<w:tab/>")
+        elif piece in "\r\n":
+            markup.append("<w:br/>")
+        elif len(piece.strip()) < len(piece):
+            markup.append(f'<w:t xml:space="preserve">{_escape(piece)}</w:t>')
+        else:
+            markup.append(f"<w:t>{_escape(piece)}</w:t>")
+    return "".join(markup)
+
+
+def _styled_run(run: Node, properties: str) -> str:
+    return f"<w:r>{properties}{_run_content(run.get('text', ''))}</w:r>"
+
+
+def _plain_run(text: str, italic: bool = False) -> str:
+    properties = "<w:rPr><w:i/></w:rPr>" if italic else ""
+    return f"<w:r>{properties}{_run_content(text)}</w:r>"
+
+
+class _Writer:
+    def __init__(self, stream: IO[bytes]) -> None:
+        self._stream = stream
+        self._chunks: list[str] = []
+        self._size = 0
+
+    def write(self, markup: str) -> None:
+        self._chunks.append(markup)
+        self._size += len(markup)
+        if self._size >= FLUSH_THRESHOLD:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._chunks:
+            self._stream.write("".join(self._chunks).encode("utf-8"))
+            self._chunks.clear()
+            self._size = 0
+
+
+class _Fragment:
+    def __init__(self) -> None:
+        self.chunks: list[str] = []
+
+    def write(self, markup: str) -> None:
+        self.chunks.append(markup)
+
+
+class _BodyRenderer:
+    def __init__(self, doc, ctx: _RenderContext) -> None:
+        self.doc = doc
+        self.ctx = ctx
+        self.fragments = ctx.fragments
+        self._math: dict[str, str | None] = {}
+        self._next_shape_id = 1
+
+    def _math_markup(self, latex: str) -> str | None:
+        if latex not in self._math:
+            markup = None
+            omml = _resolve_omml(latex, self.ctx)
+            if omml is not None:
+                try:
+                    element = etree.fromstring(_ensure_omml_namespace(omml))
+                    markup = etree.tostring(element, encoding="unicode")
+                except Exception:
+                    markup = None
+            self._math[latex] = markup
+        return self._math[latex]
+
+    def _math_run(self, latex: str, italic: bool = False) -> str:
+        markup = self._math_markup(latex)
+        if markup is None:
+            return _plain_run(latex, italic)
+        properties = "<w:rPr><w:i/></w:rPr>" if italic else ""
+        return f"<w:r>{properties}{markup}</w:r>"
+
+    def runs(self, runs: list[Node], fallback_text: str = "", kind: str = "body") -> str:
+        # Quotes mirror the blockquote pass that italicises runs without an
+        # explicit italic setting (math and fallback runs).
+        quote = kind == "quote"
+        if not runs:
+            return _plain_run(fallback_text, quote) if fallback_text else ""
+        markup = []
+        for run in runs:
+            if run.get("type") == "math":
+                markup.append(self._math_run(run.get("latex", ""), quote))
+                continue
+            if run.get("text", ""):
+                markup.append(_styled_run(run, self.fragments.run_xml(run, kind)))
+        return "".join(markup)
+
+    def heading(self, node: Node) -> str:
+        p_pr = self.fragments.paragraph_xml("heading", node.get("level", 1))
+        return f"<w:p>{p_pr}{self.runs(node.get('runs', []), node.get('text', ''), 'heading')}</w:p>"
+
+    def paragraph(self, node: Node) -> str:
+        p_pr = self.fragments.paragraph_xml("body")
+        return f"<w:p>{p_pr}{self.runs(node.get('runs', []), node.get('text', ''))}</w:p>"
+
+    def _equation_number(self) -> str:
+        ctx = self.ctx
+        resolved = ctx.options.resolve_equation_numbers
+        dirty = "" if resolved else ' w:dirty="true"'
+        number = str(ctx.equation_index) if resolved else "1"
+        ctx.equation_index += 1
+        return (
+            "<w:r><w:t>(</w:t></w:r>"
+            f'<w:r><w:fldChar w:fldCharType="begin"{dirty}/></w:r>'
+            r"<w:r><w:instrText>SEQ Equation \* ARABIC</w:instrText></w:r>"
+            '<w:r><w:fldChar w:fldCharType="separate"/></w:r>'
+            f"<w:r><w:t>{number}</w:t></w:r>"
+            '<w:r><w:fldChar w:fldCharType="end"/></w:r>'
+            "<w:r><w:t>)</w:t></w:r>"
+        )
+
+    def math_block(self, latex: str, p_pr: str) -> str:
+        return (
+            f"<w:p>{p_pr}<w:r><w:tab/></w:r>{self._math_run(latex)}<w:r><w:tab/></w:r>"
+            f"{self._equation_number()}</w:p>"
+        )
+
+    def code_block(self, node: Node) -> str:
+        markup = [f"<w:p>{self.fragments.paragraph_xml('code')}"]
+        properties = self.fragments.code_run_xml()
+        for idx, line in enumerate((node.get("text") or "").splitlines()):
+            if idx > 0:
+                markup.append("<w:r><w:br/></w:r>")
+            markup.append(f"<w:r>{properties}{_run_content(line)}</w:r>")
+        markup.append("</w:p>")
+        return "".join(markup)
+
+    def figure(self, node: Node) -> str:
+        ctx = self.ctx
+        config = ctx.config
+        src = str(node.get("src", "")).strip()
+        if ctx.options.draft:
+            picture = _draft_figure_xml(src, ctx, self.doc._block_width)
+        else:
+            jc = self.fragments.paragraph_xml("figure")
+            part = self.doc.part
+            linked = _linked_figure(src, ctx)
+            if linked is not None:
+                inline = _linked_picture_inline(part, self._next_shape_id, *linked, _figure_width_cm(config))
+            else:
+                source = ctx.watchdog.run("figures", _load_figure, src, ctx, fallback=lambda: None, detail=src)
+                if source is None:
+                    text = f"[图片加载失败] {src}" if src else "[图片加载失败]"
+                    return f"<w:p>{jc}{_plain_run(text)}</w:p>"
+                r_id, image = part.get_or_add_image(source)
+                cx, cy = image.scaled_dimensions(Cm(_figure_width_cm(config)), None)
+                inline = CT_Inline.new_pic_inline(self._next_shape_id, r_id, image.filename, cx, cy)
+            self._next_shape_id += 1
+            drawing = etree.tostring(inline, encoding="unicode")
+            picture = f"<w:p>{jc}<w:r><w:drawing>{drawing}</w:drawing></w:r></w:p>"
+
+        caption_text = str(node.get("caption") or node.get("alt") or "").strip()
+        caption = f"图 {ctx.figure_index} {caption_text}" if caption_text else f"图 {ctx.figure_index}"
+        ctx.figure_index += 1
+        return f"{picture}<w:p>{self.fragments.paragraph_xml('caption')}{_plain_run(caption)}</w:p>"
+
+    def list(self, node: Node, out: _Writer | _Fragment) -> None:
+        level = node.get("level", 1)
+        ordered = node.get("ordered", False)
+        p_pr = self.fragments.paragraph_xml("list", level, ordered)
+        for item in node.get("items", []):
+            for child in item:
+                ctype = child.get("type")
+                if ctype == "paragraph":
+                    runs = child.get("runs", [])
+                    fallback_text = child.get("text", "")
+                    prefix = ""
+                    if child.get("task"):
+                        prefix = _plain_run("☑ " if child.get("checked") else "☐ ")
+                        runs = _trim_leading_text_runs(runs)
+                        fallback_text = fallback_text.lstrip()
+                    out.write(f"<w:p>{p_pr}{prefix}{self.runs(runs, fallback_text, 'list')}</w:p>")
+                elif ctype == "list":
+                    self.list(child, out)
+                elif ctype == "math_block":
+                    out.write(self.math_block(child.get("latex", ""), self.fragments.paragraph_xml("list_math", level, ordered)))
+                elif ctype == "table":
+                    self.table(child, out)
+                elif ctype == "code_block":
+                    out.write(self.code_block(child))
+                elif ctype == "figure":
+                    out.write(self.figure(child))
+
+    def blockquote(self, node: Node, out: _Writer | _Fragment) -> None:
+        p_pr = self.fragments.paragraph_xml("quote")
+        for child in node.get("children", []):
+            ctype = child.get("type")
+            if ctype == "paragraph":
+                runs = self.runs(child.get("runs", []), child.get("text", ""), "quote")
+                out.write(f"<w:p>{p_pr}{runs}</w:p>")
+            elif ctype == "list":
+                self.list(child, out)
+            elif ctype == "table":
+                self.table(child, out)
+            elif ctype == "math_block":
+                out.write(self.math_block(child.get("latex", ""), self.fragments.paragraph_xml("quote_math")))
+            elif ctype == "code_block":
+                out.write(self.code_block(child))
+            elif ctype == "figure":
+                out.write(self.figure(child))
+
+    def table(self, node: Node, out: _Writer | _Fragment) -> None:
+        header = node.get("header", [])
+        rows = node.get("rows", [])
+        if not header:
+            return
+        cols = len(header)
+        col_twips = Emu(self.doc._block_width // cols).twips
+        out.write(
+            '<w:tbl><w:tblPr><w:tblW w:type="auto" w:w="0"/>'
+            '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+            'w:noHBand="0" w:noVBand="1" w:val="04A0"/><w:tblBorders>'
+            f'<w:top w:val="single" w:sz="{THREE_LINE_BORDER_THICK_SZ}" w:color="000000"/>'
+            f'<w:bottom w:val="single" w:sz="{THREE_LINE_BORDER_THICK_SZ}" w:color="000000"/>'
+            '<w:left w:val="nil"/><w:right w:val="nil"/><w:insideH w:val="nil"/>'
+            "</w:tblBorders></w:tblPr><w:tblGrid>"
+            + f'<w:gridCol w:w="{col_twips}"/>' * cols
+            + "</w:tblGrid>"
+        )
+        header_borders = (
+            ""
+            if self.ctx.options.draft
+            else f'<w:tcBorders><w:bottom w:val="single" w:sz="{THREE_LINE_BORDER_THIN_SZ}" w:color="000000"/></w:tcBorders>'
+        )
+        cell_ppr = self.fragments.paragraph_xml("cell") + "<w:r/>"
+        for r_idx, row in enumerate([header] + rows):
+            tc_pr = f'<w:tcPr><w:tcW w:type="dxa" w:w="{col_twips}"/>{header_borders if r_idx == 0 else ""}</w:tcPr>'
+            markup = ["<w:tr>"]
+            for c_idx in range(cols):
+                if c_idx >= len(row):
+                    markup.append(f"<w:tc>{tc_pr}<w:p/></w:tc>")
+                    continue
+                cell = row[c_idx]
+                runs = self.runs(
+                    _trim_leading_text_runs(cell.get("runs", [])), (cell.get("text") or "").lstrip(), "cell"
+                )
+                markup.append(f"<w:tc>{tc_pr}<w:p>{cell_ppr}{runs}</w:p></w:tc>")
+            markup.append("</w:tr>")
+            out.write("".join(markup))
+        out.write("</w:tbl>")
+
+    def block(self, node: Node, out: _Writer | _Fragment) -> None:
+        ntype = node.get("type")
+        if ntype == "heading":
+            out.write(self.heading(node))
+        elif ntype == "paragraph":
+            out.write(self.paragraph(node))
+        elif ntype == "list":
+            self.list(node, out)
+        elif ntype == "table":
+            self.table(node, out)
+        elif ntype == "math_block":
+            out.write(self.math_block(node.get("latex", ""), self.fragments.paragraph_xml("math")))
+        elif ntype == "code_block":
+            out.write(self.code_block(node))
+        elif ntype == "blockquote":
+            self.blockquote(node, out)
+        elif ntype == "figure":
+            out.write(self.figure(node))
+
+    def render(
+        self,
+        ast: list[Node],
+        out: _Writer,
+        cache: FragmentCache | None = None,
+        rendered: Sequence[tuple[str, int] | None] | None = None,
+    ) -> None:
+        # `rendered` holds markup and equation counts of blocks rendered
+        # elsewhere (e.g. by chapter workers); None entries are rendered here.
+        ctx = self.ctx
+        context = _fragment_context(self.doc, ctx, "streaming")
+        for index, node in enumerate(ast):
+            if rendered is not None and rendered[index] is not None:
+                markup, equations = rendered[index]
+                out.write(markup)
+                ctx.equation_index += equations
+                continue
+            key = _block_key(node, ctx, context) if cache is not None else None
+            if key is None:
+                self.block(node, out)
+                continue
+            cached = cache.get(key)
+            if cached is not None:
+                markup, equations = cached
+                out.write(markup)
+                ctx.equation_index += equations
+                continue
+            fragment = _Fragment()
+            equation_index = ctx.equation_index
+            self.block(node, fragment)
+            markup = "".join(fragment.chunks)
+            out.write(markup)
+            cache.put(key, markup, ctx.equation_index - equation_index)
+
+
+def render_fragments(
+    ast: list[Node],
+    config: FormatConfig,
+    options: ExportOptions,
+    math_omml: Mapping[str, str | None],
+    *,
+    equation_start: int = 1,
+) -> list[tuple[str, int] | None]:
+    # Body markup and equation count of each block, numbered from
+    # `equation_start`, for `write_docx_streaming(rendered=...)`. Blocks with
+    # figures come back as None: the writer owns the package the images go
+    # into and the figure counter.
+    doc, ctx = _prepare_document(config, options, math_omml, {}, StageWatchdog())
+    ctx.equation_index = equation_start
+    renderer = _BodyRenderer(doc, ctx)
+    rendered: list[tuple[str, int] | None] = []
+    for node in ast:
+        if contains_figure(node):
+            rendered.append(None)
+            ctx.equation_index += count_equations([node])
+            continue
+        fragment = _Fragment()
+        start = ctx.equation_index
+        renderer.block(node, fragment)
+        rendered.append(("".join(fragment.chunks), ctx.equation_index - start))
+    return rendered
+
+
+def _document_frame(doc) -> tuple[bytes, bytes]:
+    # Serialise the template's document element around a marker so the
+    # root namespaces and the trailing w:sectPr are copied verbatim.
+    root = doc.element
+    body = root.find(qn("w:body"))
+    marker = etree.Comment(_BODY_MARKER)
+    body.insert(0, marker)
+    try:
+        xml = etree.tostring(root, encoding="UTF-8", standalone=True)
+    finally:
+        body.remove(marker)
+    head, _, tail = xml.partition(f"<!--{_BODY_MARKER}-->".encode("utf-8"))
+    return head, tail
+
+
+def write_docx_streaming(
+    ast: list[Node],
+    output_path,
+    config: FormatConfig | None = None,
+    *,
+    math_omml: Mapping[str, str | None] | None = None,
+    figures: Mapping[str, bytes | FigureHeader | None] | None = None,
+    watchdog: StageWatchdog | None = None,
+    options: ExportOptions | None = None,
+    rendered: Sequence[tuple[str, int] | None] | None = None,
+) -> None:
+    config = config or FormatConfig()
+    options = options or ExportOptions()
+    watchdog = watchdog or StageWatchdog()
+    if options.draft:
+        math_omml, figures = {}, {}
+    if math_omml is None:
+        math_omml = convert_math_batch(collect_math_latex(ast), watchdog=watchdog)
+    if figures is None:
+        figures = prefetch_figures(ast, watchdog=watchdog, link_min_bytes=options.link_figures_min_bytes)
+    doc, ctx = _prepare_document(config, options, math_omml, figures, watchdog)
+    renderer = _BodyRenderer(doc, ctx)
+    head, tail = _document_frame(doc)
+
+    def _write_document(stream: IO[bytes]) -> None:
+        stream.write(head)
+        out = _Writer(stream)
+        renderer.render(ast, out, get_fragment_cache(), rendered)
+        out.flush()
+        stream.write(tail)
+
+    save = partial(
+        write_package,
+        streamed={doc.part: _write_document},
+        compression=resolve_compression(options.compression),
+        timestamp=_package_timestamp(options),
+    )
+    watchdog.measure("save", save, doc.part.package, output_path)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Any
+
+from markdown_it import MarkdownIt
+from markdown_it.token import Token
+
+from formatter.markdown_parser import build_inline_runs, build_markdown_it, normalize_math_block_lines
+from formatter.preview import SUMMARY_KEYS
+
+OutlineNode = dict[str, Any]
+
+# Inline images and `$$...$$` split a paragraph into figures and display math.
+_PARAGRAPH_SPLIT_RE = re.compile(r"(!\[[^\]]*\]\(\s*[^)\s][^)]*\))|\$\$.+?\$\$", re.S)
+_LIST_OPEN = {"bullet_list_open", "ordered_list_open"}
+
+
+@lru_cache(maxsize=1)
+def _block_parser() -> MarkdownIt:
+    # Block rules only: inline content is left unparsed, so the core rules
+    # that need it (task lists, footnotes) are turned off as well.
+    md = build_markdown_it()
+    md.disable([rule for rule in md.get_active_rules()["core"] if rule not in {"normalize", "block"}])
+    return md
+
+
+def _heading_text(md: MarkdownIt, content: str) -> str:
+    children: list[Token] = []
+    md.inline.parse(content, md, {}, children)
+    text, _ = build_inline_runs(Token("inline", "", 0, children=children))
+    return text
+
+
+def _count_paragraph(summary: dict[str, int], content: str) -> None:
+    last = 0
+    for match in _PARAGRAPH_SPLIT_RE.finditer(content):
+        if content[last : match.start()].strip():
+            summary["paragraphs"] += 1
+        summary["figures" if match.group(1) else "math_blocks"] += 1
+        last = match.end()
+    if content[last:].strip():
+        summary["paragraphs"] += 1
+
+
+def build_outline(text: str) -> dict[str, Any]:
+    # Heading tree and block counts from a block-level scan of the source,
+    # for navigation panes that do not need the AST. Only headings outside
+    # lists and blockquotes are in the tree; `line_start` and `line_end` are
+    # the 1-based source lines of the heading's section. The counts follow
+    # `summarize_ast`, without the generated footnote and bibliography
+    # sections.
+    lines, origins = normalize_math_block_lines(text)
+    md = _block_parser()
+    tokens = md.parse("\n".join(lines))
+    summary = dict.fromkeys(SUMMARY_KEYS.values(), 0)
+    last_line = origins[-1] + 1 if origins else 0
+    outline: list[OutlineNode] = []
+    open_sections: list[OutlineNode] = []
+    # Blockquotes and footnote definitions currently open.
+    skipped = 0
+
+    for index, token in enumerate(tokens):
+        ttype = token.type
+        if ttype in {"blockquote_open", "footnote_reference_open"}:
+            skipped += 1
+        elif ttype in {"blockquote_close", "footnote_reference_close"}:
+            skipped -= 1
+        elif skipped:
+            continue
+        elif ttype == "heading_open":
+            summary["headings"] += 1
+            if token.level or token.map is None:
+                continue
+            line_start = origins[token.map[0]] + 1
+            node: OutlineNode = {
+                "level": max(1, min(4, int(token.tag[1]) - 1)),
+                "text": _heading_text(md, tokens[index + 1].content),
+                "line_start": line_start,
+                "line_end": last_line,
+                "children": [],
+            }
+            while open_sections and open_sections[-1]["level"] >= node["level"]:
+                open_sections.pop()["line_end"] = line_start - 1
+            (open_sections[-1]["children"] if open_sections else outline).append(node)
+            open_sections.append(node)
+        elif ttype == "paragraph_open":
+            _count_paragraph(summary, tokens[index + 1].content)
+        elif ttype in _LIST_OPEN:
+            summary["lists"] += 1
+        elif ttype == "table_open":
+            summary["tables"] += 1
+        elif ttype == "math_block":
+            summary["math_blocks"] += 1
+
+    return {"outline": outline, "summary": summary}
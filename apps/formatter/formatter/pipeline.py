@@ -8,7 +8,10 @@ from formatter.citations import (
     normalize_citations,
     parse_bibliography_sources,
 )
-from formatter.markdown_parser import parse_markdown
+from formatter.deadlines import StageWatchdog
+from formatter.markdown_parser import parse_markdown, parse_plain_paragraphs
+
+AstNode = dict[str, Any]
 
 
 def format_markdown(
@@ -16,19 +19,57 @@ def format_markdown(
     *,
     bibliography_style: str = "ieee",
     bibliography_sources: str = "",
+    watchdog: StageWatchdog | None = None,
 ) -> dict[str, Any]:
-    normalized, refs, key_number_map = normalize_citations(text)
-    ast = parse_markdown(normalized)
-    sources = parse_bibliography_sources(bibliography_sources)
+    watchdog = watchdog or StageWatchdog()
+    normalized, refs, key_number_map = watchdog.run(
+        "normalize",
+        normalize_citations,
+        text,
+        fallback=lambda: (text, [], {}),
+    )
+    ast = watchdog.run(
+        "parse",
+        parse_markdown,
+        normalized,
+        fallback=lambda: parse_plain_paragraphs(normalized),
+    )
+    append_bibliography(
+        ast,
+        refs,
+        key_number_map,
+        bibliography_style=bibliography_style,
+        bibliography_sources=bibliography_sources,
+        watchdog=watchdog,
+    )
+    return {"ast": ast, "refs": refs, "normalized_markdown": normalized}
 
-    if refs and not has_bibliography_heading(ast):
-        ast.extend(
-            build_bibliography_nodes(
-                refs,
-                style=bibliography_style,
-                sources=sources,
-                key_number_map=key_number_map,
-            )
-        )
 
-    return {"ast": ast, "refs": refs, "normalized_markdown": normalized}
+def append_bibliography(
+    ast: list[AstNode],
+    refs: list[str],
+    key_number_map: dict[int, str],
+    *,
+    bibliography_style: str = "ieee",
+    bibliography_sources: str = "",
+    watchdog: StageWatchdog | None = None,
+) -> list[AstNode]:
+    # Appends the bibliography unless the document has its own; returns the
+    # appended nodes.
+    watchdog = watchdog or StageWatchdog()
+    sources = watchdog.run(
+        "bibliography",
+        parse_bibliography_sources,
+        bibliography_sources,
+        fallback=dict,
+    )
+    if not refs or has_bibliography_heading(ast):
+        return []
+    nodes = build_bibliography_nodes(
+        refs,
+        style=bibliography_style,
+        sources=sources,
+        key_number_map=key_number_map,
+    )
+    ast.extend(nodes)
+    return nodes
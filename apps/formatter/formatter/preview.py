@@ -1,92 +1,105 @@
 from __future__ import annotations
 
 import re
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field
 from typing import Any
 
 AstNode = dict[str, Any]
 QualityWarning = dict[str, str]
 _REF_RE = re.compile(r"^\[(\d+)\]$")
 
-
-def summarize_ast(ast: list[AstNode]) -> dict[str, int]:
-    counts = {
-        "headings": 0,
-        "paragraphs": 0,
-        "lists": 0,
-        "tables": 0,
-        "math_blocks": 0,
-        "figures": 0,
-    }
-
-    def walk(nodes: list[AstNode]) -> None:
-        for node in nodes:
-            if node.get("auto_generated"):
-                continue
-            ntype = node.get("type")
-            if ntype == "heading":
-                counts["headings"] += 1
-            elif ntype == "paragraph":
-                counts["paragraphs"] += 1
-            elif ntype == "list":
-                counts["lists"] += 1
-                for item in node.get("items", []):
-                    walk(item)
-            elif ntype == "table":
-                counts["tables"] += 1
-            elif ntype == "math_block":
-                counts["math_blocks"] += 1
-            elif ntype == "figure":
-                counts["figures"] += 1
-
-    walk(ast)
-    return counts
-
-
-def _walk_nodes(nodes: list[AstNode]):
-    for node in nodes:
-        yield node
-        if node.get("type") == "list":
-            for item in node.get("items", []):
-                yield from _walk_nodes(item)
-        if node.get("type") == "blockquote":
-            yield from _walk_nodes(node.get("children", []))
-
-
-def lint_structure(ast: list[AstNode], refs: list[str]) -> list[QualityWarning]:
-    warnings: list[QualityWarning] = []
-    last_heading_level: int | None = None
-
-    for node in _walk_nodes(ast):
-        if node.get("auto_generated"):
-            continue
-        if node.get("type") != "heading":
-            continue
-
-        level = int(node.get("level", 1))
-        text = str(node.get("text", "")).strip()
-
-        if not text:
-            warnings.append(
-                {
-                    "code": "empty_heading",
-                    "severity": "warning",
-                    "message": f"发现空标题（H{level}）。",
-                }
-            )
-
-        if last_heading_level is not None and level > last_heading_level + 1:
-            warnings.append(
-                {
-                    "code": "heading_level_jump",
-                    "severity": "warning",
-                    "message": f"标题层级从 H{last_heading_level} 跳到了 H{level}。",
-                }
-            )
-
-        last_heading_level = level
-
+SUMMARY_KEYS = {
+    "heading": "headings",
+    "paragraph": "paragraphs",
+    "list": "lists",
+    "table": "tables",
+    "math_block": "math_blocks",
+    "figure": "figures",
+}
+
+
+@dataclass
+class AnalysisState:
+    refs: list[str]
+    summary: dict[str, int] = field(default_factory=lambda: dict.fromkeys(SUMMARY_KEYS.values(), 0))
+    warnings: list[QualityWarning] = field(default_factory=list)
+    rules_applied: list[str] = field(default_factory=list)
+    # Per-rule scratch space, keyed by rule name.
+    scratch: dict[str, Any] = field(default_factory=dict)
+    # Whether the current node counts towards the summary: it is not
+    # auto-generated and not inside a blockquote or an auto-generated list.
+    counted: bool = True
+
+
+@dataclass(frozen=True)
+class AnalysisRule:
+    # `visit` is called for the nodes of the single analyzer walk (list items
+    # and blockquote children included) whose type is in `node_types`, or
+    # for every node when it is None; returning True stops further visits.
+    # `finish` runs once after the walk.
+    name: str
+    visit: Callable[[AnalysisState, AstNode], bool | None] | None = None
+    finish: Callable[[AnalysisState], None] | None = None
+    node_types: frozenset[str] | None = None
+
+
+@dataclass
+class AstAnalysis:
+    summary: dict[str, int]
+    lint_warnings: list[QualityWarning]
+    rules_applied: list[str]
+    # Seconds spent in each rule; empty unless requested.
+    timings: dict[str, float]
+
+    def quality_report(self, refs: list[str], lint_warnings: list[QualityWarning] | None = None) -> dict[str, Any]:
+        warnings = self.lint_warnings if lint_warnings is None else lint_warnings
+        return {
+            "rules_applied": list(self.rules_applied),
+            "risks": [warning["message"] for warning in warnings],
+            "warnings": warnings,
+            "stats": {**self.summary, "refs": len(refs)},
+        }
+
+
+def _count_block(state: AnalysisState, node: AstNode) -> None:
+    if state.counted:
+        state.summary[SUMMARY_KEYS[node["type"]]] += 1
+
+
+def _lint_heading(state: AnalysisState, node: AstNode) -> None:
+    if node.get("auto_generated") or node.get("type") != "heading":
+        return
+
+    level = int(node.get("level", 1))
+    text = str(node.get("text", "")).strip()
+
+    if not text:
+        state.warnings.append(
+            {
+                "code": "empty_heading",
+                "severity": "warning",
+                "message": f"发现空标题（H{level}）。",
+            }
+        )
+
+    last_heading_level = state.scratch.get("heading_structure")
+    if last_heading_level is not None and level > last_heading_level + 1:
+        state.warnings.append(
+            {
+                "code": "heading_level_jump",
+                "severity": "warning",
+                "message": f"标题层级从 H{last_heading_level} 跳到了 H{level}。",
+            }
+        )
+
+    state.scratch["heading_structure"] = level
+
+
+def _lint_citation_numbers(state: AnalysisState) -> None:
     numbers: list[int] = []
-    for ref in refs:
+    for ref in state.refs:
         match = _REF_RE.match(ref)
         if match:
             numbers.append(int(match.group(1)))
@@ -94,7 +107,7 @@ def lint_structure(ast: list[AstNode], refs: list[str]) -> list[QualityWarning]:
     if numbers:
         missing = sorted(set(range(min(numbers), max(numbers) + 1)) - set(numbers))
         if missing:
-            warnings.append(
+            state.warnings.append(
                 {
                     "code": "citation_number_gap",
                     "severity": "warning",
@@ -102,43 +115,130 @@ def lint_structure(ast: list[AstNode], refs: list[str]) -> list[QualityWarning]:
                 }
             )
 
-    return warnings
+
+def _applied_when(rules: Sequence[str], condition: Callable[[AnalysisState], bool]):
+    def finish(state: AnalysisState) -> None:
+        if condition(state):
+            state.rules_applied.extend(rules)
+
+    return finish
+
+
+def _node_flag(
+    name: str, matches: Callable[[AstNode], bool], node_types: frozenset[str] | None = None
+) -> AnalysisRule:
+    # Applied when any node matches, auto-generated ones included.
+    def visit(state: AnalysisState, node: AstNode) -> bool:
+        if matches(node):
+            state.scratch[name] = True
+            return True
+        return False
+
+    return AnalysisRule(name, visit, _applied_when([name], lambda state: name in state.scratch), node_types)
+
+
+def _has_link(node: AstNode) -> bool:
+    for run in node.get("runs", []):
+        if isinstance(run, dict) and run.get("link"):
+            return True
+    return False
+
+
+SUMMARY_RULE = AnalysisRule("summary", visit=_count_block, node_types=frozenset(SUMMARY_KEYS))
+LINT_RULES = [
+    AnalysisRule("heading_structure", visit=_lint_heading, node_types=frozenset({"heading"})),
+    AnalysisRule("citation_numbers", finish=_lint_citation_numbers),
+]
+# The order of these rules is the order of `rules_applied`.
+QUALITY_RULES = [
+    AnalysisRule(
+        "structure_lint_before_export", finish=_applied_when(["structure_lint_before_export"], lambda state: True)
+    ),
+    AnalysisRule(
+        "citations",
+        finish=_applied_when(
+            ["citations_sorted_and_deduplicated", "bibliography_auto_append"], lambda state: bool(state.refs)
+        ),
+    ),
+    AnalysisRule(
+        "math_blocks_auto_numbered",
+        finish=_applied_when(["math_blocks_auto_numbered"], lambda state: state.summary["math_blocks"] > 0),
+    ),
+    AnalysisRule(
+        "figure_caption_numbering",
+        finish=_applied_when(["figure_caption_numbering"], lambda state: state.summary["figures"] > 0),
+    ),
+    _node_flag("blockquote_rendering", lambda node: True, frozenset({"blockquote"})),
+    _node_flag("task_list_checkbox_rendering", lambda node: node.get("task") is True, frozenset({"paragraph"})),
+    _node_flag("link_url_preserved", _has_link, frozenset({"heading", "paragraph"})),
+]
+
+ANALYSIS_RULES: list[AnalysisRule] = [SUMMARY_RULE, *LINT_RULES, *QUALITY_RULES]
+
+
+def register_analysis_rule(rule: AnalysisRule) -> None:
+    # Registered rules run in the same walk as the built-in ones.
+    if any(existing.name == rule.name for existing in ANALYSIS_RULES):
+        raise ValueError(f"analysis rule already registered: {rule.name}")
+    ANALYSIS_RULES.append(rule)
+
+
+def analyze_ast(
+    ast: list[AstNode], refs: list[str], rules: Sequence[AnalysisRule] | None = None, *, timed: bool = False
+) -> AstAnalysis:
+    # Summary, lint warnings and applied rules in one walk over the AST.
+    # With `timed`, the seconds spent in each rule are reported as well.
+    rules = ANALYSIS_RULES if rules is None else rules
+    state = AnalysisState(refs=refs)
+    timings = dict.fromkeys((rule.name for rule in rules), 0.0)
+    active = [rule for rule in rules if rule.visit is not None]
+    # Node type -> rules still visiting nodes of that type.
+    dispatch: dict[Any, list[AnalysisRule]] = {}
+    clock = time.perf_counter
+
+    def visitors(ntype: Any) -> list[AnalysisRule]:
+        found = dispatch[ntype] = [rule for rule in active if rule.node_types is None or ntype in rule.node_types]
+        return found
+
+    def walk(nodes: list[AstNode], counted: bool) -> None:
+        for node in nodes:
+            ntype = node.get("type")
+            state.counted = node_counted = counted and not node.get("auto_generated")
+            for rule in dispatch.get(ntype) or visitors(ntype):
+                if timed:
+                    started = clock()
+                    done = rule.visit(state, node)
+                    timings[rule.name] += clock() - started
+                else:
+                    done = rule.visit(state, node)
+                if done:
+                    active.remove(rule)
+                    dispatch.clear()
+            if ntype == "list":
+                for item in node.get("items", []):
+                    walk(item, node_counted)
+            elif ntype == "blockquote":
+                walk(node.get("children", []), False)
+
+    walk(ast, True)
+
+    for rule in rules:
+        if rule.finish is not None:
+            started = clock()
+            rule.finish(state)
+            timings[rule.name] += clock() - started
+    return AstAnalysis(state.summary, state.warnings, state.rules_applied, timings if timed else {})
+
+
+def summarize_ast(ast: list[AstNode]) -> dict[str, int]:
+    return analyze_ast(ast, [], [SUMMARY_RULE]).summary
+
+
+def lint_structure(ast: list[AstNode], refs: list[str]) -> list[QualityWarning]:
+    return analyze_ast(ast, refs, LINT_RULES).lint_warnings
 
 
 def build_export_quality_report(
     ast: list[AstNode], refs: list[str], lint_warnings: list[QualityWarning]
 ) -> dict[str, Any]:
-    stats = summarize_ast(ast)
-    stats["refs"] = len(refs)
-
-    rules_applied = ["structure_lint_before_export"]
-    if refs:
-        rules_applied.extend(["citations_sorted_and_deduplicated", "bibliography_auto_append"])
-    if stats.get("math_blocks", 0) > 0:
-        rules_applied.append("math_blocks_auto_numbered")
-    if stats.get("figures", 0) > 0:
-        rules_applied.append("figure_caption_numbering")
-
-    has_blockquote = any(node.get("type") == "blockquote" for node in _walk_nodes(ast))
-    if has_blockquote:
-        rules_applied.append("blockquote_rendering")
-
-    has_task_items = any(node.get("task") is True for node in _walk_nodes(ast))
-    if has_task_items:
-        rules_applied.append("task_list_checkbox_rendering")
-
-    has_links = any(
-        run.get("link")
-        for node in _walk_nodes(ast)
-        for run in node.get("runs", [])
-        if isinstance(run, dict)
-    )
-    if has_links:
-        rules_applied.append("link_url_preserved")
-
-    return {
-        "rules_applied": rules_applied,
-        "risks": [warning["message"] for warning in lint_warnings],
-        "warnings": lint_warnings,
-        "stats": stats,
-    }
+    return analyze_ast(ast, refs, [SUMMARY_RULE, *QUALITY_RULES]).quality_report(refs, lint_warnings)
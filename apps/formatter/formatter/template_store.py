@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import re
+import tempfile
+from pathlib import Path
+from threading import Lock
+
+from docx import Document
+
+MAX_TEMPLATE_BYTES = 20 * 1024 * 1024
+
+_TEMPLATE_ID = re.compile(r"^[0-9a-f]{64}$")
+_STORES: dict[str, "TemplateStore"] = {}
+_STORES_LOCK = Lock()
+
+
+class TemplateStore:
+    # Uploaded reference documents, stored once per SHA-256 digest as
+    # `<digest>.docx`. The digest is the template id, so the styled template
+    # cache can be keyed by it without reading the file.
+    max_bytes = MAX_TEMPLATE_BYTES
+
+    def __init__(self, directory: str | os.PathLike[str]) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, template_id: str) -> Path | None:
+        if not _TEMPLATE_ID.match(template_id):
+            return None
+        path = self.directory / f"{template_id}.docx"
+        return path if path.is_file() else None
+
+    def add(self, data: bytes) -> str:
+        if len(data) > self.max_bytes:
+            raise ValueError(f"template is larger than {self.max_bytes} bytes")
+        try:
+            Document(io.BytesIO(data))
+        except Exception as exc:
+            raise ValueError(f"not a Word document: {exc}") from exc
+
+        template_id = hashlib.sha256(data).hexdigest()
+        path = self.directory / f"{template_id}.docx"
+        if not path.exists():
+            fd, tmp_name = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            os.replace(tmp_name, path)
+        return template_id
+
+    def read(self, template_id: str) -> bytes:
+        path = self.path(template_id)
+        if path is None:
+            raise KeyError(template_id)
+        return path.read_bytes()
+
+    def remove(self, template_id: str) -> bool:
+        path = self.path(template_id)
+        if path is None:
+            return False
+        path.unlink(missing_ok=True)
+        return True
+
+    def list(self) -> list[dict[str, object]]:
+        return [
+            {"template_id": path.stem, "size": path.stat().st_size}
+            for path in sorted(self.directory.glob("*.docx"))
+            if _TEMPLATE_ID.match(path.stem)
+        ]
+
+
+def get_template_store() -> TemplateStore | None:
+    configured = os.getenv("TEMPLATE_STORE_DIR")
+    if not configured:
+        return None
+    with _STORES_LOCK:
+        store = _STORES.get(configured)
+        if store is None:
+            try:
+                store = TemplateStore(configured)
+            except OSError:
+                return None
+            _STORES[configured] = store
+        return store
+
+
+def read_template(template_id: str) -> bytes:
+    store = get_template_store()
+    if store is None:
+        raise ValueError("reference templates are disabled; set TEMPLATE_STORE_DIR")
+    try:
+        return store.read(template_id)
+    except KeyError:
+        raise ValueError(f"unknown template: {template_id}") from None
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from formatter.config import BodyStyle, FigureStyle, FormatConfig, HeadingStyle
+from formatter.config import BodyStyle, ExportOptions, FigureStyle, FormatConfig, HeadingStyle
 
 
 def build_format_config(
@@ -29,6 +29,7 @@ def build_format_config(
     page_num_position: str,
     figure_max_width_cm: float = 14.0,
     figure_align: str = "center",
+    figure_dpi: float | None = None,
 ) -> FormatConfig:
     # Backward compatibility: if separate heading fonts are not provided, fall back to single heading_font
     resolved_heading_cn_font = heading_cn_font or heading_font or cn_font
@@ -63,7 +64,30 @@ def build_format_config(
     return FormatConfig(
         body_style=body_style,
         heading_styles=heading_styles,
-        figure_style=FigureStyle(max_width_cm=figure_max_width_cm, align=figure_align),
+        figure_style=FigureStyle(max_width_cm=figure_max_width_cm, align=figure_align, dpi=figure_dpi),
         clear_background=clear_background,
         page_num_position=page_num_position,
     )
+
+
+def build_export_options(
+    *,
+    resolve_equation_numbers: bool = False,
+    backend: str = "python-docx",
+    inherit_styles: bool = False,
+    compression: str | None = None,
+    deterministic: bool = False,
+    template_id: str | None = None,
+    link_figures_min_bytes: int | None = None,
+    draft: bool = False,
+) -> ExportOptions:
+    return ExportOptions(
+        resolve_equation_numbers=resolve_equation_numbers,
+        backend=backend,
+        inherit_styles=inherit_styles,
+        compression=compression,
+        deterministic=deterministic,
+        template_id=template_id,
+        link_figures_min_bytes=link_figures_min_bytes,
+        draft=draft,
+    )
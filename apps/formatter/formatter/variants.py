@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+from collections.abc import Mapping, Sequence
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import IO, Any
+from zipfile import ZIP_STORED, ZipFile
+
+from formatter.config import ExportOptions, FormatConfig
+from formatter.deadlines import StageWatchdog
+from formatter.docx_builder import build_docx, load_figure_source
+from formatter.docx_package import deterministic_timestamp, zip_entry
+from formatter.figures import FigureHeader, collect_figure_sources, prefetch_figures
+from formatter.math_batch import collect_math_latex, convert_math_batch
+from formatter.workers import process_pool
+
+Node = dict[str, Any]
+
+
+def _default_workers() -> int:
+    configured = os.getenv("FORMATTER_VARIANT_WORKERS")
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            pass
+    return os.cpu_count() or 1
+
+
+def resolve_figures(
+    ast: list[Node], *, watchdog: StageWatchdog | None = None, link_min_bytes: int | None = None
+) -> dict[str, bytes | FigureHeader | None]:
+    # Remote and data: URI figures as bytes, for exports that share them.
+    # Local paths are left to each export so the embedded file names stay
+    # the same as for a single export.
+    watchdog = watchdog or StageWatchdog()
+    figures = dict(prefetch_figures(ast, watchdog=watchdog, link_min_bytes=link_min_bytes))
+    for src in collect_figure_sources(ast):
+        if src in figures or not src.startswith("data:image"):
+            continue
+        source = watchdog.run("figures", load_figure_source, src, fallback=lambda: None, detail=src)
+        figures[src] = source.getvalue() if source is not None else None
+    return figures
+
+
+def _build_variant(
+    ast: list[Node],
+    output_path: str,
+    config: FormatConfig,
+    options: ExportOptions,
+    math_omml: Mapping[str, str | None],
+    figures: Mapping[str, bytes | FigureHeader | None],
+    watchdog: StageWatchdog,
+) -> list[dict[str, Any]]:
+    # Runs in a worker on a copy of the caller's watchdog and returns the
+    # events it added, for the caller to merge.
+    known = len(watchdog.events)
+    build_docx(ast, output_path, config, math_omml=math_omml, figures=figures, watchdog=watchdog, options=options)
+    return watchdog.events[known:]
+
+
+def build_docx_variants(
+    ast: list[Node],
+    variants: Sequence[tuple[FormatConfig, str | os.PathLike[str]]],
+    *,
+    options: ExportOptions | None = None,
+    watchdog: StageWatchdog | None = None,
+    max_workers: int | None = None,
+) -> None:
+    # Builds one DOCX per (config, output path). Formulas and figures are
+    # resolved once; the variants are built in a process pool.
+    options = options or ExportOptions()
+    watchdog = watchdog or StageWatchdog()
+    if options.draft:
+        math_omml, figures = {}, {}
+    else:
+        math_omml = convert_math_batch(collect_math_latex(ast), watchdog=watchdog)
+        figures = resolve_figures(ast, watchdog=watchdog, link_min_bytes=options.link_figures_min_bytes)
+
+    workers = min(max_workers if max_workers is not None else _default_workers(), len(variants))
+    if workers > 1:
+        try:
+            with process_pool(workers) as pool:
+                futures = [
+                    pool.submit(_build_variant, ast, os.fspath(path), config, options, math_omml, figures, watchdog)
+                    for config, path in variants
+                ]
+                for future in futures:
+                    watchdog.events.extend(future.result())
+            return
+        except (OSError, BrokenProcessPool):
+            pass
+    for config, path in variants:
+        build_docx(ast, path, config, math_omml=math_omml, figures=figures, watchdog=watchdog, options=options)
+
+
+def write_variants_zip(
+    ast: list[Node],
+    presets: Sequence[tuple[str, FormatConfig]],
+    output: str | os.PathLike[str] | IO[bytes],
+    *,
+    options: ExportOptions | None = None,
+    watchdog: StageWatchdog | None = None,
+    max_workers: int | None = None,
+) -> None:
+    # One `<name>.docx` entry per preset. The documents are already deflated,
+    # so entries are stored.
+    options = options or ExportOptions()
+    timestamp = deterministic_timestamp() if options.deterministic else None
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [Path(directory) / f"{index}.docx" for index in range(len(presets))]
+        build_docx_variants(
+            ast,
+            [(config, path) for (_, config), path in zip(presets, paths)],
+            options=options,
+            watchdog=watchdog,
+            max_workers=max_workers,
+        )
+        with ZipFile(output, "w", compression=ZIP_STORED) as archive:
+            for (name, _), path in zip(presets, paths):
+                if timestamp is None:
+                    archive.write(path, f"{name}.docx")
+                    continue
+                with path.open("rb") as source, archive.open(zip_entry(archive, f"{name}.docx", timestamp), "w") as target:
+                    shutil.copyfileobj(source, target)
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Imported once by the fork server, so each worker starts with them loaded.
+_PRELOAD = ["formatter.chapters", "formatter.variants"]
+
+
+def process_pool(max_workers: int) -> ProcessPoolExecutor:
+    # A fork of the threaded API server would copy locks other threads hold
+    # at that moment, so workers come from a fork server (or are spawned
+    # where there is none).
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(_PRELOAD)
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+def terminate_workers(pool: ProcessPoolExecutor) -> None:
+    # For work past its budget: shutdown() alone would wait for it to finish.
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
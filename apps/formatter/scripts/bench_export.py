@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import argparse
+import base64
+import io
+import random
+import struct
+import sys
+import time
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from formatter.config import ExportOptions, FormatConfig  # noqa: E402
+from formatter.docx_builder import build_docx  # noqa: E402
+from formatter.docx_package import COMPRESSION_PROFILES  # noqa: E402
+from formatter.fragment_cache import clear_fragment_cache  # noqa: E402
+
+Node = dict[str, Any]
+
+BACKENDS = ("python-docx", "streaming")
+
+
+def _text_run(text: str, **styles: bool) -> Node:
+    return {"text": text, **styles}
+
+
+def _report_ast(size: int) -> list[Node]:
+    # `size` sections, each with a heading, body paragraphs, a list, a
+    # formula and a small table.
+    ast: list[Node] = []
+    for section in range(1, size + 1):
+        ast.append({"type": "heading", "level": 1, "runs": [_text_run(f"第 {section} 节 Section {section}")]})
+        for para in range(4):
+            ast.append(
+                {
+                    "type": "paragraph",
+                    "runs": [
+                        _text_run(f"Paragraph {para} of section {section} with "),
+                        _text_run("bold", bold=True),
+                        _text_run(" and "),
+                        _text_run("italic", italic=True),
+                        _text_run(" text, inline "),
+                        {"type": "math", "latex": "x_i"},
+                        _text_run(" math and a reference [1]."),
+                    ],
+                }
+            )
+        ast.append(
+            {
+                "type": "list",
+                "ordered": False,
+                "level": 1,
+                "items": [[{"type": "paragraph", "runs": [_text_run(f"Item {idx}")]}] for idx in range(3)],
+            }
+        )
+        ast.append({"type": "math_block", "latex": "E = mc^2"})
+        ast.append(
+            {
+                "type": "table",
+                "header": [{"runs": [_text_run("Name")]}, {"runs": [_text_run("Value")]}],
+                "rows": [[{"runs": [_text_run(f"r{idx}")]}, {"runs": [_text_run(str(idx))]}] for idx in range(5)],
+            }
+        )
+        ast.append({"type": "code_block", "text": "for i in range(10):\n    print(i)"})
+    return ast
+
+
+def _table_ast(size: int) -> list[Node]:
+    # One data table with `size` rows of five columns.
+    header = [{"runs": [_text_run(name)]} for name in ("ID", "Name", "Score", "Ratio", "Note")]
+    rows = [
+        [
+            {"runs": [_text_run(str(idx))]},
+            {"runs": [_text_run(f"sample-{idx}")]},
+            {"runs": [_text_run(str(idx % 100), bold=True)]},
+            {"runs": [_text_run(f"{idx / 3:.3f}")]},
+            {"runs": [_text_run("ok" if idx % 7 else "check", italic=True)]},
+        ]
+        for idx in range(size)
+    ]
+    return [{"type": "table", "header": header, "rows": rows}]
+
+
+def _runs_ast(size: int) -> list[Node]:
+    # `size` paragraphs of 40 short runs cycling through the inline styles.
+    styles: list[dict[str, bool]] = [
+        {},
+        {"bold": True},
+        {"italic": True},
+        {"code": True},
+        {"link": True},
+        {"strike": True},
+        {"highlight": True},
+        {"superscript": True},
+        {"bold": True, "italic": True},
+        {"subscript": True},
+    ]
+    return [
+        {
+            "type": "paragraph",
+            "runs": [_text_run(f"w{para}-{idx} ", **styles[idx % len(styles)]) for idx in range(40)],
+        }
+        for para in range(size)
+    ]
+
+
+def _noise_png(width: int, height: int, seed: int) -> bytes:
+    # Stands in for a photo or screenshot: pixels deflate cannot shrink.
+    rng = random.Random(seed)
+    raw = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def _figures_ast(size: int) -> list[Node]:
+    # `size` sections of a heading, two paragraphs and a 400x300 image.
+    ast: list[Node] = []
+    for section in range(1, size + 1):
+        payload = base64.b64encode(_noise_png(400, 300, section)).decode("ascii")
+        ast.append({"type": "heading", "level": 1, "runs": [_text_run(f"Figure section {section}")]})
+        for para in range(2):
+            ast.append({"type": "paragraph", "runs": [_text_run(f"Paragraph {para} describing figure {section}.")]})
+        ast.append({"type": "figure", "src": f"data:image/png;base64,{payload}", "alt": f"figure {section}"})
+    return ast
+
+
+def _math_ast(size: int) -> list[Node]:
+    # `size` sections of a paragraph with three inline formulas and a
+    # display formula, all distinct.
+    ast: list[Node] = []
+    for section in range(1, size + 1):
+        ast.append(
+            {
+                "type": "paragraph",
+                "runs": [
+                    _text_run(f"Section {section} relates "),
+                    {"type": "math", "latex": f"x_{{{section}}}"},
+                    _text_run(" to "),
+                    {"type": "math", "latex": f"\\alpha^{{{section}}}"},
+                    _text_run(" and "),
+                    {"type": "math", "latex": f"\\frac{{a_{{{section}}}}}{{b}}"},
+                    _text_run("."),
+                ],
+            }
+        )
+        ast.append({"type": "math_block", "latex": f"\\sum_{{i=1}}^{{{section}}} i^2 = \\frac{{n(n+1)(2n+1)}}{{6}}"})
+    return ast
+
+
+# name -> (AST factory, default size)
+SCENARIOS: dict[str, tuple[Callable[[int], list[Node]], int]] = {
+    "report": (_report_ast, 200),
+    "table": (_table_ast, 10_000),
+    "runs": (_runs_ast, 2_000),
+    "figures": (_figures_ast, 20),
+    "math": (_math_ast, 150),
+}
+
+
+def _run_backend(
+    ast: list[Node],
+    backend: str,
+    iterations: int,
+    inherit_styles: bool,
+    reexport: bool,
+    compression: str | None,
+    draft: bool = False,
+) -> tuple[float, int, int]:
+    config = FormatConfig()
+    options = ExportOptions(backend=backend, inherit_styles=inherit_styles, compression=compression, draft=draft)
+    # Warm up the template cache and formula conversion once.
+    clear_fragment_cache()
+    build_docx(ast, io.BytesIO(), config, options=options)
+    timings = []
+    output = io.BytesIO()
+    for iteration in range(iterations):
+        exported = ast
+        if reexport:
+            # Edit one block between exports; the rest comes from the fragment cache.
+            exported = list(ast)
+            exported[len(ast) // 2] = {"type": "paragraph", "text": f"Edited paragraph {iteration}"}
+        else:
+            clear_fragment_cache()
+        output = io.BytesIO()
+        started = time.perf_counter()
+        build_docx(exported, output, config, options=options)
+        timings.append(time.perf_counter() - started)
+    document_size = zipfile.ZipFile(output).getinfo("word/document.xml").file_size
+    return sum(timings) / len(timings), len(output.getvalue()), document_size
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark DOCX export throughput.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="report")
+    parser.add_argument("--size", type=int, help="scenario size (sections, table rows, ...)")
+    parser.add_argument("--iterations", "-n", type=int, default=5)
+    parser.add_argument("--backend", choices=("all", *BACKENDS), default="all")
+    parser.add_argument("--inherit-styles", action="store_true", help="export with ExportOptions.inherit_styles")
+    parser.add_argument("--reexport", action="store_true", help="edit one block per export, reusing cached blocks")
+    parser.add_argument(
+        "--compression",
+        choices=("all", *COMPRESSION_PROFILES),
+        help="zip compression profile; 'all' compares export time and size for every profile",
+    )
+    parser.add_argument(
+        "--draft", action="store_true", help="also export with ExportOptions.draft and compare against full exports"
+    )
+    args = parser.parse_args(argv)
+
+    factory, default_size = SCENARIOS[args.scenario]
+    size = args.size or default_size
+    ast = factory(size)
+    blocks = len(ast)
+    backends = BACKENDS if args.backend == "all" else (args.backend,)
+    print(
+        f"scenario={args.scenario} size={size} blocks={blocks} iterations={args.iterations}"
+        f" inherit_styles={args.inherit_styles} reexport={args.reexport}"
+    )
+    profiles = list(COMPRESSION_PROFILES) if args.compression == "all" else [args.compression]
+    modes = (False, True) if args.draft else (False,)
+    for backend in backends:
+        for profile in profiles:
+            for draft in modes:
+                mean, output_size, document_size = _run_backend(
+                    ast, backend, max(1, args.iterations), args.inherit_styles, args.reexport, profile, draft
+                )
+                label = backend if profile is None else f"{backend}/{profile}"
+                if draft:
+                    label += "/draft"
+                print(
+                    f"{label:>21}: mean={mean * 1000:.1f}ms blocks/s={blocks / mean:,.0f} bytes={output_size:,}"
+                    f" document.xml={document_size:,}"
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
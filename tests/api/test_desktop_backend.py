@@ -1,4 +1,4 @@
-from apps.api.desktop_backend import build_server_config
+from apps.api.desktop_backend import build_cache_env, build_server_config
 
 
 def test_build_server_config_uses_desktop_defaults():
@@ -25,3 +25,20 @@ def test_build_server_config_respects_environment_values():
         "port": 9123,
         "log_level": "info",
     }
+
+
+def test_build_cache_env_places_omml_cache_next_to_export_db(tmp_path):
+    env = build_cache_env({"EXPORT_DB_PATH": str(tmp_path / "export_counts.db")})
+
+    assert env == {"OMML_CACHE_PATH": str(tmp_path / "omml_cache.db")}
+
+
+def test_build_cache_env_respects_explicit_path_and_opt_out(tmp_path):
+    assert build_cache_env({"OMML_CACHE_PATH": str(tmp_path / "custom.db")}) == {}
+    assert (
+        build_cache_env(
+            {"EXPORT_DB_PATH": str(tmp_path / "export_counts.db"), "DESKTOP_OMML_CACHE": "0"}
+        )
+        == {}
+    )
+    assert build_cache_env({}) == {}
@@ -57,3 +57,20 @@ def test_generate_increments_export_stats(tmp_path, monkeypatch):
     assert response.status_code == 200
     assert after["today"] == before["today"] + 1
     assert after["total"] == before["total"] + 1
+
+
+def test_image_cache_stats_report_hits_and_misses(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXPORT_DB_PATH", str(tmp_path / "export_counts.db"))
+    client = TestClient(app)
+    monkeypatch.delenv("IMAGE_CACHE_DIR", raising=False)
+    assert client.get("/api/cache/images").json() == {"enabled": False}
+
+    monkeypatch.setenv("IMAGE_CACHE_DIR", str(tmp_path / "images"))
+    png = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMCAO6p8L8AAAAASUVORK5CYII="
+    payload = {**_base_generate_payload(), "markdown": f"![图](data:image/png;base64,{png})"}
+    for _ in range(2):
+        assert client.post("/api/generate", json=payload).status_code == 200
+
+    stats = client.get("/api/cache/images").json()
+    assert stats["enabled"] is True
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
@@ -1,4 +1,5 @@
 import io
+import tempfile
 
 from fastapi.testclient import TestClient
 
@@ -89,12 +90,12 @@ def test_generate_endpoint_accepts_paragraph_units():
     assert len(response.content) > 0
 
 
-def test_generate_endpoint_builds_docx_in_memory_stream(monkeypatch):
+def test_generate_endpoint_builds_docx_in_spooled_file(monkeypatch):
     client = TestClient(app)
-    captured = {"is_bytes_io": False}
+    captured = {"is_spooled": False}
 
-    def fake_build_docx(ast, output_path, config=None):
-        captured["is_bytes_io"] = isinstance(output_path, io.BytesIO)
+    def fake_build_docx(ast, output_path, config=None, **kwargs):
+        captured["is_spooled"] = isinstance(output_path, tempfile.SpooledTemporaryFile)
         output_path.write(b"fake-docx-bytes")
 
     monkeypatch.setattr("apps.api.main.build_docx", fake_build_docx)
@@ -133,8 +134,29 @@ def test_generate_endpoint_builds_docx_in_memory_stream(monkeypatch):
     )
 
     assert response.status_code == 200
-    assert captured["is_bytes_io"] is True
+    assert captured["is_spooled"] is True
     assert response.content == b"fake-docx-bytes"
+    assert response.headers["content-length"] == str(len(b"fake-docx-bytes"))
+
+
+def test_generate_endpoint_streams_large_exports_in_chunks(monkeypatch):
+    client = TestClient(app)
+    payload = bytes(range(256)) * 4096
+    spooled = []
+
+    def fake_build_docx(ast, output_path, config=None, **kwargs):
+        output_path.write(payload)
+        spooled.append(output_path)
+
+    monkeypatch.setattr("apps.api.main.build_docx", fake_build_docx)
+    monkeypatch.setattr("apps.api.main.EXPORT_SPOOL_MAX_BYTES", 64 * 1024)
+
+    response = client.post("/api/generate", json={"markdown": "# Title", "config": {}})
+
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(payload))
+    assert response.content == payload
+    assert spooled[0].closed
 
 
 def test_generate_endpoint_accepts_bibliography_and_figure_settings():
@@ -183,3 +205,200 @@ def test_generate_endpoint_accepts_bibliography_and_figure_settings():
     )
 
     assert response.status_code == 200
+
+
+def test_generate_endpoint_can_resolve_equation_numbers():
+    from docx import Document
+
+    client = TestClient(app)
+    response = client.post(
+        "/api/generate",
+        json={
+            "markdown": "$$a$$\n\n$$b$$",
+            "config": {},
+            "options": {"resolve_equation_numbers": True},
+        },
+    )
+
+    assert response.status_code == 200
+    xml = Document(io.BytesIO(response.content)).part._element.xml
+    assert "SEQ Equation" in xml
+    assert 'w:dirty="true"' not in xml
+
+
+def test_generate_endpoint_supports_streaming_backend():
+    from docx import Document
+
+    client = TestClient(app)
+    response = client.post(
+        "/api/generate",
+        json={
+            "markdown": "# Title\n\nBody with $x$.\n\n| a | b |\n| - | - |\n| 1 | 2 |",
+            "config": {},
+            "options": {"backend": "streaming"},
+        },
+    )
+
+    assert response.status_code == 200
+    doc = Document(io.BytesIO(response.content))
+    assert doc.paragraphs[0].text == "Title"
+    assert len(doc.tables) == 1
+
+
+def test_generate_endpoint_can_inherit_paragraph_styles():
+    from docx import Document
+
+    client = TestClient(app)
+    response = client.post(
+        "/api/generate",
+        json={
+            "markdown": "Body text.\n\n| a | b |\n| - | - |\n| 1 | 2 |",
+            "config": {},
+            "options": {"inherit_styles": True},
+        },
+    )
+
+    assert response.status_code == 200
+    doc = Document(io.BytesIO(response.content))
+    assert doc.paragraphs[0]._p.pPr is None
+    assert doc.tables[0].cell(0, 0).paragraphs[0].style.name == "Report Table Cell"
+
+
+def test_generate_endpoint_accepts_zip_compression_profile():
+    import zipfile
+
+    client = TestClient(app)
+    response = client.post(
+        "/api/generate",
+        json={"markdown": "# Title\n\nBody.", "config": {}, "options": {"compression": "fast"}},
+    )
+    assert response.status_code == 200
+    assert zipfile.ZipFile(io.BytesIO(response.content)).getinfo("docProps/thumbnail.jpeg").compress_type == 0
+
+    rejected = client.post(
+        "/api/generate",
+        json={"markdown": "# Title", "config": {}, "options": {"compression": "zstd"}},
+    )
+    assert rejected.status_code == 422
+
+
+def test_generate_endpoint_deterministic_exports_match():
+    client = TestClient(app)
+    request = {"markdown": "# Title\n\nBody with $x$.", "config": {}, "options": {"deterministic": True}}
+
+    first = client.post("/api/generate", json=request)
+    second = client.post("/api/generate", json=request)
+
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content
+
+
+def test_generate_chapters_endpoint_merges_chapters():
+    from docx import Document
+
+    client = TestClient(app)
+    response = client.post(
+        "/api/generate/chapters",
+        json={
+            "chapters": ["# One\n\nSee [@a].\n\n$$\nx\n$$", "# Two\n\n$$\ny\n$$\n\nSee [@b]."],
+            "config": {},
+            "options": {"resolve_equation_numbers": True},
+        },
+    )
+
+    assert response.status_code == 200
+    doc = Document(io.BytesIO(response.content))
+    texts = [paragraph.text for paragraph in doc.paragraphs]
+    assert texts[0] == "One" and "Two" in texts
+    assert texts.count("参考文献") == 1
+    assert "(2)" in "".join(texts)
+
+    assert client.post("/api/generate/chapters", json={"chapters": []}).status_code == 422
+
+
+def test_generate_presets_endpoint_returns_one_docx_per_preset():
+    import zipfile
+
+    client = TestClient(app)
+    response = client.post(
+        "/api/generate/presets",
+        json={
+            "markdown": "# Title\n\nBody with $x$.",
+            "presets": [
+                {"name": "GBT 论文", "config": {"body_size_pt": 12}},
+                {"name": "company", "config": {"body_size_pt": 11, "justify": False}},
+            ],
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.namelist() == ["GBT 论文.docx", "company.docx"]
+
+    duplicate = client.post(
+        "/api/generate/presets",
+        json={"markdown": "x", "presets": [{"name": "a"}, {"name": "a"}]},
+    )
+    assert duplicate.status_code == 422
+    assert client.post("/api/generate/presets", json={"markdown": "x", "presets": [{"name": "../a"}]}).status_code == 422
+
+
+def test_generate_presets_endpoint_validates_configs_before_the_preview(monkeypatch):
+    def _invalid(**_kwargs):
+        raise ValueError("invalid preset")
+
+    def _unexpected(*_args, **_kwargs):
+        raise AssertionError("the preview should not be built for invalid presets")
+
+    monkeypatch.setattr("apps.api.main.build_format_config", _invalid)
+    monkeypatch.setattr("apps.api.main.build_preview_payload", _unexpected)
+    client = TestClient(app)
+
+    response = client.post("/api/generate/presets", json={"markdown": "x", "presets": [{"name": "a"}]})
+
+    assert response.status_code == 422
+    assert response.json()["detail"] == "invalid preset"
+
+
+def test_uploaded_templates_are_used_for_exports(tmp_path, monkeypatch):
+    from docx import Document
+    from docx.shared import Cm
+
+    client = TestClient(app)
+    monkeypatch.delenv("TEMPLATE_STORE_DIR", raising=False)
+    assert client.get("/api/templates").status_code == 503
+
+    monkeypatch.setenv("TEMPLATE_STORE_DIR", str(tmp_path / "templates"))
+    reference = Document()
+    reference.sections[0].left_margin = Cm(2.0)
+    reference.add_paragraph("Sample content")
+    data = io.BytesIO()
+    reference.save(data)
+
+    upload = client.post("/api/templates", content=data.getvalue())
+    assert upload.status_code == 201
+    template_id = upload.json()["template_id"]
+    assert client.get("/api/templates").json() == {
+        "templates": [{"template_id": template_id, "size": len(data.getvalue())}]
+    }
+    assert client.post("/api/templates", content=b"not a docx").status_code == 422
+    monkeypatch.setattr("formatter.template_store.TemplateStore.max_bytes", 1024)
+    assert client.post("/api/templates", content=data.getvalue()).status_code == 413
+
+    def _chunks():
+        yield data.getvalue()
+
+    # Without a Content-Length the body is streamed and cut off at the cap.
+    assert client.post("/api/templates", content=_chunks()).status_code == 413
+
+    payload = {"markdown": "# Title\n\nHello.", "options": {"template_id": template_id}}
+    response = client.post("/api/generate", json=payload)
+    assert response.status_code == 200
+    doc = Document(io.BytesIO(response.content))
+    assert [paragraph.text for paragraph in doc.paragraphs] == ["Title", "Hello."]
+    assert round(doc.sections[0].left_margin.cm, 2) == 2.0
+
+    assert client.delete(f"/api/templates/{template_id}").status_code == 204
+    assert client.delete(f"/api/templates/{template_id}").status_code == 404
+    assert client.post("/api/generate", json=payload).status_code == 422
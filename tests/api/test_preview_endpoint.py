@@ -1,3 +1,5 @@
+import json
+
 from fastapi.testclient import TestClient
 
 from apps.api.main import app
@@ -70,3 +72,35 @@ def test_preview_endpoint_supports_bibliography_source_manager():
     assert response.status_code == 200
     payload = response.json()
     assert payload["refs"] == ["[1]"]
+
+
+def test_preview_outline_endpoint_returns_heading_tree():
+    client = TestClient(app)
+    response = client.post(
+        "/api/preview/outline",
+        json={"markdown": "# Title\n\nHello.\n\n## Part\n\n- item"},
+    )
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert [(node["text"], node["line_start"], node["line_end"]) for node in payload["outline"]] == [
+        ("Title", 1, 4),
+        ("Part", 5, 7),
+    ]
+    assert payload["summary"]["lists"] == 1
+
+
+def test_preview_stream_endpoint_returns_ndjson_records():
+    client = TestClient(app)
+    response = client.post(
+        "/api/preview/stream",
+        json={"markdown": "# Title\n\nHello [1].\n\n# 一级\n\n#### 四级"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["type"] for record in records] == ["block"] * 5 + ["summary"]
+    assert records[0]["html"] == "<h1>Title</h1>\n"
+    assert records[-1]["refs"] == ["[1]"]
+    assert {item["code"] for item in records[-1]["lint_warnings"]} == {"heading_level_jump"}
@@ -1,4 +1,8 @@
-from formatter.app_logic import build_preview_payload
+import time
+
+from formatter.app_logic import build_preview_payload, iter_preview_records
+from formatter.deadlines import StageBudgets, StageWatchdog
+from formatter.markdown_parser import parse_markdown_section_blocks
 
 
 def test_build_preview_payload_returns_summary_and_refs():
@@ -7,3 +11,42 @@ def test_build_preview_payload_returns_summary_and_refs():
     assert payload["refs"] == ["[1]"]
     assert payload["lint_warnings"] == []
     assert "quality_report" in payload
+
+
+def test_iter_preview_records_streams_the_preview_payload():
+    text = "# Title\n\nHello [1].\n\n## Part\n\n- item\n\n$$\nx\n$$\n"
+    payload = build_preview_payload(text)
+
+    records = list(iter_preview_records(text))
+
+    blocks, summary = records[:-1], records[-1]
+    assert [record["type"] for record in blocks] == ["block"] * len(blocks)
+    assert [record["index"] for record in blocks] == list(range(len(blocks)))
+    assert [node for record in blocks for node in record["ast"]] == payload["ast"]
+    assert "".join(record["html"] for record in blocks) == payload["preview_html"]
+    assert blocks[-1]["ast"][0]["text"] == "参考文献"
+    assert summary == {
+        "type": "summary",
+        "summary": payload["summary"],
+        "refs": payload["refs"],
+        "lint_warnings": payload["lint_warnings"],
+        "quality_report": payload["quality_report"],
+    }
+
+
+def _slow_blocks(section, definitions, references):
+    time.sleep(0.2)
+    return parse_markdown_section_blocks(section, definitions, references)
+
+
+def test_iter_preview_records_shares_one_parse_budget_across_sections(monkeypatch):
+    monkeypatch.setattr("formatter.app_logic.parse_markdown_section_blocks", _slow_blocks)
+    watchdog = StageWatchdog(StageBudgets(parse=0.3))
+    text = "".join(f"# Part {idx}\n\ntext {idx}\n\n" for idx in range(5))
+
+    records = list(iter_preview_records(text, watchdog=watchdog))
+
+    texts = [node["text"] for record in records[:-1] for node in record["ast"]]
+    assert texts[:2] == ["Part 0", "text 0"]
+    assert texts[2:] == [line for idx in range(1, 5) for line in (f"# Part {idx}", f"text {idx}")]
+    assert [event["stage"] for event in watchdog.events] == ["parse"]
@@ -0,0 +1,106 @@
+import zipfile
+
+import pytest
+
+from formatter.chapters import CHAPTER_SEPARATOR, build_chapters_docx, format_chapters, main
+from formatter.citations import normalize_citation_chapters, normalize_citations
+from formatter.config import ExportOptions, FormatConfig
+from formatter.docx_builder import build_docx
+from formatter.pipeline import format_markdown
+
+ONE_PIXEL_PNG = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMCAO6p8L8AAAAASUVORK5CYII="
+
+CHAPTERS = [
+    "# 第一章 引言\n\n引用 [@smith] 和 [2]。\n\n$$\nE = mc^2\n$$\n\n"
+    f"![first](data:image/png;base64,{ONE_PIXEL_PNG})\n",
+    "# 第二章 方法\n\n- 列表项 $x_i$\n\n  $$\n  a^2 + b^2 = c^2\n  $$\n\n"
+    "> 引用块 [@jones]\n\n| a | b |\n| - | - |\n| 1 | 2 |\n",
+    "# 第三章 结果\n\n再次引用 [@smith]。\n\n"
+    f"![second](data:image/png;base64,{ONE_PIXEL_PNG})\n\n$$\n\\frac{{1}}{{2}}\n$$\n",
+]
+# Definitions apply across chapters, as in the concatenated document.
+DEFINITION_CHAPTERS = [
+    "# A\n\nSee [link][r] and note[^1].",
+    "# B\n\n[r]: http://x.com\n\n[^1]: The note.",
+]
+SOURCES = "@article{smith, author={Smith}, title={A}, year={2020}}\n[2] Manual source."
+
+
+def _document_xml(path):
+    return zipfile.ZipFile(path).read("word/document.xml")
+
+
+def test_normalize_citation_chapters_matches_the_joined_text():
+    normalized, refs, key_map = normalize_citation_chapters(CHAPTERS)
+    joined, joined_refs, joined_key_map = normalize_citations(CHAPTER_SEPARATOR.join(CHAPTERS))
+
+    assert CHAPTER_SEPARATOR.join(normalized) == joined
+    assert (refs, key_map) == (joined_refs, joined_key_map) == (["[2]", "[3]", "[4]"], {3: "smith", 4: "jones"})
+
+
+@pytest.mark.parametrize("backend", ["streaming", "python-docx"])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chapter_export_matches_the_concatenated_document(tmp_path, workers, backend):
+    options = ExportOptions(backend=backend, resolve_equation_numbers=True)
+    joined = format_markdown(CHAPTER_SEPARATOR.join(CHAPTERS), bibliography_sources=SOURCES)
+    build_docx(joined["ast"], tmp_path / "joined.docx", FormatConfig(), options=options)
+
+    refs = build_chapters_docx(
+        CHAPTERS,
+        tmp_path / "chapters.docx",
+        bibliography_sources=SOURCES,
+        options=options,
+        max_workers=workers,
+    )
+
+    assert refs == joined["refs"]
+    xml = _document_xml(tmp_path / "chapters.docx")
+    assert xml == _document_xml(tmp_path / "joined.docx")
+    text = xml.decode("utf-8")
+    assert "图 1 first" in text and "图 2 second" in text
+    assert text.count(">参考文献<") == 1
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chapter_definitions_resolve_across_chapters(tmp_path, workers):
+    options = ExportOptions(backend="streaming")
+    joined = format_markdown(CHAPTER_SEPARATOR.join(DEFINITION_CHAPTERS))
+    build_docx(joined["ast"], tmp_path / "joined.docx", FormatConfig(), options=options)
+
+    build_chapters_docx(DEFINITION_CHAPTERS, tmp_path / "chapters.docx", options=options, max_workers=workers)
+
+    xml = _document_xml(tmp_path / "chapters.docx")
+    assert xml == _document_xml(tmp_path / "joined.docx")
+    text = xml.decode("utf-8")
+    assert "http://x.com" in text and ">脚注<" in text
+    assert "[link][r]" not in text and "[^1]" not in text
+
+
+def test_format_chapters_parses_chapters_with_definitions_apart():
+    chapters = [*DEFINITION_CHAPTERS, "# C\n\nAgain[^1] and [r]."]
+    joined = format_markdown(CHAPTER_SEPARATOR.join(chapters))
+
+    result = format_chapters(chapters)
+
+    assert len(result["chapters"]) == 3
+    assert [node for ast in result["chapters"] for node in ast] == joined["ast"]
+    assert [node["text"] for node in result["chapters"][-1][-3:]] == ["Again[1] and r (http://x.com).", "脚注", "[1] The note."]
+
+
+def test_format_chapters_keeps_a_manual_bibliography():
+    result = format_chapters([CHAPTERS[0], "# 参考文献\n\n[3] Smith."])
+
+    assert result["bibliography"] == []
+    assert [len(ast) for ast in result["chapters"]] == [4, 2]
+
+
+def test_cli_writes_one_document(tmp_path, capsys):
+    paths = []
+    for idx, chapter in enumerate(CHAPTERS):
+        path = tmp_path / f"ch{idx}.md"
+        path.write_text(chapter, encoding="utf-8")
+        paths.append(str(path))
+
+    assert main([*paths, "-o", str(tmp_path / "thesis.docx"), "--workers", "1"]) == 0
+    assert "3 chapters, 3 references" in capsys.readouterr().out
+    assert b"\xe7\xac\xac\xe4\xb8\x89\xe7\xab\xa0" in _document_xml(tmp_path / "thesis.docx")
@@ -0,0 +1,90 @@
+import logging
+import multiprocessing
+import threading
+import time
+
+from docx import Document
+
+from formatter.config import FormatConfig
+from formatter.deadlines import StageBudgets, StageWatchdog
+from formatter.docx_builder import build_docx
+from formatter.pipeline import format_markdown
+
+
+def _slow(seconds, value=None):
+    def _inner(*_args, **_kwargs):
+        time.sleep(seconds)
+        return value
+
+    return _inner
+
+
+def test_stage_budgets_from_env_parses_known_stages():
+    budgets = StageBudgets.from_env({"FORMATTER_STAGE_BUDGETS": "parse=2, math=0.5,bogus=1,save=x"})
+
+    assert budgets.parse == 2.0
+    assert budgets.math == 0.5
+    assert budgets.save is None
+    assert not budgets.is_empty()
+    assert StageBudgets.from_env({}).is_empty()
+
+
+def test_watchdog_returns_fallback_and_logs_structured_warning(caplog):
+    watchdog = StageWatchdog(StageBudgets(math=0.05))
+
+    with caplog.at_level(logging.WARNING, logger="formatter.deadlines"):
+        result = watchdog.run("math", _slow(1.0, "late"), fallback=lambda: "fallback", detail="x^2")
+
+    assert result == "fallback"
+    assert watchdog.events[0]["stage"] == "math"
+    assert watchdog.events[0]["detail"] == "x^2"
+    assert caplog.records[0].formatter_deadline["event"] == "stage_deadline_exceeded"
+
+    # Budget exhausted: later calls degrade immediately without running.
+    assert watchdog.run("math", _slow(1.0, "late"), fallback=lambda: "again") == "again"
+
+
+def test_watchdog_without_budget_runs_inline():
+    watchdog = StageWatchdog()
+    assert watchdog.run("parse", lambda value: value * 2, 21, fallback=lambda: 0) == 42
+    assert watchdog.events == []
+
+
+def _stuck_parse(_text):
+    time.sleep(30)
+    return []
+
+
+def test_format_markdown_falls_back_to_plain_paragraphs_when_parse_overruns(monkeypatch):
+    monkeypatch.setattr("formatter.pipeline.parse_markdown", _stuck_parse)
+    watchdog = StageWatchdog(StageBudgets(parse=0.05))
+
+    threads = threading.active_count()
+    started = time.perf_counter()
+    result = format_markdown("# Title\n\nfirst\nline\n\nsecond", watchdog=watchdog)
+
+    # The overrunning parse is terminated rather than left running.
+    assert time.perf_counter() - started < 10
+    assert multiprocessing.active_children() == []
+    assert threading.active_count() == threads
+    assert [node["text"] for node in result["ast"]] == ["# Title", "first line", "second"]
+    assert watchdog.events[0]["stage"] == "parse"
+
+
+def test_build_docx_degrades_slow_math_and_figures(tmp_path, monkeypatch):
+    monkeypatch.setattr("formatter.math_batch._convert_uncached", _slow(1.0, None))
+    monkeypatch.setattr("formatter.docx_builder.load_figure_source", _slow(1.0, None))
+    watchdog = StageWatchdog(StageBudgets(math=0.05, figures=0.05))
+    ast = [
+        {"type": "math_block", "latex": r"\frac{a}{b}"},
+        {"type": "figure", "src": "https://example.invalid/a.png", "caption": "图"},
+    ]
+
+    output = tmp_path / "out.docx"
+    build_docx(ast, output, FormatConfig(), watchdog=watchdog)
+
+    doc = Document(output)
+    texts = [paragraph.text for paragraph in doc.paragraphs]
+    assert r"\frac{a}{b}" in texts[0]
+    assert texts[1].startswith("[图片加载失败]")
+    assert {event["stage"] for event in watchdog.events} == {"math", "figures"}
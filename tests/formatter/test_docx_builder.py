@@ -3,7 +3,7 @@ import base64
 from docx import Document
 from docx.enum.text import WD_COLOR_INDEX, WD_ALIGN_PARAGRAPH
 
-from formatter.config import FormatConfig
+from formatter.config import ExportOptions, FormatConfig
 from formatter.docx_builder import build_docx
 
 
@@ -440,6 +440,23 @@ def test_table_uses_three_line_style(tmp_path):
     assert "insideV" not in tbl_xml
 
 
+def test_large_table_keeps_grid_header_border_and_short_rows(tmp_path):
+    rows = [[{"text": f"r{idx}"}, {"text": str(idx)}] for idx in range(2000)]
+    rows.append([{"text": "short"}])
+    ast = [{"type": "table", "header": [{"text": "H1"}, {"text": "H2"}], "rows": rows}]
+    output = tmp_path / "out.docx"
+    build_docx(ast, output, FormatConfig())
+
+    table = Document(output).tables[0]
+    assert len(table.rows) == 2002
+    assert len(table.columns) == 2
+    assert table.cell(1500, 0).text == "r1499"
+    assert table.cell(2001, 0).text == "short"
+    assert table.cell(2001, 1).text == ""
+    assert table.rows[0].cells[1]._tc.xml.count("w:tcBorders") == 2
+    assert "w:tcBorders" not in table.rows[1].cells[0]._tc.xml
+
+
 def test_build_docx_renders_task_list_checkboxes(tmp_path):
     ast = [
         {
@@ -524,3 +541,144 @@ def test_build_docx_renders_figures_with_caption_numbering(tmp_path):
     assert "图 1 系统总体架构" in paragraph_texts
     assert "图 2 数据处理流程" in paragraph_texts
     assert "graphicData" in doc.part._element.xml
+
+
+def _equation_field_results(xml):
+    from lxml import etree
+
+    root = etree.fromstring(xml.encode("utf-8"))
+    ns = {"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"}
+    results = []
+    for paragraph in root.iter("{%s}p" % ns["w"]):
+        runs = list(paragraph.iter("{%s}r" % ns["w"]))
+        for idx, run in enumerate(runs):
+            instr = run.find("w:instrText", ns)
+            if instr is not None and "SEQ Equation" in instr.text:
+                results.append(runs[idx + 2].find("w:t", ns).text)
+    return results
+
+
+def test_resolved_equation_numbers_scale_to_thousands_of_equations(tmp_path):
+    count = 2500
+    ast = [{"type": "math_block", "latex": "x"} for _ in range(count)]
+    ast.insert(
+        10,
+        {
+            "type": "list",
+            "ordered": False,
+            "level": 1,
+            "start": 1,
+            "items": [[{"type": "math_block", "latex": "y"}]],
+        },
+    )
+    output = tmp_path / "out.docx"
+    build_docx(ast, output, FormatConfig(), options=ExportOptions(resolve_equation_numbers=True))
+
+    xml = Document(output).part._element.xml
+    assert _equation_field_results(xml) == [str(number) for number in range(1, count + 2)]
+    assert 'w:dirty="true"' not in xml
+
+
+def test_equation_numbers_stay_dirty_placeholders_by_default(tmp_path):
+    ast = [{"type": "math_block", "latex": "x"}, {"type": "math_block", "latex": "y"}]
+    output = tmp_path / "out.docx"
+    build_docx(ast, output, FormatConfig())
+
+    xml = Document(output).part._element.xml
+    assert _equation_field_results(xml) == ["1", "1"]
+    assert xml.count('w:dirty="true"') == 2
+
+
+def test_build_docx_resolves_each_paragraph_style_once(tmp_path, monkeypatch):
+    from docx.parts.document import DocumentPart
+
+    calls = []
+    original = DocumentPart.get_style_id
+
+    def _counting(self, style_or_name, style_type):
+        calls.append(style_or_name)
+        return original(self, style_or_name, style_type)
+
+    monkeypatch.setattr(DocumentPart, "get_style_id", _counting)
+    items = [[{"type": "paragraph", "text": f"item {idx}", "runs": [{"text": f"item {idx}"}]}] for idx in range(50)]
+    ast = [
+        {"type": "heading", "level": 1, "text": "A"},
+        {"type": "heading", "level": 1, "text": "B"},
+        {"type": "list", "ordered": False, "level": 1, "items": items},
+    ]
+    output = tmp_path / "out.docx"
+    build_docx(ast, output, FormatConfig())
+
+    assert sorted(calls) == ["Heading 1", "List Bullet"]
+    doc = Document(output)
+    assert [p.style.name for p in doc.paragraphs[:3]] == ["Heading 1", "Heading 1", "List Bullet"]
+    assert doc.paragraphs[-1].text == "item 49"
+
+
+def test_inherit_styles_moves_repeated_formatting_into_styles(tmp_path):
+    ast = [
+        {"type": "heading", "level": 1, "runs": [{"text": "Title"}]},
+        {"type": "paragraph", "runs": [{"text": "plain "}, {"text": "bold", "bold": True}]},
+        {"type": "code_block", "text": "x = 1"},
+        {"type": "table", "header": [{"text": "A"}, {"text": "B"}], "rows": [[{"text": "1"}, {"text": "2"}]]},
+        {"type": "figure", "src": "data:image/png;base64," + base64.b64encode(ONE_PIXEL_PNG).decode(), "alt": "cap"},
+    ]
+    direct = tmp_path / "direct.docx"
+    inherited = tmp_path / "inherited.docx"
+    build_docx(ast, direct, FormatConfig())
+    build_docx(ast, inherited, FormatConfig(), options=ExportOptions(inherit_styles=True))
+
+    doc = Document(inherited)
+    heading, body, code, picture, caption = doc.paragraphs
+    assert heading.runs[0].bold is False
+    assert body._p.pPr is None
+    assert [run._r.rPr is None for run in body.runs] == [True, False]
+    assert code.style.name == "Report Code"
+    assert code.runs[0]._r.rPr is None
+    assert code.style.font.name == "Consolas"
+    assert picture.style.name == "Report Figure"
+    assert caption.style.name == "Report Caption"
+    assert caption.style.base_style.name == "Report Figure"
+    assert picture.style.paragraph_format.alignment == WD_ALIGN_PARAGRAPH.CENTER
+
+    cell = doc.tables[0].cell(1, 0).paragraphs[0]
+    assert cell.style.name == "Report Table Cell"
+    assert cell.paragraph_format.alignment is None
+    assert cell.style.paragraph_format.alignment == WD_ALIGN_PARAGRAPH.CENTER
+    assert cell.style.paragraph_format.first_line_indent == 0
+
+    assert len(doc.part.blob) < len(Document(direct).part.blob)
+
+
+def test_draft_export_skips_math_figures_and_cell_borders(tmp_path, monkeypatch):
+    def _no_network(*args, **kwargs):
+        raise AssertionError("draft exports do not fetch figures")
+
+    monkeypatch.setattr("formatter.docx_builder.prefetch_figures", _no_network)
+    ast = [
+        {"type": "paragraph", "runs": [{"text": "mass "}, {"type": "math", "latex": "m_0"}]},
+        {"type": "math_block", "latex": "E=mc^2"},
+        {"type": "table", "header": [{"text": "A"}], "rows": [[{"text": "1"}]]},
+        {"type": "figure", "src": "data:image/png;base64," + base64.b64encode(ONE_PIXEL_PNG).decode(), "alt": "dot"},
+        {"type": "figure", "src": "http://127.0.0.1:9/remote.png", "alt": "remote"},
+    ]
+    config = FormatConfig()
+    config.figure_style.max_width_cm = 8.0
+    output = tmp_path / "draft.docx"
+    build_docx(ast, output, config, options=ExportOptions(draft=True))
+
+    doc = Document(output)
+    xml = doc.part._element.xml
+    assert "oMath" not in xml and "graphicData" not in xml and "tcBorders" not in xml
+    assert [paragraph.text for paragraph in doc.paragraphs] == [
+        "mass m_0",
+        "\tE=mc^2\t(1)",
+        "[图片]",
+        "图 1 dot",
+        "[图片]",
+        "图 2 remote",
+    ]
+    boxes = [paragraph for paragraph in doc.paragraphs if paragraph.text == "[图片]"]
+    heights = [round(box.paragraph_format.line_spacing.cm, 1) for box in boxes]
+    assert heights == [8.0, 6.0]
+    assert not [part for part in doc.part.package.iter_parts() if part.partname.startswith("/word/media/")]
@@ -0,0 +1,92 @@
+import hashlib
+import io
+import time
+import zipfile
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+
+import pytest
+from docx import Document
+
+from formatter.config import ExportOptions, FormatConfig
+from formatter.docx_builder import build_docx
+from formatter.docx_package import (
+    COMPRESSION_PROFILES,
+    ZIP_EPOCH,
+    ZipCompression,
+    deterministic_timestamp,
+    resolve_compression,
+)
+
+ONE_PIXEL_PNG = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMCAO6p8L8AAAAASUVORK5CYII="
+
+AST = [
+    {"type": "heading", "level": 1, "runs": [{"text": "Title"}]},
+    {"type": "paragraph", "runs": [{"text": "Body " * 200}]},
+    {"type": "figure", "src": f"data:image/png;base64,{ONE_PIXEL_PNG}", "alt": "pixel"},
+]
+
+
+def _entries(options):
+    output = io.BytesIO()
+    build_docx(AST, output, FormatConfig(), options=options)
+    output.seek(0)
+    assert Document(output).paragraphs[0].text == "Title"
+    return {info.filename: info for info in zipfile.ZipFile(output).infolist()}, output.getvalue()
+
+
+@pytest.mark.parametrize("backend", ["python-docx", "streaming"])
+def test_compression_profiles_store_media_and_deflate_xml(backend):
+    entries, _ = _entries(ExportOptions(backend=backend, compression="fast"))
+
+    media = [info for name, info in entries.items() if name.startswith("word/media/")]
+    assert media and all(info.compress_type == ZIP_STORED for info in media)
+    assert entries["word/document.xml"].compress_type == ZIP_DEFLATED
+    assert entries["word/_rels/document.xml.rels"].compress_type == ZIP_DEFLATED
+
+    _, fast = _entries(ExportOptions(backend=backend, compression="fast"))
+    _, small = _entries(ExportOptions(backend=backend, compression="small"))
+    assert len(small) < len(fast)
+
+
+def test_default_profile_keeps_deflating_every_part():
+    entries, _ = _entries(ExportOptions())
+
+    assert all(info.compress_type == ZIP_DEFLATED for info in entries.values())
+
+
+def test_resolve_compression_prefers_request_over_environment(monkeypatch):
+    assert resolve_compression() == ZipCompression()
+
+    monkeypatch.setenv("FORMATTER_ZIP_COMPRESSION", "Fast")
+    assert resolve_compression() == COMPRESSION_PROFILES["fast"]
+    assert resolve_compression("small") == COMPRESSION_PROFILES["small"]
+
+    monkeypatch.setenv("FORMATTER_ZIP_COMPRESSION", "unknown")
+    assert resolve_compression() == ZipCompression()
+    with pytest.raises(ValueError):
+        resolve_compression("unknown")
+
+
+@pytest.mark.parametrize("backend", ["python-docx", "streaming"])
+def test_deterministic_exports_are_byte_identical(monkeypatch, backend):
+    options = ExportOptions(backend=backend, deterministic=True, compression="fast")
+    _, first = _entries(options)
+    clock = time.time() + 90
+    monkeypatch.setattr(time, "time", lambda: clock)
+    entries, second = _entries(options)
+
+    assert hashlib.sha256(first).hexdigest() == hashlib.sha256(second).hexdigest()
+    assert {info.date_time for info in entries.values()} == {(1980, 1, 1, 0, 0, 0)}
+    properties = Document(io.BytesIO(second)).core_properties
+    assert (properties.created, properties.modified, properties.revision) == (ZIP_EPOCH, ZIP_EPOCH, 1)
+
+
+def test_deterministic_timestamp_follows_source_date_epoch(monkeypatch):
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+    entries, _ = _entries(ExportOptions(backend="streaming", deterministic=True))
+
+    assert deterministic_timestamp().year == 2023
+    assert {info.date_time for info in entries.values()} == {(2023, 11, 14, 22, 13, 20)}
+
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "0")
+    assert deterministic_timestamp().year == 1980
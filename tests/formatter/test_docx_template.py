@@ -0,0 +1,139 @@
+import io
+import zipfile
+
+import pytest
+from docx import Document
+from docx.opc.oxml import serialize_part_xml
+from docx.parts.styles import StylesPart
+
+from formatter import docx_builder, docx_template
+from formatter.config import ExportOptions, FormatConfig, config_fingerprint
+from formatter.docx_builder import build_docx
+from formatter.docx_template import clear_template_cache
+from formatter.pipeline import format_markdown
+
+
+def _build_bytes(ast, config):
+    buffer = io.BytesIO()
+    build_docx(ast, buffer, config)
+    return buffer.getvalue()
+
+
+def test_config_fingerprint_tracks_style_changes():
+    base = FormatConfig()
+    changed = FormatConfig()
+    changed.body_style.size_pt = 14
+
+    assert config_fingerprint(base) == config_fingerprint(FormatConfig())
+    assert config_fingerprint(base) != config_fingerprint(changed)
+
+
+def test_repeated_exports_reuse_styled_template(monkeypatch):
+    clear_template_cache()
+    calls = []
+    original = docx_builder._new_styled_document
+
+    def _tracking(config, reference=None):
+        calls.append(config)
+        return original(config, reference)
+
+    monkeypatch.setattr(docx_builder, "_new_styled_document", _tracking)
+    config = FormatConfig()
+    ast = [{"type": "paragraph", "text": "Hello"}]
+
+    _build_bytes(ast, config)
+    _build_bytes(ast, FormatConfig())
+    other = FormatConfig()
+    other.body_style.size_pt = 10
+    _build_bytes(ast, other)
+
+    assert len(calls) == 2
+
+
+def test_cloned_template_output_matches_fresh_template_and_does_not_leak():
+    config = FormatConfig()
+    config.heading_styles[1].size_pt = 18
+    clear_template_cache()
+    fresh = _build_bytes([{"type": "paragraph", "text": "first"}], config)
+    cloned = _build_bytes([{"type": "paragraph", "text": "first"}], config)
+    again = _build_bytes([{"type": "paragraph", "text": "second"}], config)
+
+    with zipfile.ZipFile(io.BytesIO(fresh)) as fresh_zip, zipfile.ZipFile(io.BytesIO(cloned)) as cloned_zip:
+        assert fresh_zip.namelist() == cloned_zip.namelist()
+        for name in fresh_zip.namelist():
+            assert fresh_zip.read(name) == cloned_zip.read(name), name
+
+    doc = Document(io.BytesIO(again))
+    assert [paragraph.text for paragraph in doc.paragraphs] == ["second"]
+    assert doc.styles["Heading 1"].font.size.pt == 18
+
+
+def test_failed_style_setup_is_not_cached(monkeypatch):
+    clear_template_cache()
+
+    def _boom(*args, **kwargs):
+        raise RuntimeError("style write failed")
+
+    monkeypatch.setattr("formatter.docx_builder._apply_style_paragraph", _boom)
+    _build_bytes([{"type": "paragraph", "text": "Hello"}], FormatConfig())
+    monkeypatch.undo()
+
+    doc = Document(io.BytesIO(_build_bytes([{"type": "paragraph", "text": "Hello"}], FormatConfig())))
+    assert doc.styles["Normal"].font.size.pt == FormatConfig().body_style.size_pt
+
+
+FEATURES = """# Title
+
+## Section
+
+### Sub
+
+#### Detail
+
+Body with **bold**, *italic*, `code`, $x^2$ and a footnote[^1] [1].
+
+- item
+  1. nested
+
+> quoted
+
+| a | b |
+| --- | --- |
+| 1 | 2 |
+
+$$
+E = mc^2
+$$
+
+```
+code block
+```
+
+![figure](missing.png)
+
+[^1]: Note.
+"""
+
+
+@pytest.mark.parametrize("backend", ["python-docx", "streaming"])
+@pytest.mark.parametrize("inherit_styles", [False, True])
+def test_exports_never_modify_the_shared_styles(backend, inherit_styles):
+    # Clones share the cached template's styles element and its serialized
+    # form, so an export that changed the styles would leak into later ones.
+    clear_template_cache()
+    ast = format_markdown(FEATURES, bibliography_sources="[1] A. Author. Title. 2024.")["ast"]
+    options = ExportOptions(backend=backend, inherit_styles=inherit_styles)
+    for draft in (False, True):
+        _build_bytes_with(ast, FormatConfig(), ExportOptions(**{**vars(options), "draft": draft}))
+
+    (template,) = docx_template._TEMPLATES.values()
+    styles = [part for part in template.parts if isinstance(part, StylesPart)]
+    assert styles
+    for part in styles:
+        assert serialize_part_xml(part.element) == template.styles_blob[str(part.partname)]
+
+
+def _build_bytes_with(ast, config, options):
+    buffer = io.BytesIO()
+    build_docx(ast, buffer, config, options=options)
+    return buffer.getvalue()
@@ -0,0 +1,322 @@
+import base64
+import io
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from docx import Document
+
+from formatter.config import ExportOptions, FigureStyle, FormatConfig
+from formatter.deadlines import StageBudgets, StageWatchdog
+from formatter.docx_builder import build_docx
+from formatter.figures import (
+    FIGURE_HEADER_BYTES,
+    FigureHeader,
+    collect_figure_sources,
+    fetch_remote_figures,
+    prefetch_figures,
+)
+from formatter.image_cache import ImageCache, get_image_cache
+
+ONE_PIXEL_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMCAO6p8L8AAAAASUVORK5CYII="
+)
+
+LARGE_PNG = ONE_PIXEL_PNG + b"\0" * (4 * FIGURE_HEADER_BYTES)
+
+
+def _jpeg_with_large_icc_profile():
+    # Two full APP2 segments after the JFIF marker push the frame header (and the pixel size) past
+    # the first FIGURE_HEADER_BYTES.
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30)).save(buffer, "JPEG")
+    jpeg = buffer.getvalue()
+    app2 = b"\xff\xe2" + (65535).to_bytes(2, "big") + b"ICC_PROFILE\0" + b"\0" * (65533 - 12)
+    app0_end = 4 + int.from_bytes(jpeg[4:6], "big")
+    return jpeg[:app0_end] + 2 * app2 + jpeg[app0_end:]
+
+
+ICC_JPEG = _jpeg_with_large_icc_profile()
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        server.clients.add(self.client_address)
+        if self.path.startswith("/slow"):
+            time.sleep(server.slow_seconds)
+        if self.path.startswith("/moved"):
+            self.send_response(302)
+            self.send_header("Location", "/img/redirected.png")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.startswith("/missing"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.startswith("/large"):
+            body = LARGE_PNG
+        elif self.path.startswith("/icc"):
+            body = ICC_JPEG
+        elif self.path.startswith("/unknown"):
+            body = b"\0" * (4 * FIGURE_HEADER_BYTES)
+        else:
+            body = ONE_PIXEL_PNG
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client only wanted the header
+
+    def do_CONNECT(self):
+        self.server.requests.append(f"CONNECT {self.path} {self.headers.get('Proxy-Authorization')}")
+        self.send_response(502)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *_args):
+        pass
+
+
+@pytest.fixture
+def image_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.clients = set()
+    server.slow_seconds = 0.3
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_collect_figure_sources_walks_nested_blocks():
+    ast = [
+        {"type": "figure", "src": " http://a/1.png "},
+        {"type": "list", "items": [[{"type": "figure", "src": "http://a/2.png"}]]},
+        {"type": "blockquote", "children": [{"type": "figure", "src": "http://a/1.png"}]},
+        {"type": "figure", "src": ""},
+    ]
+
+    assert collect_figure_sources(ast) == ["http://a/1.png", "http://a/2.png"]
+
+
+def test_fetch_remote_figures_downloads_concurrently(image_server):
+    server, base = image_server
+    urls = [f"{base}/slow/{idx}.png" for idx in range(6)]
+
+    started = time.perf_counter()
+    fetched = fetch_remote_figures(urls)
+    elapsed = time.perf_counter() - started
+
+    assert fetched == {url: ONE_PIXEL_PNG for url in urls}
+    assert elapsed < 6 * server.slow_seconds / 2
+
+
+def test_fetch_remote_figures_reuses_connections_per_host(image_server):
+    server, base = image_server
+    urls = [f"{base}/img/{idx}.png" for idx in range(5)]
+
+    fetched = fetch_remote_figures(urls, max_workers=1)
+
+    assert all(data == ONE_PIXEL_PNG for data in fetched.values())
+    assert len(server.requests) == 5
+    assert len(server.clients) == 1
+
+
+def test_fetch_remote_figures_follows_redirects_and_rejects_errors(image_server):
+    _, base = image_server
+
+    fetched = fetch_remote_figures([f"{base}/moved/a.png", f"{base}/missing/b.png"])
+
+    assert fetched == {f"{base}/moved/a.png": ONE_PIXEL_PNG, f"{base}/missing/b.png": None}
+
+
+def test_fetch_remote_figures_goes_through_the_configured_proxy(image_server, monkeypatch):
+    server, base = image_server
+    proxy = base.replace("http://", "http://user:secret@")
+    monkeypatch.setenv("HTTP_PROXY", proxy)
+    monkeypatch.setenv("HTTPS_PROXY", proxy)
+    monkeypatch.setenv("NO_PROXY", "direct.invalid")
+
+    fetched = fetch_remote_figures(
+        ["http://figures.invalid/a.png", "https://figures.invalid/b.png", "http://direct.invalid/c.png"]
+    )
+
+    assert fetched == {
+        "http://figures.invalid/a.png": ONE_PIXEL_PNG,
+        "https://figures.invalid/b.png": None,
+        "http://direct.invalid/c.png": None,
+    }
+    assert sorted(server.requests) == [
+        "CONNECT figures.invalid:443 Basic dXNlcjpzZWNyZXQ=",
+        "http://figures.invalid/a.png",
+    ]
+
+
+def test_prefetch_stops_at_the_figures_budget(image_server):
+    server, base = image_server
+    server.slow_seconds = 1.5
+    ast = [
+        {"type": "figure", "src": f"{base}/img/fast.png"},
+        {"type": "figure", "src": f"{base}/slow/late.png"},
+    ]
+    watchdog = StageWatchdog(StageBudgets(figures=0.3))
+
+    started = time.perf_counter()
+    fetched = prefetch_figures(ast, watchdog=watchdog)
+
+    assert time.perf_counter() - started < 1.0
+    assert fetched == {f"{base}/img/fast.png": ONE_PIXEL_PNG, f"{base}/slow/late.png": None}
+    assert [event["stage"] for event in watchdog.events] == ["figures"]
+
+
+def test_build_docx_embeds_prefetched_figures_and_placeholders(tmp_path, image_server):
+    _, base = image_server
+    ast = [
+        {"type": "figure", "src": f"{base}/img/a.png", "alt": "first"},
+        {"type": "figure", "src": f"{base}/missing/b.png", "alt": "second"},
+    ]
+
+    output = tmp_path / "out.docx"
+    build_docx(ast, output, FormatConfig())
+
+    doc = Document(output)
+    assert len(doc.inline_shapes) == 1
+    assert [paragraph.text for paragraph in doc.paragraphs][1:] == ["图 1 first", f"[图片加载失败] {base}/missing/b.png"]
+
+
+def test_cached_figures_skip_the_network_until_stale(tmp_path, image_server):
+    server, base = image_server
+    urls = [f"{base}/img/{idx}.png" for idx in range(3)]
+    cache = ImageCache(tmp_path / "images", ttl_seconds=60)
+
+    assert all(data == ONE_PIXEL_PNG for data in fetch_remote_figures(urls, cache=cache).values())
+    assert len(server.requests) == 3
+
+    assert all(data == ONE_PIXEL_PNG for data in fetch_remote_figures(urls, cache=cache).values())
+    assert len(server.requests) == 3
+
+    cache.ttl_seconds = 0
+    assert all(data == ONE_PIXEL_PNG for data in fetch_remote_figures(urls, cache=cache).values())
+    assert len(server.requests) == 6
+    assert cache.stats() == {
+        "hits": 3,
+        "misses": 6,
+        "revalidations": 3,
+        "evictions": 0,
+        "entries": 1,
+        "bytes": len(ONE_PIXEL_PNG),
+    }
+
+
+def test_figures_fall_back_to_the_network_when_the_image_cache_fails(tmp_path, monkeypatch, image_server):
+    server, base = image_server
+    monkeypatch.setenv("IMAGE_CACHE_DIR", str(tmp_path / "images"))
+    get_image_cache().close()  # every cache call now raises sqlite3.ProgrammingError
+    ast = [
+        {"type": "figure", "src": f"{base}/img/a.png", "alt": "remote"},
+        {"type": "figure", "src": f"data:image/png;base64,{base64.b64encode(ONE_PIXEL_PNG).decode()}", "alt": "inline"},
+    ]
+
+    output = tmp_path / "out.docx"
+    build_docx(ast, output, FormatConfig(figure_style=FigureStyle(dpi=150)))
+
+    assert len(Document(output).inline_shapes) == 2
+    assert len(server.requests) == 1
+
+
+def _figure_parts(path):
+    with zipfile.ZipFile(path) as package:
+        media = [name for name in package.namelist() if name.startswith("word/media/")]
+        return media, package.read("word/_rels/document.xml.rels").decode(), package.read("word/document.xml").decode()
+
+
+def test_large_remote_figures_are_not_downloaded_in_full(image_server):
+    _, base = image_server
+
+    fetched = fetch_remote_figures([f"{base}/large/a.png", f"{base}/img/b.png"], link_min_bytes=1024)
+
+    assert fetched == {
+        f"{base}/large/a.png": FigureHeader(LARGE_PNG[:FIGURE_HEADER_BYTES], (1, 1)),
+        f"{base}/img/b.png": ONE_PIXEL_PNG,
+    }
+
+
+@pytest.mark.parametrize("backend", ["python-docx", "streaming"])
+def test_large_remote_figures_can_be_linked_instead_of_embedded(tmp_path, image_server, backend):
+    _, base = image_server
+    large = tmp_path / "large.png"
+    large.write_bytes(LARGE_PNG)
+    ast = [
+        {"type": "figure", "src": large.as_uri(), "alt": "local"},
+        {"type": "figure", "src": f"{base}/large/a.png", "alt": "large"},
+        {"type": "figure", "src": f"{base}/img/b.png", "alt": "small"},
+        {"type": "figure", "src": f"data:image/png;base64,{base64.b64encode(ONE_PIXEL_PNG).decode()}"},
+    ]
+
+    output = tmp_path / "threshold.docx"
+    build_docx(ast, output, FormatConfig(), options=ExportOptions(backend=backend, link_figures_min_bytes=1024))
+    media, rels, xml = _figure_parts(output)
+    assert len(media) == 2  # the local figure and the one-pixel PNG, shared by two figures
+    assert f'Target="{base}/large/a.png" TargetMode="External"' in rels
+    assert "file:" not in rels
+    assert xml.count("r:link=") == 1 and xml.count("r:embed=") == 3
+
+    output = tmp_path / "all.docx"
+    build_docx(ast, output, FormatConfig(), options=ExportOptions(backend=backend, link_figures_min_bytes=0))
+    media, rels, xml = _figure_parts(output)
+    assert len(media) == 2
+    assert f'Target="{base}/img/b.png" TargetMode="External"' in rels
+    assert xml.count("r:link=") == 2 and xml.count("r:embed=") == 2
+    doc = Document(output)
+    assert [paragraph.text for paragraph in doc.paragraphs if paragraph.text] == [
+        "图 1 local",
+        "图 2 large",
+        "图 3 small",
+        "图 4",
+    ]
+
+
+@pytest.mark.parametrize("backend", ["python-docx", "streaming"])
+def test_linked_figures_are_sized_without_a_second_download(tmp_path, image_server, backend):
+    server, base = image_server
+    ast = [
+        {"type": "figure", "src": f"{base}/icc/a.jpg", "alt": "icc"},
+        {"type": "figure", "src": f"{base}/unknown/b.png", "alt": "unknown"},
+    ]
+
+    fetched = fetch_remote_figures([item["src"] for item in ast], link_min_bytes=1024)
+    assert fetched[f"{base}/icc/a.jpg"].size == (40, 30)
+    assert fetched[f"{base}/unknown/b.png"].size is None
+    server.requests.clear()
+
+    output = tmp_path / "linked.docx"
+    build_docx(ast, output, FormatConfig(), options=ExportOptions(backend=backend, link_figures_min_bytes=1024))
+    _, rels, xml = _figure_parts(output)
+    assert sorted(server.requests) == ["/icc/a.jpg", "/unknown/b.png"]
+    assert xml.count("r:link=") == 2
+    assert f'Target="{base}/unknown/b.png" TargetMode="External"' in rels
+    [icc, unknown] = Document(output).inline_shapes
+    assert round(icc.height / icc.width, 2) == 0.75
+    assert round(unknown.height / unknown.width, 2) == 0.75
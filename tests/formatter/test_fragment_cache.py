@@ -0,0 +1,85 @@
+import re
+import zipfile
+
+import pytest
+
+from formatter.config import ExportOptions, FormatConfig
+from formatter.docx_builder import build_docx
+from formatter.fragment_cache import FragmentCache, block_key, clear_fragment_cache, get_fragment_cache
+
+ONE_PIXEL_PNG = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMCAO6p8L8AAAAASUVORK5CYII="
+
+
+def _document(ast, path, options=None):
+    build_docx(ast, path, FormatConfig(), options=options)
+    return zipfile.ZipFile(path).read("word/document.xml")
+
+
+def _report(typo: str = "typo"):
+    return [
+        {"type": "heading", "level": 1, "runs": [{"text": "Intro"}]},
+        {"type": "paragraph", "runs": [{"text": f"A {typo} here "}, {"type": "math", "latex": "x"}]},
+        {"type": "math_block", "latex": "a=b"},
+        {"type": "figure", "src": f"data:image/png;base64,{ONE_PIXEL_PNG}", "alt": "first"},
+        {"type": "table", "header": [{"text": "h"}], "rows": [[{"text": "v"}]]},
+        {"type": "blockquote", "children": [{"type": "math_block", "latex": "c=d"}]},
+        {"type": "figure", "src": f"data:image/png;base64,{ONE_PIXEL_PNG}", "alt": "second"},
+    ]
+
+
+@pytest.mark.parametrize("backend", ["python-docx", "streaming"])
+def test_reexport_renders_only_changed_blocks(tmp_path, monkeypatch, backend):
+    options = ExportOptions(backend=backend, resolve_equation_numbers=True)
+    clear_fragment_cache()
+    _document(_report(), tmp_path / "first.docx", options)
+    cache = get_fragment_cache()
+    assert (cache.hits, cache.misses) == (0, 5)
+
+    edited = _document(_report("fixed"), tmp_path / "edited.docx", options)
+    assert (cache.hits, cache.misses) == (4, 6)
+
+    monkeypatch.setenv("FORMATTER_FRAGMENT_CACHE_MB", "0")
+    assert get_fragment_cache() is None
+    assert edited == _document(_report("fixed"), tmp_path / "uncached.docx", options)
+    assert "图 2 second" in edited.decode("utf-8")
+
+
+def test_cached_blocks_keep_equation_numbers_in_sequence(tmp_path):
+    options = ExportOptions(resolve_equation_numbers=True)
+    ast = [{"type": "math_block", "latex": f"x_{idx}"} for idx in range(3)]
+    clear_fragment_cache()
+    _document(ast, tmp_path / "first.docx", options)
+
+    shifted = [{"type": "math_block", "latex": "y"}, *ast]
+    xml = _document(shifted, tmp_path / "shifted.docx", options).decode("utf-8")
+    assert re.findall(r'fldCharType="separate"/></w:r><w:r><w:t>(\d+)</w:t>', xml) == ["1", "2", "3", "4"]
+
+    again = _document(ast, tmp_path / "again.docx", options).decode("utf-8")
+    assert re.findall(r'fldCharType="separate"/></w:r><w:r><w:t>(\d+)</w:t>', again) == ["1", "2", "3"]
+
+
+def test_block_key_skips_figures_and_tracks_math_results():
+    figure_list = {
+        "type": "list",
+        "items": [[{"type": "figure", "src": "a.png"}]],
+    }
+    assert block_key(figure_list, (), {}) is None
+
+    node = {"type": "paragraph", "runs": [{"type": "math", "latex": "x"}]}
+    converted = block_key(node, (), {"x": "<m:oMath/>"})
+    assert converted != block_key(node, (), {"x": None})
+    assert converted == block_key(dict(reversed(node.items())), (), {"x": "<m:oMath/>"})
+    assert converted != block_key(node, ("other config",), {"x": "<m:oMath/>"})
+
+
+def test_fragment_cache_evicts_least_recently_used_blocks():
+    cache = FragmentCache(max_bytes=10)
+    cache.put("a", "aaaa", 0)
+    cache.put("b", "bbbb", 1)
+    assert cache.get("a") == ("aaaa", 0)
+    cache.put("c", "cccc", 0)
+    cache.put("huge", "x" * 11, 0)
+
+    assert cache.get("b") is None
+    assert cache.get("huge") is None
+    assert len(cache) == 2
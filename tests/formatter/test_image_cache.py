@@ -0,0 +1,77 @@
+import base64
+
+from docx import Document
+
+from formatter.config import FormatConfig
+from formatter.docx_builder import build_docx
+from formatter.image_cache import ImageCache, get_image_cache
+
+ONE_PIXEL_PNG = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMCAO6p8L8AAAAASUVORK5CYII="
+
+
+def test_image_cache_round_trips_and_survives_reopen(tmp_path):
+    cache = ImageCache(tmp_path)
+    assert cache.lookup("http://a/x.png") is None
+
+    cache.put("http://a/x.png", b"png-bytes", etag='"1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    cache.put("http://b/y.png", b"png-bytes")
+    cache.close()
+
+    reopened = ImageCache(tmp_path)
+    cached = reopened.lookup("http://a/x.png")
+    assert (cached.data, cached.etag, cached.fresh) == (b"png-bytes", '"1"', True)
+    assert reopened.stats()["entries"] == 1
+    assert len(list((tmp_path / "blobs").rglob("*"))) == 2  # one shard directory, one blob
+
+
+def test_image_cache_evicts_least_recently_used_bytes(tmp_path):
+    cache = ImageCache(tmp_path, max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.lookup("a").data == b"aaaa"
+
+    cache.put("c", b"cccc")
+
+    assert cache.lookup("b") is None
+    assert cache.lookup("a").data == b"aaaa"
+    assert cache.stats()["bytes"] == 8
+    assert cache.stats()["evictions"] == 1
+
+
+def test_image_cache_size_is_shared_between_instances(tmp_path):
+    first = ImageCache(tmp_path, max_bytes=10)
+    second = ImageCache(tmp_path, max_bytes=10)
+    first.put("a", b"aaaa")
+    second.put("b", b"bbbb")
+    assert first.stats()["bytes"] == second.stats()["bytes"] == 8
+
+    first.put("c", b"cccc")
+
+    assert second.lookup("a") is None
+    assert second.stats()["bytes"] == 8
+
+
+def test_image_cache_treats_missing_blobs_as_misses(tmp_path):
+    cache = ImageCache(tmp_path)
+    cache.put("a", b"aaaa")
+    for blob in (tmp_path / "blobs").rglob("*"):
+        if blob.is_file():
+            blob.unlink()
+
+    assert cache.lookup("a") is None
+
+
+def test_data_uri_figures_are_decoded_once(tmp_path, monkeypatch):
+    monkeypatch.setenv("IMAGE_CACHE_DIR", str(tmp_path / "images"))
+    ast = [{"type": "figure", "src": f"data:image/png;base64,{ONE_PIXEL_PNG}", "alt": "cap"}]
+    build_docx(ast, tmp_path / "first.docx", FormatConfig())
+
+    def _fail(_payload):
+        raise AssertionError("payload should come from the image cache")
+
+    monkeypatch.setattr(base64, "b64decode", _fail)
+    build_docx(ast, tmp_path / "second.docx", FormatConfig())
+
+    assert len(Document(tmp_path / "second.docx").inline_shapes) == 1
+    stats = get_image_cache().stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
@@ -0,0 +1,82 @@
+import io
+import zipfile
+
+import pytest
+
+from formatter.config import ExportOptions, FigureStyle, FormatConfig
+from formatter.docx_builder import build_docx
+from formatter.image_cache import get_image_cache
+from formatter.image_resample import fit_to_print_width, target_width_px
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _encoded(size, image_format, mode="RGB"):
+    image = Image.effect_noise(size, 64).convert(mode)
+    out = io.BytesIO()
+    image.save(out, image_format)
+    return out.getvalue()
+
+
+def _media(path):
+    with zipfile.ZipFile(path) as package:
+        names = [name for name in package.namelist() if name.startswith("word/media/")]
+        return [package.read(name) for name in names], package.read("word/document.xml")
+
+
+@pytest.mark.parametrize("backend", ["python-docx", "streaming"])
+def test_wide_figures_are_resampled_to_the_printed_width(tmp_path, backend):
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(_encoded((3000, 2000), "JPEG"))
+    ast = [{"type": "figure", "src": str(photo), "alt": "photo"}]
+    options = ExportOptions(backend=backend)
+
+    build_docx(ast, tmp_path / "original.docx", FormatConfig(), options=options)
+    config = FormatConfig(figure_style=FigureStyle(max_width_cm=14.0, dpi=150))
+    build_docx(ast, tmp_path / "resampled.docx", config, options=options)
+
+    (original,), original_xml = _media(tmp_path / "original.docx")
+    (resampled,), resampled_xml = _media(tmp_path / "resampled.docx")
+    assert original == photo.read_bytes()
+    with Image.open(io.BytesIO(resampled)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (target_width_px(14.0, 150), 551)
+    assert len(resampled) < len(original) / 4
+    assert resampled_xml.count(b'cx="5040000"') == original_xml.count(b'cx="5040000"') == 2
+
+
+def test_narrow_or_transparent_images_keep_their_format(tmp_path):
+    small = _encoded((200, 100), "PNG")
+    assert fit_to_print_width(io.BytesIO(small), 14.0, 150).getvalue() == small
+
+    transparent = _encoded((2000, 1000), "PNG", mode="RGBA")
+    with Image.open(fit_to_print_width(io.BytesIO(transparent), 14.0, 96)) as image:
+        assert (image.format, image.mode, image.width) == ("PNG", "RGBA", target_width_px(14.0, 96))
+
+
+@pytest.mark.parametrize("mode", ["P", "1"])
+def test_palette_and_bilevel_images_are_resampled_smoothly(mode):
+    # One-pixel stripes: nearest-neighbour sampling keeps black and white,
+    # LANCZOS blends them into grey.
+    stripes = Image.new("L", (3000, 300))
+    stripes.putdata([255 * (x % 2) for _ in range(300) for x in range(3000)])
+    out = io.BytesIO()
+    stripes.convert(mode).save(out, "PNG")
+
+    with Image.open(fit_to_print_width(io.BytesIO(out.getvalue()), 14.0, 96)) as image:
+        assert image.format == "PNG"
+        assert image.width == target_width_px(14.0, 96)
+        low, high = image.convert("L").getextrema()
+        assert 64 < low <= high < 192
+
+
+def test_resampled_images_are_cached_by_digest_and_size(tmp_path, monkeypatch):
+    monkeypatch.setenv("IMAGE_CACHE_DIR", str(tmp_path / "images"))
+    photo = _encoded((2400, 1600), "JPEG")
+
+    first = fit_to_print_width(io.BytesIO(photo), 14.0, 150).getvalue()
+    assert fit_to_print_width(io.BytesIO(photo), 14.0, 150).getvalue() == first
+    assert fit_to_print_width(io.BytesIO(photo), 14.0, 300).getvalue() != first
+
+    stats = get_image_cache().stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
@@ -1,3 +1,4 @@
+from formatter import latex as latex_module
 from formatter.latex import latex_to_omml
 
 
@@ -16,3 +17,44 @@ f(x) &= (x+1)^2 \\
     omml = latex_to_omml(latex)
     assert omml.strip().startswith("<m:oMath")
     assert "begin{aligned}" not in omml
+
+
+def _simple_math_corpus():
+    atoms = ["x", "N", "7", "42", "3.14", r"\alpha", r"\Omega", r"\varphi"]
+    scripts = ["i", "2", r"\beta", "{k}", "{12}", r"{\pi}", "{0.5}"]
+    corpus = list(atoms)
+    for base in atoms:
+        for script in scripts:
+            corpus.extend([f"{base}_{script}", f"{base}^{script}"])
+            corpus.append(f"{base}_{script}^{scripts[1]}")
+            corpus.append(f"{base}^{script}_{scripts[0]}")
+    corpus.extend([" x ", "x _ i", "n ^ {2}"])
+    return corpus
+
+
+def test_fast_path_matches_full_converter_for_simple_subset():
+    for latex in _simple_math_corpus():
+        fast = latex_module.fast_path_omml(latex)
+        assert fast is not None, latex
+        assert fast == latex_module._convert_latex_to_omml(latex), latex
+
+
+def test_fast_path_declines_expressions_outside_subset():
+    for latex in ["ab", "x^23", r"\Alpha", "x_{ij}", "1.", "x^{-1}", r"\sum", "x+y", r"\alphax"]:
+        assert latex_module.fast_path_omml(latex) is None, latex
+
+
+def test_latex_to_omml_falls_back_to_full_converter(monkeypatch):
+    calls = []
+    original = latex_module._convert_latex_to_omml
+
+    def _tracking(latex):
+        calls.append(latex)
+        return original(latex)
+
+    monkeypatch.setattr(latex_module, "_convert_latex_to_omml", _tracking)
+
+    latex_to_omml(r"\alpha_1")
+    latex_to_omml(r"\frac{a}{b}")
+
+    assert calls == [r"\frac{a}{b}"]
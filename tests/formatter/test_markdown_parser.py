@@ -1,4 +1,12 @@
-from formatter.markdown_parser import parse_markdown
+from formatter.markdown_parser import (
+    collect_definitions,
+    parse_footnote_blocks,
+    parse_markdown,
+    parse_markdown_blocks,
+    parse_markdown_section_blocks,
+    render_preview_html,
+    split_markdown_sections,
+)
 
 
 def run(text, **overrides):
@@ -211,3 +219,59 @@ def test_parse_markdown_image_generates_figure_node():
             "caption": "总体架构",
         }
     ]
+
+
+def test_split_markdown_sections_only_splits_at_top_level_headings():
+    text = (
+        "# Intro\n\nText\n"
+        "## Code\n```\n# comment\n```\n"
+        "## Math\n$$\nx\n# not a heading\n$$\n"
+        "- item\n  # list heading\n"
+    )
+
+    sections = split_markdown_sections(text)
+
+    assert sections == [
+        "# Intro\n\nText\n",
+        "## Code\n```\n# comment\n```\n",
+        "## Math\n$$\nx\n# not a heading\n$$\n- item\n  # list heading\n",
+    ]
+    blocks = [block for section in sections for block in parse_markdown_blocks(section)]
+    assert [node for nodes, _ in blocks for node in nodes] == parse_markdown(text)
+    assert "".join(html for _, html in blocks) == render_preview_html(text)
+
+
+def test_split_markdown_sections_parse_with_the_definitions_of_the_whole_document():
+    text = (
+        "# One\n\nSee [docs][d], <https://example.com/auto> and note[^1].\n\n"
+        "# Two\n\n[d]: https://example.com\n[^1]: Note.\n\nAgain[^1].\n\n"
+        "# Three\n\n[^2]: Other.\n\nLast[^2][^1].\n"
+    )
+
+    sections = split_markdown_sections(text)
+    definitions = collect_definitions(text)
+    blocks, references = [], []
+    for section in sections:
+        section_blocks, made = parse_markdown_section_blocks(section, definitions, references)
+        blocks.extend(section_blocks)
+        references.extend(made)
+    blocks.extend(parse_footnote_blocks(references, definitions))
+
+    assert len(sections) == 3
+    assert [node for nodes, _ in blocks for node in nodes] == parse_markdown(text)
+    assert "".join(html for _, html in blocks) == render_preview_html(text)
+
+
+def test_split_markdown_sections_keeps_documents_with_html_blocks_whole():
+    text = "# One\n\n<div>\n\n# Two\n\n</div>\n"
+
+    assert split_markdown_sections(text) == [text]
+
+
+def test_collect_definitions_skips_code_and_paragraph_text():
+    text = (
+        "# One\n\n[a]: http://a.com\n[^1]: Note\n\n    continued\n\nText\n"
+        "```\n[b]: http://code.com\n```\n\nparagraph\n[c]: http://lazy.com\n"
+    )
+
+    assert collect_definitions(text) == "[a]: http://a.com\n[^1]: Note\n\n    continued"
@@ -0,0 +1,87 @@
+import multiprocessing
+import time
+
+from docx import Document
+
+from formatter.config import FormatConfig
+from formatter.deadlines import StageBudgets, StageWatchdog
+from formatter.docx_builder import build_docx
+from formatter.latex import latex_to_omml
+from formatter.math_batch import collect_math_latex, convert_math_batch
+
+
+def test_collect_math_latex_walks_nested_nodes_once_per_unique_string():
+    ast = [
+        {"type": "paragraph", "runs": [{"type": "math", "latex": "x"}, {"text": "t"}]},
+        {"type": "math_block", "latex": "y"},
+        {
+            "type": "list",
+            "items": [[{"type": "paragraph", "runs": [{"type": "math", "latex": "x"}]}]],
+        },
+        {"type": "blockquote", "children": [{"type": "math_block", "latex": "z"}]},
+        {
+            "type": "table",
+            "header": [{"text": "", "runs": [{"type": "math", "latex": "h"}]}],
+            "rows": [[{"text": "", "runs": [{"type": "math", "latex": "c"}]}]],
+        },
+    ]
+
+    assert collect_math_latex(ast) == ["x", "y", "z", "h", "c"]
+
+
+def test_convert_math_batch_uses_process_pool_and_matches_serial_output():
+    items = [f"x_{idx} + y^{idx}" for idx in range(6)]
+
+    results = convert_math_batch(items, max_workers=2, min_parallel_items=1)
+
+    assert list(results) == items
+    for latex in items:
+        assert results[latex] == latex_to_omml(latex)
+
+
+def _stuck_chunk(chunk):
+    time.sleep(30)
+    return [None] * len(chunk)
+
+
+def test_convert_math_batch_terminates_workers_past_the_math_budget(monkeypatch):
+    monkeypatch.setattr("formatter.math_batch._convert_chunk", _stuck_chunk)
+    watchdog = StageWatchdog(StageBudgets(math=0.5))
+    items = [f"x_{idx} + y^{idx}" for idx in range(4)]
+
+    started = time.perf_counter()
+    results = convert_math_batch(items, max_workers=2, min_parallel_items=1, watchdog=watchdog)
+
+    assert time.perf_counter() - started < 10
+    assert results == dict.fromkeys(items)
+    assert multiprocessing.active_children() == []
+    assert [event["stage"] for event in watchdog.events] == ["math"]
+
+
+def test_convert_math_batch_marks_failures_without_aborting(monkeypatch):
+    def _convert(latex, use_cache=True):
+        if latex == "bad":
+            raise ValueError("boom")
+        return "<m:oMath/>"
+
+    monkeypatch.setattr("formatter.math_batch.latex_to_omml", _convert)
+
+    results = convert_math_batch(["ok", "bad"], max_workers=1)
+
+    assert results == {"ok": "<m:oMath/>", "bad": None}
+
+
+def test_build_docx_uses_precomputed_math_and_plain_text_fallback(tmp_path):
+    ast = [
+        {"type": "paragraph", "runs": [{"type": "math", "latex": "a"}]},
+        {"type": "math_block", "latex": r"\broken"},
+    ]
+    math_omml = {"a": latex_to_omml("a"), r"\broken": None}
+
+    output = tmp_path / "out.docx"
+    build_docx(ast, output, FormatConfig(), math_omml=math_omml)
+
+    doc = Document(output)
+    assert "oMath" in doc.paragraphs[0]._p.xml
+    assert r"\broken" in doc.paragraphs[1].text
+    assert "oMath" not in doc.paragraphs[1]._p.xml
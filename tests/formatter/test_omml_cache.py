@@ -0,0 +1,82 @@
+import pytest
+
+from formatter import latex
+from formatter.latex import latex_to_omml
+from formatter.omml_cache import OmmlCache, get_omml_cache
+
+
+def test_omml_cache_round_trips_and_survives_reopen(tmp_path):
+    path = tmp_path / "omml.db"
+    cache = OmmlCache(path)
+    assert cache.get("x^2") is None
+
+    cache.put("x^2", "<m:oMath/>")
+    cache.close()
+
+    reopened = OmmlCache(path)
+    assert reopened.get("x^2") == "<m:oMath/>"
+    assert len(reopened) == 1
+
+
+def test_omml_cache_evicts_least_recently_used(tmp_path):
+    cache = OmmlCache(tmp_path / "omml.db", max_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+
+    cache.put("c", "C")
+
+    assert len(cache) == 2
+    assert cache.get("a") == "A"
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+
+
+def test_omml_cache_entry_cap_is_shared_between_instances(tmp_path):
+    first = OmmlCache(tmp_path / "omml.db", max_entries=2)
+    second = OmmlCache(tmp_path / "omml.db", max_entries=2)
+    first.put("a", "A")
+    second.put("b", "B")
+    assert first.get("a") == "A"
+
+    second.put("c", "C")
+
+    assert len(first) == len(second) == 2
+    assert first.get("b") is None
+    assert second.get("a") == "A"
+
+
+def test_omml_cache_key_includes_converter_versions(tmp_path, monkeypatch):
+    path = tmp_path / "omml.db"
+    cache = OmmlCache(path)
+    cache.put("x", "old")
+    cache.close()
+
+    monkeypatch.setattr("formatter.omml_cache.converter_versions", lambda: "latex2mathml=99")
+    upgraded = OmmlCache(path)
+    assert upgraded.get("x") is None
+
+
+def test_latex_to_omml_skips_conversion_on_cache_hit_after_restart(tmp_path, monkeypatch):
+    path = tmp_path / "omml.db"
+    monkeypatch.setenv("OMML_CACHE_PATH", str(path))
+    expected = latex_to_omml("a^2 + b^2")
+
+    # Simulate a restarted process: a fresh cache instance on the same file.
+    monkeypatch.setenv("OMML_CACHE_MAX_ENTRIES", "1000")
+    assert get_omml_cache() is not None
+
+    def _fail(_latex):
+        raise AssertionError("converter should not run on a cache hit")
+
+    monkeypatch.setattr(latex, "_convert_latex_to_omml", _fail)
+    assert latex_to_omml("a^2 + b^2") == expected
+
+    with pytest.raises(AssertionError):
+        latex_to_omml(r"\frac{c}{2}")
+
+
+def test_latex_to_omml_without_cache_path_converts_directly(monkeypatch):
+    monkeypatch.delenv("OMML_CACHE_PATH", raising=False)
+    assert get_omml_cache() is None
+    assert latex_to_omml("x").strip().startswith("<m:oMath")
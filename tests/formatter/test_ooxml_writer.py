@@ -0,0 +1,166 @@
+import base64
+import zipfile
+
+import pytest
+from docx import Document
+from lxml import etree
+
+from formatter.config import BodyStyle, ExportOptions, FigureStyle, FormatConfig
+from formatter.docx_builder import build_docx
+from formatter.markdown_parser import parse_markdown
+from formatter.ooxml_writer import write_docx_streaming
+
+ONE_PIXEL_PNG = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMCAO6p8L8AAAAASUVORK5CYII="
+
+FULL_MARKDOWN = f"""# Title *x*
+
+Hello **bold** and *it* ~~s~~ ==hl== H~2~O x^2^ `code` [link](http://a) $a+b$ & <tag>
+
+> quote with $\\frac{{a}}{{b}}$ and *it*
+>
+> $$x=1$$
+
+- item one
+- [x] task done
+  - nested $y$
+1. first
+2. second
+
+$$E=mc^2$$
+
+```python
+a = 1
+  b = 2\tc
+```
+
+| A | B |
+|:-:|--:|
+| 1 **b** | $z$ |
+| 3 | |
+
+![cap](data:image/png;base64,{ONE_PIXEL_PNG})
+
+![second](data:image/png;base64,{ONE_PIXEL_PNG})
+
+![missing](/no/such/file.png)
+"""
+
+
+def _canonical(element):
+    text = element.text or ""
+    return (
+        element.tag,
+        sorted(element.attrib.items()),
+        text.strip() if len(element) else text,
+        [_canonical(child) for child in element],
+    )
+
+
+def _export_both(tmp_path, ast, config=None, options=None):
+    options = options or ExportOptions()
+    reference = tmp_path / "reference.docx"
+    streamed = tmp_path / "streamed.docx"
+    build_docx(ast, reference, config, options=options)
+    write_docx_streaming(ast, streamed, config, options=options)
+    return zipfile.ZipFile(reference), zipfile.ZipFile(streamed)
+
+
+def _assert_equivalent(reference, streamed):
+    assert sorted(reference.namelist()) == sorted(streamed.namelist())
+    for name in reference.namelist():
+        if name == "word/document.xml":
+            continue
+        assert reference.read(name) == streamed.read(name), name
+    expected = etree.fromstring(reference.read("word/document.xml"))
+    actual = etree.fromstring(streamed.read("word/document.xml"))
+    assert _canonical(actual) == _canonical(expected)
+
+
+@pytest.mark.parametrize(
+    ("config", "options"),
+    [
+        (None, None),
+        (None, ExportOptions(resolve_equation_numbers=True)),
+        (None, ExportOptions(inherit_styles=True)),
+        (None, ExportOptions(draft=True)),
+        (
+            FormatConfig(
+                body_style=BodyStyle(justify=False, indent_before_chars=1, first_line_indent_chars=0),
+                figure_style=FigureStyle(max_width_cm=6, align="left"),
+            ),
+            None,
+        ),
+    ],
+)
+def test_streaming_writer_matches_python_docx_builder(tmp_path, config, options):
+    reference, streamed = _export_both(tmp_path, parse_markdown(FULL_MARKDOWN), config, options)
+    _assert_equivalent(reference, streamed)
+
+
+def test_streaming_writer_matches_builder_for_fallback_and_nested_nodes(tmp_path):
+    ast = [
+        {"type": "heading", "level": 2, "text": "Fallback\theading"},
+        {"type": "paragraph", "text": "line one\nline two"},
+        {"type": "paragraph", "runs": [{"type": "math", "latex": r"\frac{"}]},
+        {
+            "type": "blockquote",
+            "children": [
+                {"type": "paragraph", "text": "quoted fallback"},
+                {"type": "code_block", "text": "x\n\ny"},
+                {"type": "list", "ordered": True, "level": 1, "items": [[{"type": "paragraph", "text": "q"}]]},
+                {"type": "figure", "src": "", "alt": ""},
+            ],
+        },
+        {
+            "type": "list",
+            "ordered": False,
+            "level": 1,
+            "items": [
+                [
+                    {"type": "paragraph", "text": "  task", "task": True, "checked": False, "runs": []},
+                    {"type": "math_block", "latex": "a=b"},
+                    {"type": "code_block", "text": "print()"},
+                    {
+                        "type": "table",
+                        "header": [{"text": "h"}],
+                        "rows": [[{"text": "  v"}]],
+                    },
+                ]
+            ],
+        },
+        {"type": "table", "header": [], "rows": []},
+    ]
+    reference, streamed = _export_both(tmp_path, ast)
+    _assert_equivalent(reference, streamed)
+
+
+def test_streaming_writer_output_opens_with_python_docx(tmp_path):
+    output = tmp_path / "out.docx"
+    write_docx_streaming(parse_markdown(FULL_MARKDOWN), output, FormatConfig())
+
+    doc = Document(output)
+    assert doc.paragraphs[0].text == "Title x"
+    assert len(doc.tables) == 1
+    assert len(doc.inline_shapes) == 2
+    assert doc.inline_shapes[0]._inline.docPr.id == 1
+    assert doc.inline_shapes[1]._inline.docPr.id == 2
+    media = [name for name in zipfile.ZipFile(output).namelist() if name.startswith("word/media/")]
+    assert media == ["word/media/image1.png"]
+    assert base64.b64decode(ONE_PIXEL_PNG) == zipfile.ZipFile(output).read(media[0])
+
+
+def test_build_docx_dispatches_to_streaming_backend(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        "formatter.ooxml_writer.write_docx_streaming",
+        lambda ast, output_path, config, **kwargs: calls.append(kwargs["options"].backend),
+    )
+
+    build_docx([{"type": "paragraph", "text": "x"}], tmp_path / "out.docx", options=ExportOptions(backend="streaming"))
+
+    assert calls == ["streaming"]
+
+
+def test_streaming_writer_rejects_control_characters(tmp_path):
+    with pytest.raises(ValueError):
+        write_docx_streaming([{"type": "paragraph", "text": "bad\x00"}], tmp_path / "out.docx")
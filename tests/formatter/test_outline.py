@@ -0,0 +1,64 @@
+from formatter.markdown_parser import parse_markdown
+from formatter.outline import build_outline
+from formatter.preview import summarize_ast
+
+DOCUMENT = """# Report
+
+Intro with **bold** and a [link](https://example.com).
+
+## Methods *and* data
+
+Text ![chart](chart.png) more text.
+
+- item
+- [ ] task
+  1. nested
+
+| a | b |
+| --- | --- |
+| 1 | 2 |
+
+Energy
+$$
+E = mc^2
+$$
+after
+
+> # Quoted
+> text
+
+### Setup
+
+Inline $$y$$ display.
+
+## Results
+
+```
+# not a heading
+```
+
+#### Details
+"""
+
+
+def test_outline_nests_headings_with_section_lines():
+    outline = build_outline(DOCUMENT)["outline"]
+
+    def shape(nodes):
+        return [
+            (node["level"], node["text"], node["line_start"], node["line_end"], shape(node["children"]))
+            for node in nodes
+        ]
+
+    assert shape(outline) == [
+        (1, "Report", 1, 4, []),
+        (1, "Methods and data", 5, 29, [(2, "Setup", 26, 29, [])]),
+        (1, "Results", 30, 36, [(3, "Details", 36, 36, [])]),
+    ]
+
+
+def test_outline_summary_matches_the_full_parse():
+    result = build_outline(DOCUMENT)
+
+    assert result["summary"] == summarize_ast(parse_markdown(DOCUMENT))
+    assert build_outline("") == {"outline": [], "summary": summarize_ast([])}
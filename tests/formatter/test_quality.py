@@ -1,4 +1,8 @@
-from formatter.preview import build_export_quality_report, lint_structure
+import pytest
+
+from formatter import preview
+from formatter.pipeline import format_markdown
+from formatter.preview import AnalysisRule, analyze_ast, build_export_quality_report, lint_structure, summarize_ast
 
 
 def test_lint_structure_detects_heading_issues_and_citation_gaps():
@@ -30,3 +34,55 @@ def test_build_export_quality_report_collects_rules_and_risks():
     assert "blockquote_rendering" in report["rules_applied"]
     assert report["risks"] == ["标题为空"]
     assert report["stats"]["refs"] == 1
+
+
+def test_analyze_ast_matches_the_separate_passes():
+    result = format_markdown(
+        "# 标题\n\n#### 跨级\n\n正文 [链接](http://a) 引用 [1] 和 [3]。\n\n"
+        "> 引文\n>\n> - [x] 任务\n\n$$x$$\n\n![图](a.png)\n",
+        bibliography_sources="[1] A\n[3] B",
+    )
+    ast, refs = result["ast"], result["refs"]
+
+    analysis = analyze_ast(ast, refs)
+    lint_warnings = lint_structure(ast, refs)
+
+    assert analysis.summary == summarize_ast(ast)
+    assert analysis.lint_warnings == lint_warnings
+    assert analysis.quality_report(refs) == build_export_quality_report(ast, refs, lint_warnings)
+    assert analysis.timings == {}
+
+
+def test_registered_rules_run_in_the_same_walk_and_are_timed(monkeypatch):
+    monkeypatch.setattr(preview, "ANALYSIS_RULES", list(preview.ANALYSIS_RULES))
+    visited = []
+
+    def _long_code(state, node):
+        visited.append(node["type"])
+        if len(node.get("text", "")) > 10:
+            state.scratch["long_code"] = True
+            return True
+        return False
+
+    def _finish(state):
+        if state.scratch.get("long_code"):
+            state.rules_applied.append("long_code_block")
+
+    preview.register_analysis_rule(
+        AnalysisRule("long_code", visit=_long_code, finish=_finish, node_types=frozenset({"code_block"}))
+    )
+    with pytest.raises(ValueError):
+        preview.register_analysis_rule(AnalysisRule("long_code"))
+
+    ast = [
+        {"type": "paragraph", "text": "正文"},
+        {"type": "code_block", "text": "x = 1"},
+        {"type": "list", "items": [[{"type": "code_block", "text": "print('hello world')"}]]},
+        {"type": "code_block", "text": "not visited any more"},
+    ]
+    analysis = analyze_ast(ast, [], timed=True)
+
+    assert visited == ["code_block", "code_block"]
+    assert analysis.rules_applied == ["structure_lint_before_export", "long_code_block"]
+    assert set(analysis.timings) == {rule.name for rule in preview.ANALYSIS_RULES}
+    assert all(seconds >= 0 for seconds in analysis.timings.values())
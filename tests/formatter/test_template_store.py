@@ -0,0 +1,110 @@
+import io
+
+import pytest
+from docx import Document
+from docx.shared import Cm
+
+from formatter import docx_builder
+from formatter.config import ExportOptions, FormatConfig
+from formatter.docx_builder import build_docx
+from formatter.docx_template import clear_template_cache
+from formatter.fragment_cache import clear_fragment_cache
+from formatter.template_store import TemplateStore
+
+
+def _reference_docx(margin_cm=2.0):
+    doc = Document()
+    section = doc.sections[0]
+    section.left_margin = Cm(margin_cm)
+    section.right_margin = Cm(margin_cm)
+    section.footer.paragraphs[0].text = "ACME Confidential"
+    doc.add_paragraph("Sample content")
+    # Word only writes the styles a document uses.
+    styles = doc.styles.element
+    for style in list(styles.style_lst):
+        if style.name_val in {"heading 2", "List Bullet"}:
+            styles.remove(style)
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("TEMPLATE_STORE_DIR", str(tmp_path / "templates"))
+    clear_template_cache()
+    return TemplateStore(tmp_path / "templates")
+
+
+@pytest.mark.parametrize("backend", ["python-docx", "streaming"])
+def test_exports_start_from_the_reference_document(store, backend):
+    template_id = store.add(_reference_docx())
+    ast = [
+        {"type": "heading", "level": 2, "text": "Scope"},
+        {"type": "list", "ordered": False, "items": [[{"type": "paragraph", "text": "item"}]]},
+    ]
+    output = io.BytesIO()
+    build_docx(ast, output, FormatConfig(), options=ExportOptions(backend=backend, template_id=template_id))
+
+    doc = Document(output)
+    assert [paragraph.text for paragraph in doc.paragraphs] == ["Scope", "item"]
+    assert doc.paragraphs[0].style.name == "Heading 2"
+    assert doc.paragraphs[1].style.name == "List Bullet"
+    assert round(doc.sections[0].left_margin.cm, 2) == 2.0
+    assert doc.sections[0].footer.paragraphs[0].text == "ACME Confidential"
+    assert doc.styles["Heading 2"].font.size.pt == FormatConfig().heading_styles[2].size_pt
+
+
+@pytest.mark.parametrize("backend", ["python-docx", "streaming"])
+def test_cached_blocks_follow_the_template_page_width(store, backend):
+    clear_fragment_cache()
+    ast = [{"type": "table", "header": [{"text": "A"}, {"text": "B"}], "rows": [[{"text": "1"}, {"text": "2"}]]}]
+
+    def grid(template_id):
+        output = io.BytesIO()
+        build_docx(ast, output, FormatConfig(), options=ExportOptions(backend=backend, template_id=template_id))
+        table = Document(output).tables[0]
+        return [col.w for col in table._tbl.tblGrid.gridCol_lst]
+
+    wide, narrow = store.add(_reference_docx(1.0)), store.add(_reference_docx(3.0))
+    default = grid(None)
+
+    assert grid(wide) != default
+    assert grid(narrow) != grid(wide)
+    assert grid(wide)[0] > grid(narrow)[0]
+
+
+def test_reference_documents_are_parsed_once_per_style(store, monkeypatch):
+    template_id = store.add(_reference_docx())
+    reads = []
+    read_template = docx_builder.read_template
+
+    def _tracking(template_id):
+        reads.append(template_id)
+        return read_template(template_id)
+
+    monkeypatch.setattr(docx_builder, "read_template", _tracking)
+    options = ExportOptions(template_id=template_id)
+    ast = [{"type": "paragraph", "text": "Hello"}]
+    for _ in range(3):
+        build_docx(ast, io.BytesIO(), FormatConfig(), options=options)
+    build_docx(ast, io.BytesIO(), FormatConfig())
+
+    assert reads == [template_id]
+
+
+def test_templates_are_stored_by_content(store):
+    data = _reference_docx()
+    template_id = store.add(data)
+
+    assert store.add(data) == template_id
+    assert store.read(template_id) == data
+    assert store.list() == [{"template_id": template_id, "size": len(data)}]
+    assert store.path("../" + template_id) is None
+    with pytest.raises(ValueError):
+        store.add(b"not a docx")
+
+    assert store.remove(template_id) is True
+    assert store.remove(template_id) is False
+    with pytest.raises(ValueError, match="unknown template"):
+        build_docx([], io.BytesIO(), FormatConfig(), options=ExportOptions(template_id=template_id))
@@ -0,0 +1,86 @@
+import base64
+import io
+import zipfile
+
+import pytest
+
+import formatter.variants as variants
+from formatter.config import BodyStyle, ExportOptions, FigureStyle, FormatConfig
+from formatter.deadlines import StageBudgets, StageWatchdog
+from formatter.docx_builder import build_docx
+from formatter.markdown_parser import parse_markdown
+from formatter.variants import build_docx_variants, resolve_figures, write_variants_zip
+
+ONE_PIXEL_PNG = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMCAO6p8L8AAAAASUVORK5CYII="
+MARKDOWN = (
+    "# Title\n\nBody with $x^2$.\n\n$$\nE = mc^2\n$$\n\n"
+    f"![pixel](data:image/png;base64,{ONE_PIXEL_PNG})\n\n![missing](missing.png)\n"
+)
+PRESETS = [
+    ("default", FormatConfig()),
+    (
+        "compact",
+        FormatConfig(body_style=BodyStyle(size_pt=10, justify=False), figure_style=FigureStyle(max_width_cm=8)),
+    ),
+]
+
+
+def _document_xml(source):
+    return zipfile.ZipFile(source).read("word/document.xml")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_variants_match_single_exports(tmp_path, monkeypatch, workers):
+    ast = parse_markdown(MARKDOWN)
+    conversions = []
+    convert = variants.convert_math_batch
+
+    def counting_convert(latex_items, **kwargs):
+        conversions.append(latex_items)
+        return convert(latex_items, **kwargs)
+
+    monkeypatch.setattr(variants, "convert_math_batch", counting_convert)
+
+    build_docx_variants(
+        ast, [(config, tmp_path / f"{name}.docx") for name, config in PRESETS], max_workers=workers
+    )
+
+    assert len(conversions) == 1
+    for name, config in PRESETS:
+        single = io.BytesIO()
+        build_docx(ast, single, config)
+        assert _document_xml(tmp_path / f"{name}.docx") == _document_xml(single)
+
+
+def test_variant_workers_apply_stage_budgets(tmp_path):
+    figure = tmp_path / "local.png"
+    figure.write_bytes(base64.b64decode(ONE_PIXEL_PNG))
+    ast = parse_markdown(f"# Title\n\n![local]({figure})\n")
+    watchdog = StageWatchdog(StageBudgets(figures=0))
+
+    build_docx_variants(
+        ast, [(config, tmp_path / f"{name}.docx") for name, config in PRESETS], watchdog=watchdog, max_workers=2
+    )
+
+    for name, _ in PRESETS:
+        assert "[图片加载失败]".encode() in _document_xml(tmp_path / f"{name}.docx")
+    assert [event["stage"] for event in watchdog.events] == ["figures", "figures"]
+
+
+def test_resolve_figures_decodes_data_uris_once():
+    figures = resolve_figures(parse_markdown(MARKDOWN))
+
+    assert list(figures.values())[0].startswith(b"\x89PNG")
+    assert "missing.png" not in figures
+
+
+def test_write_variants_zip_names_entries_after_presets(tmp_path):
+    output = io.BytesIO()
+    options = ExportOptions(deterministic=True)
+    write_variants_zip(parse_markdown(MARKDOWN), PRESETS, output, options=options, max_workers=1)
+
+    archive = zipfile.ZipFile(output)
+    assert archive.namelist() == ["default.docx", "compact.docx"]
+    assert {info.compress_type for info in archive.infolist()} == {zipfile.ZIP_STORED}
+    assert {info.date_time for info in archive.infolist()} == {(1980, 1, 1, 0, 0, 0)}
+    assert b"Title" in _document_xml(io.BytesIO(archive.read("compact.docx")))
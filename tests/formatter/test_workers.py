@@ -0,0 +1,12 @@
+import multiprocessing
+import os
+
+import pytest
+
+from formatter.workers import process_pool
+
+
+@pytest.mark.skipif("forkserver" not in multiprocessing.get_all_start_methods(), reason="no fork server")
+def test_process_pool_workers_are_not_forked_from_the_caller():
+    with process_pool(1) as pool:
+        assert pool.submit(os.getppid).result() != os.getpid()